@@ -0,0 +1,77 @@
+from fastapi import HTTPException
+import asyncio
+
+
+class SingleFlight:
+    """Collapses identical concurrent calls into one.
+
+    While a call for a key is in flight, later callers with the same key wait for its
+    result instead of running their own. Nothing is cached: the next call after it
+    finishes runs again.
+    """
+
+    def __init__(self):
+        self._calls: dict = {}
+        self.stats = {"calls": 0, "shared": 0}
+
+    async def do(self, key, fn):
+        """Run the coroutine function fn for key, or join the call already running."""
+        future = self._calls.get(key)
+        if future is None:
+            future = asyncio.ensure_future(fn())
+            self._calls[key] = future
+            future.add_done_callback(lambda _: self._calls.pop(key, None) if self._calls.get(key) is future else None)
+            self.stats["calls"] += 1
+        else:
+            self.stats["shared"] += 1
+        # A caller that disconnects must not cancel the call the others are waiting on
+        return await asyncio.shield(future)
+
+
+class AdmissionController:
+    """Caps concurrent database work and sheds load instead of queueing without end.
+
+    At most `limit` requests hold a permit. Up to `max_queue` more wait for one, each
+    for at most `queue_timeout` seconds. Anything beyond that gets an immediate 503
+    with Retry-After, so latency stays bounded for the requests that are admitted.
+    """
+
+    def __init__(self, limit: int, max_queue: int, queue_timeout: float, retry_after: int = 1):
+        self.limit = limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self._semaphore = asyncio.Semaphore(limit)
+        # Requests holding or waiting for a permit
+        self._in_system = 0
+        self.stats = {"admitted": 0, "rejected": 0, "timed_out": 0}
+
+    def _shed(self, reason: str):
+        return HTTPException(status_code=503, detail=f"Server busy ({reason}), retry shortly", headers={"Retry-After": str(self.retry_after)})
+
+    async def acquire(self) -> None:
+        """Take a permit, waiting in the queue if need be. Raises a 503 HTTPException when shed."""
+        if self._in_system >= self.limit + self.max_queue:
+            self.stats["rejected"] += 1
+            raise self._shed("queue full")
+        self._in_system += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+        except BaseException as e:
+            self._in_system -= 1
+            if isinstance(e, asyncio.TimeoutError):
+                self.stats["timed_out"] += 1
+                raise self._shed("queue timeout")
+            raise
+        self.stats["admitted"] += 1
+
+    def release(self) -> None:
+        self._in_system -= 1
+        self._semaphore.release()
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *exc):
+        self.release()
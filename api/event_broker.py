@@ -0,0 +1,160 @@
+from collections import defaultdict
+import asyncio
+import json
+import select
+import threading
+import time
+
+from pg_module import USER_EVENTS_CHANNEL, listen_connection
+
+# Sent instead of the events a connection missed (its buffer overflowed, or the
+# listener reconnected); the client then refetches /dashboard/{userId}
+RESYNC = {"type": "Resync"}
+
+
+class EventBroker:
+    """Fans per-user events from Postgres NOTIFY out to connected clients.
+
+    One listener thread per API process holds a LISTEN connection and hands each
+    notification to the event loop, which puts it on the queue of every connection
+    of that user. Queues are bounded: a client too slow to keep up loses its backlog
+    and gets a single Resync event instead, so one stuck connection cannot grow
+    memory without limit.
+    """
+
+    def __init__(self, engine, queue_size: int = 100):
+        self.engine = engine
+        self.queue_size = queue_size
+        self.stats = {"connections": 0, "delivered": 0, "dropped": 0}
+        self._subscribers: dict[str, set[asyncio.Queue]] = defaultdict(set)
+        self._loop = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self, loop: asyncio.AbstractEventLoop) -> None:
+        self._loop = loop
+        self._thread = threading.Thread(target=self._listen, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=10)
+
+    def subscribe(self, userid: str) -> asyncio.Queue:
+        queue = asyncio.Queue(self.queue_size)
+        self._subscribers[userid.lower()].add(queue)
+        self.stats["connections"] += 1
+        return queue
+
+    def unsubscribe(self, userid: str, queue: asyncio.Queue) -> None:
+        queues = self._subscribers.get(userid.lower())
+        if queues is None or queue not in queues:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self._subscribers[userid.lower()]
+        self.stats["connections"] -= 1
+
+    def publish(self, event: dict) -> None:
+        """Deliver an event to every connection of its user. Event loop thread only."""
+        for queue in self._subscribers.get(event.get("userid", ""), ()):
+            self._offer(queue, event)
+
+    def broadcast(self, event: dict) -> None:
+        for queues in self._subscribers.values():
+            for queue in queues:
+                self._offer(queue, event)
+
+    def _offer(self, queue: asyncio.Queue, event: dict) -> None:
+        if queue.full():
+            dropped = queue.qsize()
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(RESYNC)
+            self.stats["dropped"] += dropped
+            return
+        queue.put_nowait(event)
+        self.stats["delivered"] += 1
+
+    def _listen(self) -> None:
+        backoff = 1
+        reconnected = False
+        while not self._stop.is_set():
+            try:
+                # Its own connection, so the listener never holds one of the pool's slots
+                raw = listen_connection(self.engine, USER_EVENTS_CHANNEL)
+                try:
+                    connection = raw.driver_connection
+                    if reconnected:
+                        # Anything sent while we were away is lost
+                        self._loop.call_soon_threadsafe(self.broadcast, RESYNC)
+                    reconnected = True
+                    backoff = 1
+
+                    while not self._stop.is_set():
+                        if select.select([connection], [], [], 5) == ([], [], []):
+                            continue
+                        connection.poll()
+                        while connection.notifies:
+                            notify = connection.notifies.pop(0)
+                            try:
+                                event = json.loads(notify.payload)
+                            except ValueError:
+                                continue
+                            self._loop.call_soon_threadsafe(self.publish, event)
+                finally:
+                    raw.invalidate()
+            except Exception as e:
+                print(f"Event listener error, reconnecting in {backoff}s: {e}")
+                self._stop.wait(backoff)
+                backoff = min(backoff * 2, 60)
+
+
+async def benchmark(connections: int, events: int) -> None:
+    """Connections held and events fanned out by one broker, without Postgres or HTTP."""
+    import resource
+
+    broker = EventBroker(engine=None)
+    users = [f"0x{i:040x}" for i in range(connections)]
+    received = 0
+
+    async def client(userid):
+        nonlocal received
+        queue = broker.subscribe(userid)
+        try:
+            while True:
+                await queue.get()
+                received += 1
+        finally:
+            broker.unsubscribe(userid, queue)
+
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    tasks = [asyncio.create_task(client(userid)) for userid in users]
+    await asyncio.sleep(0)
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f"{connections} connections held, ~{(rss_after - rss_before) * 1024 / connections:,.0f} bytes each (peak RSS growth)")
+
+    started = time.perf_counter()
+    for i in range(events):
+        broker.publish({"type": "Donated", "userid": users[i % connections], "amount": "1"})
+        if i % 1000 == 0:
+            await asyncio.sleep(0)
+    while received < events:
+        await asyncio.sleep(0)
+    elapsed = time.perf_counter() - started
+    print(f"{events} events delivered in {elapsed:.3f}s ({events / elapsed:,.0f} events/s)")
+
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark the in-process event fan-out")
+    parser.add_argument("--connections", type=int, default=10000)
+    parser.add_argument("--events", type=int, default=100000)
+    args = parser.parse_args()
+    asyncio.run(benchmark(args.connections, args.events))
@@ -1,10 +1,20 @@
-from api.pg_module import put_user_preferences, Charity, CharityCategory, UserCategory, get_db, UserPreferences, put_user_preferences, create_user_preferences, get_charities_for_category, get_users_for_category, get_user_preferences, Counter, get_names_of_charities, CharityAddress
+from pg_module import put_user_preferences, UserPreferences, create_user_preferences, get_charities_for_category, get_users_for_category, get_user_preferences, Counter, get_names_of_charities, get_charity, ReadSessionLocal, get_users_for_category_page, stream_users_for_category, get_charities_for_category_page, stream_charities_for_category, get_user_portfolio, session_scope, SessionLocal, get_counter, get_categories_for_user, get_charity_names_by_address, migrate_charity_address, create_user_category_index, create_indexer_tables
+from api.event_broker import EventBroker
+from api.concurrency import SingleFlight, AdmissionController
+from pg_module.database import pool_options
 
-from fastapi import FastAPI, Depends
+from fastapi import FastAPI, Depends, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 
+from contextlib import asynccontextmanager
 from typing import Optional
+import asyncio
+import hashlib
+import json
+import os
 
 from pydantic import BaseModel
 
@@ -19,7 +29,65 @@ class PydanticCharityAddress(BaseModel):
     name: str
     address: str
 
-app = FastAPI()
+# Pushes each user's chain events and matcher decisions to their open /events streams
+broker = EventBroker(SessionLocal.kw["bind"])
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    migrate_charity_address(SessionLocal)
+    create_user_category_index(SessionLocal)
+    # /portfolio and /dashboard read the indexer's tables, which may not exist yet
+    create_indexer_tables(SessionLocal)
+    broker.start(asyncio.get_running_loop())
+    yield
+    broker.stop()
+
+app = FastAPI(lifespan=lifespan)
+
+# Database work admitted at once across the API. Every admitted request holds at most
+# one pooled connection, so the limit is the pool's size plus overflow, less the slots
+# API_DB_RESERVED_SLOTS keeps for connections taken outside admission control. The
+# event broker's LISTEN connection is opened outside the pool (listen_connection) and
+# needs none. Past the queue limit or timeout, requests get a 503 with Retry-After
+# instead of piling up behind a saturated database.
+def admission_limit() -> int:
+    pool = pool_options()
+    return max(1, pool["pool_size"] + pool["max_overflow"] - int(os.getenv("API_DB_RESERVED_SLOTS", "0")))
+
+admission = AdmissionController(
+    limit=admission_limit(),
+    max_queue=int(os.getenv("API_DB_MAX_QUEUE", "100")),
+    queue_timeout=float(os.getenv("API_DB_QUEUE_TIMEOUT", "2")),
+)
+
+# Largest page the listing endpoints return; walk further with after=
+MAX_PAGE_SIZE = 1000
+
+# Identical reads that arrive while one is running share its result
+singleflight = SingleFlight()
+
+# The handlers that take these are plain def, so FastAPI runs their blocking queries
+# on the threadpool; closing a session can block too, so it goes there as well
+async def admitted_db():
+    async with admission:
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            await run_in_threadpool(db.close)
+
+async def admitted_read_db():
+    async with admission:
+        db = ReadSessionLocal()
+        try:
+            yield db
+        finally:
+            await run_in_threadpool(db.close)
+
+async def admitted(fn, *args):
+    # For work that opens its own sessions on the threadpool
+    async with admission:
+        return await run_in_threadpool(fn, *args)
 
 app.add_middleware(
     CORSMiddleware,
@@ -30,33 +98,89 @@ app.add_middleware(
 )
 
 
+class AdmittedStreamingResponse(StreamingResponse):
+    # Gives back the admission permit taken for it once the body has been sent, or the
+    # client has gone away
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            admission.release()
+
+
+async def ndjson_response(stream, serialize) -> StreamingResponse:
+    # The request-scoped session is closed before a streaming body is sent, so the
+    # generator opens its own session and keeps it for the lifetime of the stream.
+    # That is a pooled connection for as long as the client reads, so the stream is
+    # admitted before it starts (a busy server still answers 503) and holds its
+    # permit to the end.
+    def lines():
+        db = ReadSessionLocal()
+        try:
+            for row in stream(db):
+                yield json.dumps(serialize(row)) + "\n"
+        finally:
+            db.close()
+
+    await admission.acquire()
+    return AdmittedStreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+def fetch_charities(category: str, after: Optional[str], limit: Optional[int]):
+    # Plain dicts, since one result may be shared by several requests
+    with session_scope(ReadSessionLocal) as db:
+        if limit is not None:
+            charities = get_charities_for_category_page(db, category, after, limit)
+        else:
+            charities = get_charities_for_category(db, category)
+        return [{"name": charity.name, "mission": charity.mission, "url": charity.url} for charity in charities]
+
 @app.get("/charities/{category}")
-async def get_chars(category: str, db: Session = Depends(get_db)):
-    return get_charities_for_category(db, category)
+async def get_chars(category: str, after: Optional[str] = None, limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE)):
+    return await singleflight.do(
+        ("charities", category, after, limit),
+        lambda: admitted(fetch_charities, category, after, limit),
+    )
+
+@app.get("/charities/{category}/stream")
+async def stream_chars(category: str):
+    return await ndjson_response(
+        lambda db: stream_charities_for_category(db, category),
+        lambda charity: {"name": charity.name, "mission": charity.mission, "url": charity.url},
+    )
 
 @app.get("/users/{category}")
-async def get_user(category: str, db: Session = Depends(get_db)):
+def get_user(category: str, after: Optional[str] = None, limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE), db: Session = Depends(admitted_read_db)):
+    if limit is not None:
+        return get_users_for_category_page(db, category, after, limit)
     return get_users_for_category(db, category)
 
+@app.get("/users/{category}/stream")
+async def stream_users(category: str):
+    return await ndjson_response(
+        lambda db: stream_users_for_category(db, category),
+        lambda user: {"category": user.category, "userid": user.userid},
+    )
+
 @app.get("/charity/{id}")
-async def get_charity(id: str, db: Session = Depends(get_db)):
+def getCharity(id: str, db: Session = Depends(admitted_db)):
     return get_charity(db, id)
 
 @app.put("/userpreferences")
-async def update_user_preferences(userId: str, preferences: UserPrefModel, db: Session = Depends(get_db)):
+def update_user_preferences(userId: str, preferences: UserPrefModel, db: Session = Depends(admitted_db)):
     return put_user_preferences(db, userId, UserPreferences(**preferences.model_dump()))
 
 @app.get("/userpreferences/{userId}")
-async def get_prefs(userId: str, db: Session = Depends(get_db)):
+def get_prefs(userId: str, db: Session = Depends(admitted_db)):
     return get_user_preferences(db, userId)
 
 
 @app.post("/userpreferences")
-async def create_prefs(userId: str, preferences: UserPrefModel, db: Session = Depends(get_db)):
+def create_prefs(userId: str, preferences: UserPrefModel, db: Session = Depends(admitted_db)):
     return create_user_preferences(db, userId, UserPreferences(**preferences.model_dump()))
 
 @app.post("/counter")
-async def setCounter(userId: str, count: int, db: Session = Depends(get_db)):
+def setCounter(userId: str, count: int, db: Session = Depends(admitted_db)):
     matches = db.query(Counter).filter(Counter.userid == userId)
     if matches.count() > 0:
         match = matches.first()
@@ -69,7 +193,7 @@ async def setCounter(userId: str, count: int, db: Session = Depends(get_db)):
         return {"count": count}
 
 @app.get("/counter/{userId}")
-async def getCounter(userId: str, db: Session = Depends(get_db)):
+def getCounter(userId: str, db: Session = Depends(admitted_db)):
     match = db.query(Counter).filter(Counter.userid == userId).first()
     if match:
         return {"count": match.countvalue}
@@ -77,7 +201,98 @@ async def getCounter(userId: str, db: Session = Depends(get_db)):
     return {"count": 0}
 
 @app.get("/charityaddress")
-async def getCharityNames(addresses: list[str], db: Session = Depends(get_db)):
+def getCharityNames(addresses: list[str], db: Session = Depends(admitted_read_db)):
     res = get_names_of_charities(db, addresses)
 
-    return [PydanticCharityAddress(name=charity.name, address=charity.address) for charity in res]
\ No newline at end of file
+    return [PydanticCharityAddress(name=charity.name, address=charity.address) for charity in res]
+
+@app.get("/portfolio/{userId}")
+def getPortfolio(userId: str, db: Session = Depends(admitted_read_db)):
+    portfolio = get_user_portfolio(db, userId)
+    if portfolio is None:
+        return {"topics": [], "charities": [], "percentages": [], "balance": "0"}
+
+    # Balance is in wei and does not fit in a JSON number
+    return {
+        "topics": portfolio.topics,
+        "charities": portfolio.charities,
+        "percentages": portfolio.percentages,
+        "balance": str(portfolio.balance),
+    }
+
+def dashboard_data(userId: str):
+    # Every query on one session, so the screen costs a single pooled connection. The
+    # primary rather than the replica, so a user sees their own preference changes.
+    with session_scope(SessionLocal) as db:
+        prefs = get_user_preferences(db, userId)
+        counter = get_counter(db, userId)
+        categories = get_categories_for_user(db, userId)
+        portfolio = get_user_portfolio(db, userId)
+        names = get_charity_names_by_address(db, portfolio.charities) if portfolio else {}
+
+        return {
+            "userId": userId,
+            "preferences": None if prefs is None else {
+                "missionStatement": prefs.mission_statement,
+                "pushNotifs": prefs.push_notifications,
+                "prioritizeCurrentEvents": prefs.prioritize_current_events,
+            },
+            "count": counter.countvalue if counter else 0,
+            "categories": categories,
+            "portfolio": {"topics": [], "charities": [], "balance": "0"} if portfolio is None else {
+                "topics": portfolio.topics,
+                "charities": [
+                    {"address": address, "name": names.get(address.lower()), "percentage": percentage}
+                    for address, percentage in zip(portfolio.charities, portfolio.percentages)
+                ],
+                "balance": str(portfolio.balance),
+            },
+        }
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    # If-None-Match is "*" or a comma-separated list of entity tags. It is compared
+    # weakly (RFC 9110 13.1.2), so a W/ prefix is ignored, but otherwise a tag must
+    # match exactly: a substring check would accept any header that contains ours.
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or tag.removeprefix("W/") == etag:
+            return True
+    return False
+
+@app.get("/dashboard/{userId}")
+async def getDashboard(userId: str, request: Request):
+    # Everything one app screen needs in a single round trip
+    data = await admitted(dashboard_data, userId)
+    body = json.dumps(data, separators=(",", ":"))
+
+    # The app revalidates with If-None-Match and gets an empty 304 when nothing changed
+    etag = '"' + hashlib.sha256(body.encode()).hexdigest()[:32] + '"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request.headers.get("if-none-match", ""), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
+
+@app.get("/events/{userId}")
+async def streamEvents(userId: str):
+    # Server-sent events: CharitiesUpdated, Donated, SplitAmongCharities and
+    # PortfolioDecision for this user, so the app does not have to poll
+    queue = broker.subscribe(userId)
+
+    async def events():
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    # Keeps proxies from closing an idle connection
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            broker.unsubscribe(userId, queue)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
\ No newline at end of file
@@ -1,3 +0,0 @@
-from .crud import get_charities_for_category, get_users_for_category, create_user_preferences, get_charity, put_user_preferences, get_user_preferences, CharityAddress, get_names_of_charities
-from .models import CharityCategory, UserCategory, Charity, UserPreferences, Counter
-from .database import get_db, SessionLocal
\ No newline at end of file
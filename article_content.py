@@ -0,0 +1,131 @@
+from html.parser import HTMLParser
+from requests.adapters import HTTPAdapter
+from typing import Optional
+from urllib.parse import urlparse
+import gzip
+import hashlib
+import os
+import requests
+
+
+class ParagraphExtractor(HTMLParser):
+    """Incrementally collects the text of <p> elements, skipping scripts and styles."""
+
+    SKIPPED_TAGS = {"script", "style", "noscript"}
+
+    def __init__(self, max_chars):
+        super().__init__(convert_charrefs=True)
+        self.max_chars = max_chars
+        self.paragraphs = []
+        self.length = 0
+        self._current = None
+        self._skip_depth = 0
+
+    @property
+    def full(self):
+        return self.length >= self.max_chars
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIPPED_TAGS:
+            self._skip_depth += 1
+        elif tag == "p":
+            self._current = []
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIPPED_TAGS:
+            self._skip_depth = max(0, self._skip_depth - 1)
+        elif tag == "p" and self._current is not None:
+            paragraph = " ".join("".join(self._current).split())
+            if paragraph:
+                self.paragraphs.append(paragraph)
+                self.length += len(paragraph) + 1
+            self._current = None
+
+    def handle_data(self, data):
+        if self._current is not None and not self._skip_depth:
+            self._current.append(data)
+
+    def text(self):
+        return "\n".join(self.paragraphs)[: self.max_chars]
+
+
+class ArticleContentStore:
+    """Article body text, fetched once per URL and kept gzipped on disk under a hash of the URL.
+
+    Pages are read as a stream and parsed chunk by chunk, so neither an oversized page
+    (max_bytes) nor a long article (max_chars) is ever fully held in memory. Requests
+    reuse one pooled session per domain.
+    """
+
+    def __init__(self, directory="article_content", max_bytes=2_000_000, max_chars=20_000, timeout=10):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_chars = max_chars
+        self.timeout = timeout
+        self._sessions: dict[str, requests.Session] = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.directory, hashlib.sha256(key.encode()).hexdigest() + ".txt.gz")
+
+    def get(self, key) -> Optional[str]:
+        try:
+            with gzip.open(self.path(key), "rt", encoding="utf-8") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, key, text):
+        # Write then rename, so a crash never leaves a truncated entry behind
+        path = self.path(key)
+        with gzip.open(path + ".tmp", "wt", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(path + ".tmp", path)
+
+    def fetch(self, url) -> str:
+        """Return the body text of an article, downloading it only on the first call."""
+        cached = self.get(url)
+        if cached is not None:
+            return cached
+
+        try:
+            text = self._download(url)
+        except Exception as e:
+            # Not cached, so a transient failure is retried next time the article comes up
+            print(f"Error fetching article content from {url}: {e}")
+            return ""
+
+        self.put(url, text)
+        return text
+
+    def _session(self, url):
+        domain = urlparse(url).netloc
+        if domain not in self._sessions:
+            session = requests.Session()
+            session.headers["User-Agent"] = "Mozilla/5.0 (compatible; GivingTreeBot/1.0)"
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=4)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            self._sessions[domain] = session
+        return self._sessions[domain]
+
+    def _download(self, url):
+        extractor = ParagraphExtractor(self.max_chars)
+        with self._session(url).get(url, stream=True, timeout=self.timeout) as response:
+            if response.status_code == 429 or response.status_code >= 500:
+                response.raise_for_status()
+            if response.status_code != 200:
+                return ""
+            if "html" not in response.headers.get("Content-Type", "text/html"):
+                return ""
+
+            received = 0
+            response.encoding = response.encoding or "utf-8"
+            for chunk in response.iter_content(chunk_size=16384, decode_unicode=True):
+                extractor.feed(chunk)
+                received += len(chunk)
+                if received >= self.max_bytes or extractor.full:
+                    break
+
+        extractor.close()
+        return extractor.text()
@@ -0,0 +1,103 @@
+import heapq
+import itertools
+import re
+import time
+
+# Words that usually mean people need help now. Only used for a cheap first guess at
+# urgency so a feed backlog can be ordered before any LLM call; the GPT urgency score
+# replaces it once the article is analyzed.
+URGENT_WORDS = re.compile(
+    r"\b(earthquake|tsunami|hurricane|cyclone|typhoon|flood\w*|wildfire\w*|famine|drought|"
+    r"outbreak|epidemic|cholera|evacuat\w*|refugees?|displaced|emergency|kill\w*|dead|deaths?|"
+    r"casualties|war|bombing|attack\w*|humanitarian|starvation|shortage\w*)\b",
+    re.IGNORECASE,
+)
+
+# Urgency tiers and their default end-to-end latency targets in seconds
+URGENCY_TIERS = (("high", 8), ("medium", 5), ("low", 0))
+DEFAULT_SLOS = {"high": 600, "medium": 3600, "low": 6 * 3600}
+
+
+def estimate_urgency(title: str, description: str = "") -> float:
+    hits = len(URGENT_WORDS.findall(f"{title} {description}"))
+    return float(min(10, 3 + 2 * hits))
+
+
+def urgency_tier(urgency: float) -> str:
+    for tier, threshold in URGENCY_TIERS:
+        if urgency >= threshold:
+            return tier
+    return URGENCY_TIERS[-1][0]
+
+
+class ArticleScheduler:
+    """Priority queue of matcher tasks, most urgent first, with aging.
+
+    Every queued task gains aging_per_minute of priority for each minute it waits, so a
+    steady stream of urgent news cannot starve the rest forever. Because every task
+    ages at the same rate, the aged order never changes after a push and a plain heap
+    keyed on (urgency - aging * pushed_at) gives it exactly.
+    """
+
+    def __init__(self, aging_per_minute: float = 0.1):
+        self.aging_per_second = aging_per_minute / 60
+        self._heap = []
+        self._keys = set()
+        self._counter = itertools.count()
+
+    def __len__(self):
+        return len(self._heap)
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    def push(self, key, urgency: float, task) -> bool:
+        """Queue a task unless one with the same key is already queued."""
+        if key in self._keys:
+            return False
+        priority = urgency - self.aging_per_second * time.monotonic()
+        heapq.heappush(self._heap, (-priority, next(self._counter), key, task))
+        self._keys.add(key)
+        return True
+
+    def pop(self):
+        """The next task, or None when the queue is empty."""
+        if not self._heap:
+            return None
+        _, _, key, task = heapq.heappop(self._heap)
+        self._keys.discard(key)
+        return task
+
+
+class LatencyTracker:
+    """Latency from feed to portfolio decision per urgency tier, checked against a target per tier.
+
+    One sample per user decision, so the percentiles are over the decisions users waited for.
+    """
+
+    def __init__(self, slos: dict = None, window: int = 5000):
+        self.slos = {**DEFAULT_SLOS, **(slos or {})}
+        self.window = window
+        self._samples = {tier: [] for tier, _ in URGENCY_TIERS}
+
+    def record(self, urgency: float, seconds: float) -> None:
+        samples = self._samples[urgency_tier(urgency)]
+        samples.append(seconds)
+        # Only the most recent decisions count, so the report follows current load
+        del samples[: -self.window]
+
+    def report(self) -> str:
+        lines = ["Portfolio decision latency by urgency tier:"]
+        for tier, _ in URGENCY_TIERS:
+            samples = sorted(self._samples[tier])
+            if not samples:
+                lines.append(f"  {tier}: no decisions yet (target {self.slos[tier]:.0f}s)")
+                continue
+            p50 = samples[len(samples) // 2]
+            p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+            within = sum(1 for s in samples if s <= self.slos[tier]) / len(samples)
+            lines.append(
+                f"  {tier}: {len(samples)} decisions, p50 {p50:.0f}s, p95 {p95:.0f}s, "
+                f"{within:.0%} within {self.slos[tier]:.0f}s target"
+            )
+        return "\n".join(lines)
@@ -0,0 +1,76 @@
+"""Startup benchmark for a matcher worker.
+
+    python bench_startup.py --runs 10
+
+Each run is a fresh interpreter in an empty directory holding only a categories
+snapshot, with no network settings and a placeholder OpenAI key, so anything that
+reaches for the network at import or construction fails instead of being timed.
+Prints the median and worst time to import web3_utils.interact_with_contract, import
+news_charity_matcher and construct a NewsCharityMatcher, and which heavy client
+libraries were already loaded by then (there should be none).
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+REPO = os.path.dirname(os.path.abspath(__file__))
+
+# Libraries the matcher should only import once a client is first used
+HEAVY_MODULES = ["openai", "chromadb", "feedparser", "web3", "eth_account", "onnxruntime", "tokenizers"]
+
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import web3_utils.interact_with_contract
+web3_done = time.perf_counter()
+import news_charity_matcher
+import_done = time.perf_counter()
+from pg_module import SessionLocal
+news_charity_matcher.NewsCharityMatcher(SessionLocal)
+init_done = time.perf_counter()
+print(json.dumps({
+    "web3_utils import": web3_done - started,
+    "matcher import": import_done - started,
+    "matcher ready": init_done - started,
+    "heavy": [name for name in HEAVY if name in sys.modules],
+}))
+"""
+
+
+def run_once(directory: str) -> dict:
+    env = {
+        "PATH": os.environ.get("PATH", ""),
+        "PYTHONPATH": REPO,
+        "OPENAI_API_KEY": "placeholder",
+        "PG_PORT": "5432",
+    }
+    output = subprocess.run(
+        [sys.executable, "-c", f"HEAVY = {HEAVY_MODULES!r}\n{PROBE}"],
+        cwd=directory, env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure matcher import and construction time")
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        with open(os.path.join(directory, "categories_snapshot.json"), "w") as f:
+            json.dump({"ids": ["1", "2"], "documents": ["Natural disasters", "Public health"]}, f)
+        results = [run_once(directory) for _ in range(args.runs)]
+
+    for stage in ("web3_utils import", "matcher import", "matcher ready"):
+        times = [result[stage] * 1000 for result in results]
+        print(f"{stage:<18} median {statistics.median(times):7.1f}ms  worst {max(times):7.1f}ms")
+    heavy = sorted({name for result in results for name in result["heavy"]})
+    print(f"Heavy client libraries loaded at startup: {', '.join(heavy) or 'none'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""Load test for POST /donate against a local Hardhat node.
+
+    cd contracts && npx hardhat node
+    cd contracts && npx hardhat ignition deploy ignition/modules/Donater.ts --network localhost
+    cd contract_wrapper_api && INFURA_URL=http://127.0.0.1:8545 DONATER_ADDRESS=<deployed address> \\
+        uvicorn main:app --port 8000
+    python contract_wrapper_api/load_test.py --donations 1000 --concurrency 50 --senders 10
+
+Donations come from Hardhat's default funded accounts, so several requests share a
+sender and the per-sender nonce lock is exercised. Reports accepted donations/sec
+and request latency. Then it waits for every receipt and checks that each sender's
+contract balance grew by exactly what it donated: a reused or skipped nonce shows up
+as a failed or missing transaction.
+"""
+from eth_account import Account
+from web3 import AsyncWeb3
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+
+import httpx
+
+# Hardhat's default accounts all come from this mnemonic and start with 10000 ETH
+HARDHAT_MNEMONIC = "test test test test test test test test test test test junk"
+
+ABI_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "abi.json")
+
+
+def hardhat_accounts(count: int) -> list:
+    Account.enable_unaudited_hdwallet_features()
+    return [Account.from_mnemonic(HARDHAT_MNEMONIC, account_path=f"m/44'/60'/0'/0/{i}") for i in range(count)]
+
+
+async def donate(client: httpx.AsyncClient, api: str, account, amount: int) -> tuple[float, dict]:
+    started = time.perf_counter()
+    response = await client.post(f"{api}/donate", json={"private_key": account.key.hex(), "amount": amount})
+    return time.perf_counter() - started, response.json()
+
+
+async def run(args) -> None:
+    accounts = hardhat_accounts(args.senders)
+    w3 = AsyncWeb3(AsyncWeb3.AsyncHTTPProvider(args.rpc))
+    contract = w3.eth.contract(address=args.contract, abi=json.load(open(ABI_PATH))) if args.contract else None
+    balances_before = {a.address: await contract.functions.getBalance(a.address).call() for a in accounts} if contract else {}
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+
+    async def one(i, client):
+        async with semaphore:
+            return accounts[i % len(accounts)], *await donate(client, args.api, accounts[i % len(accounts)], args.amount)
+
+    async with httpx.AsyncClient(limits=limits, timeout=60) as client:
+        started = time.perf_counter()
+        results = await asyncio.gather(*(one(i, client) for i in range(args.donations)))
+        elapsed = time.perf_counter() - started
+
+    accepted = [(account, body["tx_hash"]) for account, _, body in results if body.get("status") == "success"]
+    errors = [body.get("message") for _, _, body in results if body.get("status") != "success"]
+    latencies = sorted(latency * 1000 for _, latency, _ in results)
+    print(f"{len(accepted)}/{args.donations} donations accepted in {elapsed:.2f}s: {len(accepted) / elapsed:,.1f} donations/s")
+    print(
+        f"latency p50 {statistics.median(latencies):.1f}ms  p95 {latencies[int(len(latencies) * 0.95) - 1]:.1f}ms"
+        f"  max {latencies[-1]:.1f}ms  ({args.concurrency} concurrent, {args.senders} senders)"
+    )
+    for message in sorted(set(errors))[:5]:
+        print(f"  error x{errors.count(message)}: {message}")
+
+    async def receipt(tx_hash):
+        async with semaphore:
+            return await w3.eth.wait_for_transaction_receipt(tx_hash, timeout=120)
+
+    receipts = await asyncio.gather(*(receipt(tx_hash) for _, tx_hash in accepted))
+    mined = sum(receipt["status"] == 1 for receipt in receipts)
+    print(f"{mined}/{len(accepted)} transactions mined successfully, {(time.perf_counter() - started):.2f}s after the first request")
+
+    if contract:
+        donated = {a.address: 0 for a in accounts}
+        for (account, _), receipt in zip(accepted, receipts):
+            if receipt["status"] == 1:
+                donated[account.address] += args.amount
+        mismatched = [
+            address for address in donated
+            if await contract.functions.getBalance(address).call() - balances_before[address] != donated[address]
+        ]
+        print(f"Contract balances: {'all match' if not mismatched else f'{len(mismatched)} senders do not match'}")
+
+    await w3.provider.disconnect()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure donations/sec through POST /donate on a local node")
+    parser.add_argument("--api", default="http://127.0.0.1:8000")
+    parser.add_argument("--rpc", default="http://127.0.0.1:8545")
+    parser.add_argument("--contract", default=os.getenv("DONATER_ADDRESS"), help="Donater address, to check balances afterwards")
+    parser.add_argument("--donations", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--senders", type=int, default=10)
+    parser.add_argument("--amount", type=int, default=10**15, help="Wei per donation")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,10 @@
-from web3 import Web3
+from web3 import AsyncWeb3
 
 from eth_account import Account
+from contextlib import asynccontextmanager
+import asyncio
 import dotenv
-import requests
-from web3.middleware import SignAndSendRawMiddlewareBuilder
 from dataclasses import dataclass
-import json
 import fastapi
 import os
 
@@ -18,40 +17,88 @@ class User:
     percentages: list[int]
     balance: int
 
-abi_text = open("abi.json", "r").read()
+with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "abi.json"), "r") as f:
+    abi_text = f.read()
 
-CONTRACT_ADDRESS = "0x01786AA502BEeF1862691399C5A526E4Ce16F43d"
+# Overridable so the API can point at a local deployment (see load_test.py)
+CONTRACT_ADDRESS = os.getenv("DONATER_ADDRESS", "0x01786AA502BEeF1862691399C5A526E4Ce16F43d")
 
-app = fastapi.FastAPI()
+# One provider (with its keep-alive HTTP session) and one contract object for the
+# lifetime of the process, created in lifespan()
+w3: AsyncWeb3 = None
+contract = None
+chain_id = None
+
+class SenderLocks:
+    """One lock per sender address, kept only while a request for that sender is in flight.
+
+    Transactions from the same sender must not race for a nonce. Senders are whoever
+    calls /donate, so locks are dropped once nobody holds or waits for them, and the
+    map never grows past the number of requests in flight.
+    """
+
+    def __init__(self):
+        self._locks: dict[str, tuple[asyncio.Lock, int]] = {}
+
+    @asynccontextmanager
+    async def hold(self, sender: str):
+        lock, users = self._locks.get(sender, (asyncio.Lock(), 0))
+        self._locks[sender] = (lock, users + 1)
+        try:
+            async with lock:
+                yield
+        finally:
+            lock, users = self._locks[sender]
+            if users == 1:
+                del self._locks[sender]
+            else:
+                self._locks[sender] = (lock, users - 1)
+
+    def __len__(self):
+        return len(self._locks)
+
+nonce_locks = SenderLocks()
+
+@asynccontextmanager
+async def lifespan(app: fastapi.FastAPI):
+    global w3, contract, chain_id
+    w3 = AsyncWeb3(AsyncWeb3.AsyncHTTPProvider(os.getenv('INFURA_URL')))
+    contract = w3.eth.contract(address=CONTRACT_ADDRESS, abi=abi_text)
+    chain_id = await w3.eth.chain_id
+    yield
+    await w3.provider.disconnect()
+
+app = fastapi.FastAPI(lifespan=lifespan)
 
 @app.post("/donate")
 async def donate(request: fastapi.Request):
     try:
         # Parse JSON body
         data = await request.json()
-        
+
         private_key = data.get("private_key")
         amount = data.get("amount")
-        
+
         if not private_key or not amount:
             return {"status": "error", "message": "Missing private_key or amount"}
-        
-        
-        # Connect to Web3
-        w3 = Web3(Web3.HTTPProvider(os.getenv('INFURA_URL')))
-        
-        # Load the smart contract
-        contract = w3.eth.contract(address=CONTRACT_ADDRESS, abi=abi_text)
-        
+
         # Get the account from the private key
         account = Account.from_key(private_key)
-        
-        # Inject middleware for signing and sending transactions
-        w3.middleware_onion.inject(SignAndSendRawMiddlewareBuilder.build(account), layer=0)
-        
-        # Execute the donate function from the smart contract
-        contract.functions.donate().transact({'from': account.address, 'value': amount})
- 
-        return {"status": "success"}
+
+        async with nonce_locks.hold(account.address):
+            nonce = await w3.eth.get_transaction_count(account.address, "pending")
+
+            # Build the donate call and sign it locally, so the shared provider is never
+            # given per-request signing middleware
+            tx = await contract.functions.donate().build_transaction({
+                'from': account.address,
+                'value': amount,
+                'nonce': nonce,
+                'chainId': chain_id,
+            })
+            signed = account.sign_transaction(tx)
+            tx_hash = await w3.eth.send_raw_transaction(signed.raw_transaction)
+
+        return {"status": "success", "tx_hash": tx_hash.to_0x_hex()}
     except Exception as e:
-        return {"status": "error", "message": str(e)}
\ No newline at end of file
+        return {"status": "error", "message": str(e)}
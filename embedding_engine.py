@@ -0,0 +1,314 @@
+"""Local CPU sentence embeddings for the matcher's Chroma collections.
+
+A quantized ONNX sentence-transformer (e.g. all-MiniLM-L6-v2 exported with
+`optimum-cli export onnx` and quantized) is run with onnxruntime. Calls from any
+number of threads are merged into micro-batches, and every embedding is cached on
+disk by a hash of its text, so unchanged texts are never embedded twice.
+
+    python embedding_engine.py reembed --suffix _local   # copy both collections, embedded locally
+    python embedding_engine.py bench                     # texts/sec, single vs batched
+
+The model directory (EMBEDDING_MODEL_DIR) needs model_quantized.onnx or model.onnx
+and tokenizer.json. onnxruntime, tokenizers and numpy are only needed when this
+module is actually used.
+"""
+from concurrent.futures import Future
+import argparse
+import hashlib
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+
+class OnnxEmbedder:
+    """Mean-pooled, L2-normalized sentence embeddings from an ONNX model."""
+
+    def __init__(self, model_dir, max_length=256, threads=None):
+        try:
+            import numpy as np
+            import onnxruntime as ort
+            from tokenizers import Tokenizer
+        except ImportError as e:
+            raise ImportError("Local embeddings need onnxruntime, tokenizers and numpy installed") from e
+        self.np = np
+
+        model_path = os.path.join(model_dir, "model_quantized.onnx")
+        if not os.path.exists(model_path):
+            model_path = os.path.join(model_dir, "model.onnx")
+        self.name = f"{os.path.basename(os.path.normpath(model_dir))}/{os.path.basename(model_path)}"
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = threads or os.cpu_count()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length)
+        self.tokenizer.enable_padding()
+
+    def encode(self, texts):
+        np = self.np
+        encodings = self.tokenizer.encode_batch(list(texts))
+        ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        inputs = {"input_ids": ids, "attention_mask": mask}
+        if "token_type_ids" in self.input_names:
+            inputs["token_type_ids"] = np.zeros_like(ids)
+
+        hidden = self.session.run(None, inputs)[0]
+        weights = mask[:, :, None].astype(np.float32)
+        pooled = (hidden * weights).sum(axis=1) / np.clip(weights.sum(axis=1), 1e-9, None)
+        pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+        return pooled.astype(np.float32)
+
+
+class EmbeddingCache:
+    """Embeddings on disk in SQLite, keyed by model and a SHA-256 of the text."""
+
+    def __init__(self, path="embedding_cache.sqlite"):
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (model TEXT, hash TEXT, vector BLOB, PRIMARY KEY (model, hash))"
+        )
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(text):
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    def get_many(self, model, hashes):
+        found = {}
+        with self._lock:
+            # SQLite limits the number of bound parameters per statement
+            for start in range(0, len(hashes), 500):
+                chunk = hashes[start:start + 500]
+                rows = self._db.execute(
+                    f"SELECT hash, vector FROM embeddings WHERE model = ? AND hash IN ({','.join('?' * len(chunk))})",
+                    [model, *chunk],
+                )
+                found.update(rows)
+        return found
+
+    def put_many(self, model, items):
+        with self._lock, self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, hash, vector) VALUES (?, ?, ?)",
+                [(model, h, vector) for h, vector in items],
+            )
+
+
+class EmbeddingEngine:
+    """Embeds texts for concurrent callers, merging their requests into micro-batches.
+
+    A request waits at most max_wait seconds for others to join its batch, and a batch
+    holds at most max_batch texts. Cache hits skip the queue entirely.
+    """
+
+    def __init__(self, embedder, cache=None, max_batch=64, max_wait=0.005):
+        self.embedder = embedder
+        self.cache = cache
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.stats = {"texts": 0, "cache_hits": 0, "batches": 0, "batched_texts": 0}
+        self._stats_lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._batch_loop, daemon=True)
+        self._thread.start()
+
+    def embed(self, texts):
+        """Embeddings for texts, as lists of floats in the same order."""
+        np = self.embedder.np
+        texts = list(texts)
+        hashes = [EmbeddingCache.key(text) for text in texts]
+        cached = self.cache.get_many(self.embedder.name, hashes) if self.cache else {}
+
+        futures = {}
+        for text, h in zip(texts, hashes):
+            if h not in cached and h not in futures:
+                futures[h] = Future()
+                self._queue.put((text, h, futures[h]))
+
+        vectors = {h: np.frombuffer(blob, dtype=np.float32) for h, blob in cached.items()}
+        for h, future in futures.items():
+            vectors[h] = future.result()
+
+        with self._stats_lock:
+            self.stats["texts"] += len(texts)
+            self.stats["cache_hits"] += len(texts) - len(futures)
+        return [vectors[h].tolist() for h in hashes]
+
+    def _batch_loop(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get(timeout=max(0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+
+            try:
+                vectors = self.embedder.encode([text for text, _, _ in batch])
+            except Exception as e:
+                for _, _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            if self.cache:
+                try:
+                    self.cache.put_many(self.embedder.name, [(h, vector.tobytes()) for (_, h, _), vector in zip(batch, vectors)])
+                except Exception as e:
+                    print(f"Error writing embedding cache: {e}")
+            with self._stats_lock:
+                self.stats["batches"] += 1
+                self.stats["batched_texts"] += len(batch)
+            for (_, _, future), vector in zip(batch, vectors):
+                future.set_result(vector)
+
+
+class ChromaEmbeddingFunction:
+    """Lets Chroma collections embed documents and queries with an EmbeddingEngine."""
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def __call__(self, input):
+        return self.engine.embed(input)
+
+    def name(self):
+        return "local-onnx"
+
+
+def engine_from_env():
+    """The engine configured by EMBEDDING_MODEL_DIR, or None to keep Chroma's own embeddings."""
+    model_dir = os.getenv("EMBEDDING_MODEL_DIR")
+    if not model_dir:
+        return None
+    embedder = OnnxEmbedder(model_dir, threads=int(os.getenv("EMBEDDING_THREADS", "0")) or None)
+    return EmbeddingEngine(embedder, EmbeddingCache(os.getenv("EMBEDDING_CACHE", "embedding_cache.sqlite")))
+
+
+def charity_missions(session_factory):
+    from pg_module import session_scope, Charity
+
+    with session_scope(session_factory) as db:
+        return {name: mission for name, mission in db.query(Charity.name, Charity.mission)}
+
+
+def reembed_collection(engine, source, target, update_document=None, page_size=256, force=False):
+    """Copy source into target with local embeddings, re-embedding only changed documents.
+
+    update_document(document) may return a new document text (e.g. with a changed
+    mission statement). Each record stores the hash of the text it was embedded from,
+    so a later run only re-embeds what changed.
+    """
+    offset = 0
+    embedded = 0
+    while True:
+        page = source.get(limit=page_size, offset=offset, include=["documents", "metadatas"])
+        if not page["ids"]:
+            break
+        offset += len(page["ids"])
+
+        existing = target.get(ids=page["ids"], include=["metadatas"])
+        embedded_hashes = {
+            record_id: (metadata or {}).get("embedding_hash") for record_id, metadata in zip(existing["ids"], existing["metadatas"])
+        }
+
+        ids, documents, metadatas = [], [], []
+        for record_id, document, metadata in zip(page["ids"], page["documents"], page["metadatas"]):
+            metadata = dict(metadata or {})
+            if update_document:
+                document = update_document(document)
+            text_hash = EmbeddingCache.key(document)
+            if not force and embedded_hashes.get(record_id) == text_hash:
+                continue
+            metadata["embedding_hash"] = text_hash
+            ids.append(record_id)
+            documents.append(document)
+            metadatas.append(metadata)
+
+        if ids:
+            target.upsert(ids=ids, documents=documents, metadatas=metadatas, embeddings=engine.embed(documents))
+            embedded += len(ids)
+        print(f"{source.name}: {offset} records read, {embedded} embedded")
+    return embedded
+
+
+def reembed_charities(engine, source, target, session_factory=None, **kwargs):
+    """Re-embed charities, taking mission statements from Postgres when session_factory is given."""
+    missions = charity_missions(session_factory) if session_factory else {}
+
+    def update_document(document):
+        doc = json.loads(document)
+        mission = missions.get(doc["name"])
+        if mission and mission != doc.get("mission_statement"):
+            doc["mission_statement"] = mission
+            return json.dumps(doc)
+        return document
+
+    return reembed_collection(engine, source, target, update_document, **kwargs)
+
+
+def benchmark(engine, texts, callers=16):
+    """Print texts/sec for one text per call, concurrent single calls, and whole batches."""
+    from concurrent.futures import ThreadPoolExecutor
+
+    def timed(label, fn):
+        started = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - started
+        print(f"{label}: {len(texts) / elapsed:,.0f} texts/s")
+
+    # The first run pays for session warm-up, which is not what is being measured
+    engine.embedder.encode(texts[:engine.max_batch])
+    timed("single calls, one caller", lambda: [engine.embedder.encode([text]) for text in texts])
+    with ThreadPoolExecutor(callers) as pool:
+        timed(f"single calls, {callers} callers (micro-batched)", lambda: list(pool.map(lambda t: engine.embed([t]), texts)))
+    timed("one batched call", lambda: [engine.embedder.encode(texts[i:i + engine.max_batch]) for i in range(0, len(texts), engine.max_batch)])
+    print(f"Average micro-batch: {engine.stats['batched_texts'] / max(1, engine.stats['batches']):.1f} texts")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local embeddings for the matcher's Chroma collections")
+    sub = parser.add_subparsers(dest="command", required=True)
+    reembed = sub.add_parser("reembed", help="Re-embed the charities and categories collections locally")
+    reembed.add_argument("--suffix", default="", help="Write to <name><suffix> instead of in place (needed when the model changes)")
+    reembed.add_argument("--force", action="store_true", help="Re-embed every record, changed or not")
+    bench = sub.add_parser("bench", help="Measure texts/sec, single vs batched")
+    bench.add_argument("--texts", type=int, default=512)
+    bench.add_argument("--callers", type=int, default=16, help="Concurrent callers for the micro-batched run")
+    args = parser.parse_args()
+
+    engine = engine_from_env()
+    if engine is None:
+        raise SystemExit("Set EMBEDDING_MODEL_DIR to the ONNX model directory")
+
+    if args.command == "bench":
+        # No cache, so every text is really embedded
+        engine.cache = None
+        sample = "Flooding displaced thousands of families, and relief groups are asking for donations to provide shelter"
+        benchmark(engine, [f"{sample} ({i})" for i in range(args.texts)], args.callers)
+        return
+
+    from news_charity_matcher import NewsCharityMatcher
+    from pg_module import SessionLocal
+
+    client = NewsCharityMatcher(SessionLocal).chroma_client
+    function = ChromaEmbeddingFunction(engine)
+    for name in ("categories", "charities"):
+        source = client.get_collection(name)
+        target = client.get_or_create_collection(name + args.suffix, embedding_function=function) if args.suffix else source
+        if name == "charities":
+            reembed_charities(engine, source, target, SessionLocal, force=args.force)
+        else:
+            reembed_collection(engine, source, target, force=args.force)
+
+
+if __name__ == "__main__":
+    main()
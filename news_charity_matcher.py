@@ -1,45 +1,232 @@
-import feedparser
 import requests
-from bs4 import BeautifulSoup
-import openai
 import time
 import json
+import itertools
+import threading
+import socket
 from datetime import datetime
-import chromadb
-from chromadb.utils import embedding_functions
+from functools import cached_property
 from dotenv import load_dotenv
+from article_content import ArticleContentStore
+from portfolio_coalescer import PortfolioCoalescer
+from payout_scheduler import PayoutScheduler
+from article_scheduler import ArticleScheduler, LatencyTracker, estimate_urgency
+from profiling import SamplingProfiler
+from embedding_engine import engine_from_env, ChromaEmbeddingFunction
 from pg_module import (
-    get_charities_for_category,
-    get_users_for_category,
-    get_names_of_charities,
-    get_addresses_of_charities,
-    CharityAddress
+    SubscriberIndex,
+    CharityDirectory,
+    session_scope,
+    get_user_portfolio,
+    get_indexer_state,
+    create_indexer_tables,
+    create_work_tables,
+    enqueue_articles,
+    claim_article,
+    claim_subscriber_batch,
+    complete_article,
+    complete_subscriber_batch,
+    release_subscriber_batch,
+    fail_exhausted_work,
+    purge_done_work,
+    LeaseHeartbeat,
+    ArticleWork,
+    SubscriberBatchWork,
+    create_checkpoint_tables,
+    get_article_checkpoint,
+    save_article_checkpoint,
+    get_portfolio_checkpoint,
+    save_portfolio_decision,
+    update_portfolio_checkpoint,
+    clear_portfolio_tx,
+    get_queued_portfolio_checkpoints,
+    get_payout_requests,
+    finish_queued_portfolio_checkpoints,
+    acquire_user_lease,
+    release_user_lease,
+    notify_user_event,
 )
+from typing import Iterable, Sequence
 import os
-from web3_utils.interact_with_contract import get_user, set_charities, contract, split_among_charities
-
-
-from pg_module.models import UserCategory
+from web3_utils.interact_with_contract import get_w3, get_user, set_charities, get_contract, split_among_charities, wait_for_receipt, User, TransactionFailed, TransactionDropped
+from web3_utils.event_indexer import INDEXER_NAME, CONFIRMATIONS as INDEXER_CONFIRMATIONS, is_fresh as is_index_fresh
 
 load_dotenv()
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
 
+# The portfolio agent's instructions and tool schemas are identical for every user and
+# article, and are sent first so the provider can reuse its cached prompt prefix.
+# Article context follows (shared by every subscriber of that article), and the
+# user's own portfolio comes last.
+PORTFOLIO_SYSTEM_PROMPT = """You are a portfolio manager for a charity impact fund. Your job is to manage a user's portfolio of charities to maximize social impact.
+
+You will be given a news article with a list of similar charities, followed by the user's current portfolio. Analyze the portfolio and make any necessary changes based on the article and the similar charities:
+- Call 'update_portfolio' to replace the portfolio with new charities and percentages. Use the exact charity names you were given, and make sure the percentages sum to 100.
+- Call 'send_money' to send the user's balance to the charities in the portfolio.
+- Call 'keep_portfolio' to finish. Always end the conversation by calling 'keep_portfolio'."""
+
+PORTFOLIO_TOOLS = [
+    {
+        "type": "function",
+        "function": {
+            "name": "keep_portfolio",
+            "description": "Keep the current portfolio without changes",
+        },
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "update_portfolio",
+            "description": "Update the portfolio with new charities and percentages",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "new_charities": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                    },
+                    "new_percents": {
+                        "type": "array",
+                        "items": {"type": "number"},
+                    },
+                },
+            },
+        },
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "send_money",
+            "description": "Send money to charities in the portfolio",
+        },
+    },
+]
+
+# Hard cap on model calls per portfolio decision
+MAX_PORTFOLIO_ITERATIONS = 6
+# Assistant turns (with their tool results) kept in the history after the fixed prompt
+PORTFOLIO_HISTORY_TURNS = 2
+# Times the single-process matcher retries the users that failed for an article before
+# leaving the article for the next feed poll
+MAX_PORTFOLIO_ATTEMPTS = 3
+# How long a worker may hold a user while it waits out a split
+PAYOUT_LEASE_SECONDS = 600
+
+
+def format_charities(similar_charities, max_mission_chars=300):
+    """One compact line per charity instead of indented JSON."""
+    return "\n".join(
+        f"- {charity['name']} (similarity {charity['similarity_score']:.2f}): {charity['mission'][:max_mission_chars]}"
+        for charity in similar_charities
+    )
+
+
+def compact_history(messages, prefix_length, keep_turns):
+    """Keep the fixed prompt prefix and only the last keep_turns assistant turns."""
+    turns = []
+    for message in messages[prefix_length:]:
+        role = message["role"] if isinstance(message, dict) else message.role
+        if role == "tool" and turns:
+            turns[-1].append(message)
+        else:
+            turns.append([message])
+    return messages[:prefix_length] + [message for turn in turns[-keep_turns:] for message in turn]
+
 
 class NewsCharityMatcher:
-    def __init__(self, postgres_db):
+    def __init__(self, session_factory, worker_id=None):
         # Load environment variables
         load_dotenv()
+        # Names this process in the leases it takes on shared work and on users
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
         self.api_key = os.getenv("OPENAI_API_KEY")
         if not self.api_key:
             raise ValueError("OPENAI_API_KEY not found in environment variables")
 
-        self.client = openai.OpenAI(api_key=self.api_key)
         self.processed_articles = set()
-        self.postgres_db = postgres_db
+        # Running totals of OpenAI token usage across every call this matcher makes
+        self.token_usage = {"calls": 0, "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0}
+        self._usage_lock = threading.Lock()
+        # (block number, monotonic time it was read), see chain_head()
+        self._chain_head = None
+
+        # Each database read runs in its own short session from this factory, so a
+        # dropped connection only fails one query instead of the whole process
+        self.session_factory = session_factory
+
+        # Category -> subscriber IDs, kept in memory and refreshed from Postgres notifications.
+        # Loaded on the first refresh() of the run loop.
+        self.subscriber_index = SubscriberIndex(session_factory)
+
+        # Charity name <-> address map, so portfolio decisions need no database round trips.
+        # Loaded on first lookup.
+        self.charity_directory = CharityDirectory(session_factory)
+
+        # Full article text, fetched once per article and shared by every prompt
+        self.content_store = ArticleContentStore()
+
+        # Portfolio changes wait in the checkpoint table so a burst of articles costs each
+        # user one setCharities, whichever worker decided them
+        self.coalescer = PortfolioCoalescer(
+            session_factory,
+            self.worker_id,
+            self.commit_portfolio,
+            self.finish_portfolio_changes,
+            window=float(os.getenv("PORTFOLIO_COALESCE_SECONDS", "600")),
+        )
+
+        # send_money requests wait here until the balance is worth the gas, the news is
+        # urgent, or they have waited long enough
+        self.payouts = PayoutScheduler(
+            self.pay_out,
+            self.payout_lookup,
+            min_balance_wei=int(os.getenv("PAYOUT_MIN_BALANCE_WEI", str(5 * 10**16))),
+            urgent_score=float(os.getenv("PAYOUT_URGENT_SCORE", "8")),
+            max_wait=float(os.getenv("PAYOUT_MAX_WAIT_SECONDS", "86400")),
+            on_dropped=self.finish_payout,
+            recheck_interval=float(os.getenv("PAYOUT_RECHECK_SECONDS", "300")),
+        )
+
+        # Articles and their portfolio stage are handled most urgent first, and how long
+        # each urgency tier takes from feed to portfolio decision is tracked
+        self.scheduler = ArticleScheduler(aging_per_minute=float(os.getenv("ARTICLE_AGING_PER_MINUTE", "0.1")))
+        self.latency = LatencyTracker(
+            {
+                "high": float(os.getenv("SLO_HIGH_SECONDS", "600")),
+                "medium": float(os.getenv("SLO_MEDIUM_SECONDS", "3600")),
+                "low": float(os.getenv("SLO_LOW_SECONDS", "21600")),
+            }
+        )
+
+        # Off until toggled (SIGUSR1 from run_matcher.py); dumps one profile per cycle
+        self.profiler = SamplingProfiler(directory=os.getenv("PROFILE_DIR", "profiles"))
+
+        # Network clients (OpenAI, ChromaDB) are created on first use. Categories start
+        # from the last snapshot on disk when there is one, so startup needs no network.
+        self.CATEGORIES = []
+        self.category_ids = {}
+        if not self.load_categories_snapshot():
+            self.refresh_categories()
+
+        # Load processed articles history
+        try:
+            with open("processed_articles.json", "r") as f:
+                self.processed_articles = set(json.load(f))
+        except FileNotFoundError:
+            self.processed_articles = set()
+
+    @cached_property
+    def client(self):
+        import openai
+
+        return openai.OpenAI(api_key=self.api_key)
+
+    @cached_property
+    def chroma_client(self):
+        import chromadb
 
-        # Initialize ChromaDB client
         try:
-            self.chroma_client = chromadb.HttpClient(
+            return chromadb.HttpClient(
                 ssl=True,
                 host="api.trychroma.com",
                 tenant="06afecae-2671-4d45-ae27-4d721cfbdbf5",
@@ -50,52 +237,141 @@ class NewsCharityMatcher:
             print(f"Error initializing ChromaDB client: {e}")
             raise RuntimeError(f"Failed to initialize ChromaDB client: {str(e)}")
 
-        # Get existing collections
-        self.categories_collection = self.chroma_client.get_collection("categories")
-        self.charities_collection = self.chroma_client.get_collection("charities")
-
-        # Load categories from ChromaDB
+    @cached_property
+    def embedding_function(self):
+        # With EMBEDDING_MODEL_DIR set, queries are embedded locally, and the collections
+        # must have been embedded with the same model (python embedding_engine.py reembed)
+        engine = engine_from_env()
+        return ChromaEmbeddingFunction(engine) if engine else None
+
+    def get_collection(self, name):
+        suffix = os.getenv("CHROMA_COLLECTION_SUFFIX", "")
+        if self.embedding_function is None:
+            return self.chroma_client.get_collection(name + suffix)
+        return self.chroma_client.get_collection(name + suffix, embedding_function=self.embedding_function)
+
+    @cached_property
+    def categories_collection(self):
+        return self.get_collection("categories")
+
+    @cached_property
+    def charities_collection(self):
+        return self.get_collection("charities")
+
+    def chat(self, **kwargs):
+        """Create a chat completion and record its token usage."""
+        response = self.client.chat.completions.create(**kwargs)
+        usage = response.usage
+        if usage is None:
+            return response
+        with self._usage_lock:
+            self.token_usage["calls"] += 1
+            self.token_usage["prompt_tokens"] += usage.prompt_tokens
+            self.token_usage["completion_tokens"] += usage.completion_tokens
+            details = getattr(usage, "prompt_tokens_details", None)
+            self.token_usage["cached_tokens"] += (getattr(details, "cached_tokens", 0) or 0) if details else 0
+        return response
+
+    def load_categories_snapshot(self):
+        try:
+            with open("categories_snapshot.json", "r") as f:
+                snapshot = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return False
+        self.set_categories(snapshot["ids"], snapshot["documents"])
+        return True
+
+    def refresh_categories(self):
+        """Reload categories from ChromaDB and persist them as the next warm-start snapshot."""
         categories_result = self.categories_collection.get()
-        self.CATEGORIES = [doc for doc in categories_result["documents"]]
-        self.category_ids = {
-            cat: id
-            for id, cat in zip(categories_result["ids"], categories_result["documents"])
-        }
-
-        # Load processed articles history
+        self.set_categories(categories_result["ids"], categories_result["documents"])
+        with open("categories_snapshot.json", "w") as f:
+            json.dump({"ids": categories_result["ids"], "documents": categories_result["documents"]}, f)
+
+    def set_categories(self, ids, documents):
+        self.CATEGORIES = [doc for doc in documents]
+        self.category_ids = {cat: id for id, cat in zip(ids, documents)}
+
+    def enrich_article(self, article):
+        """Attach the article's body text, fetched once and cached by URL."""
+        if "content" not in article:
+            article["content"] = self.content_store.fetch(article["link"])
+        return article
+
+    def article_text(self, article, max_content_chars=0):
+        """Title and description, followed by up to max_content_chars of the body."""
+        text = f"{article['title']} {article.get('description', '')}"
+        content = article.get("content", "")[:max_content_chars]
+        if content:
+            text += f"\n\n{content}"
+        return text
+
+    def chain_head(self, max_age=5):
+        """Latest block number, fetched at most once every max_age seconds."""
+        now = time.monotonic()
+        if self._chain_head is None or now - self._chain_head[1] > max_age:
+            self._chain_head = (get_w3().eth.block_number, now)
+        return self._chain_head[0]
+
+    def portfolio_index_is_fresh(self, max_lag_blocks=None):
+        """Check whether the event indexer is close enough to the chain head to trust its table."""
+        if max_lag_blocks is None:
+            # The indexer deliberately trails the head by its confirmation depth
+            max_lag_blocks = int(os.getenv("PORTFOLIO_MAX_LAG_BLOCKS", str(INDEXER_CONFIRMATIONS + 5)))
+        with session_scope(self.session_factory) as db:
+            state = get_indexer_state(db, INDEXER_NAME)
+            if state is None:
+                return False
+            db.expunge(state)
         try:
-            with open("processed_articles.json", "r") as f:
-                self.processed_articles = set(json.load(f))
-        except FileNotFoundError:
-            self.processed_articles = set()
+            head = self.chain_head()
+        except Exception as e:
+            print(f"Error reading the chain head, not trusting the portfolio index: {e}")
+            return False
+        return is_index_fresh(state, head, max_lag_blocks)
+
+    def get_portfolio(self, user_id, use_index=True):
+        """Read a user's on-chain state from the indexed table, falling back to an RPC call."""
+        if not use_index:
+            return get_user(get_contract(), user_id)
+        with session_scope(self.session_factory) as db:
+            portfolio = get_user_portfolio(db, user_id)
+            if portfolio is None:
+                return None
+            return User(
+                list(portfolio.topics),
+                list(portfolio.charities),
+                list(portfolio.percentages),
+                int(portfolio.balance) / 10**18,
+            )
 
     def get_rss_feeds(self, rss_urls):
+        import feedparser
+
         articles = []
         for url in rss_urls:
             try:
                 feed = feedparser.parse(url)
                 for entry in feed.entries:
                     if entry.link not in self.processed_articles:
+                        description = entry.get("description", "")
                         articles.append(
                             {
                                 "title": entry.title,
-                                "description": entry.get("description", ""),
+                                "description": description,
                                 "link": entry.link,
+                                # Cheap guess that orders the backlog before any LLM call
+                                "urgency_estimate": estimate_urgency(entry.title, description),
+                                "seen_at": time.time(),
                             }
                         )
             except Exception as e:
                 print(f"Error processing RSS feed {url}: {str(e)}")
         return articles
 
-    def find_similar_charities(self, article, n_results=5):
+    def find_similar_charities(self, article, top_category, n_results=5):
         """Find charities similar to the article using semantic search."""
         try:
-            # First, get the top category for the article
-            matching_categories, subscribers = self.find_matching_categories(article)
-            if not matching_categories:
-                return []
-
-            top_category = matching_categories[0]["category"]
             print(f"\nFiltering charities by top category: {top_category}")
 
             # Get category ID
@@ -106,7 +382,7 @@ class NewsCharityMatcher:
 
             print(f"Searching for charities with category ID: {category_id}")
             # Query charities collection with category filter
-            article_text = f"{article['title']} {article.get('description', '')}"
+            article_text = self.article_text(article, 1000)
 
             results = self.charities_collection.query(
                 query_texts=[article_text],
@@ -136,7 +412,7 @@ class NewsCharityMatcher:
         with open("processed_articles.json", "w") as f:
             json.dump(list(self.processed_articles), f)
 
-    def is_relevant_article(self, title: str, description: str):
+    def is_relevant_article(self, title: str, description: str, content: str = ""):
         """Use an AI agent to determine if an article is relevant to charity impact."""
 
         tools = [
@@ -192,7 +468,8 @@ class NewsCharityMatcher:
             },
             {
                 "role": "user",
-                "content": f"Analyze this article for charitable impact:\nTitle: {title}\nDescription: {description}",
+                "content": f"Analyze this article for charitable impact:\nTitle: {title}\nDescription: {description}"
+                + (f"\nContent:\n{content[:4000]}" if content else ""),
             },
         ]
 
@@ -210,6 +487,15 @@ class NewsCharityMatcher:
 
         def request_more_info(article_title, article_description):
             """Use Perplexity Sonar to get deeper context about an article."""
+            # The article body we already fetched answers most questions for free
+            if content:
+                return f"Full article text:\n{content[:8000]}"
+
+            research_key = f"research:{article_title}\n{article_description}"
+            cached = self.content_store.get(research_key)
+            if cached is not None:
+                return cached
+
             try:
                 headers = {
                     "Authorization": f"Bearer {os.getenv('PERPLEXITY_API_KEY')}",
@@ -242,8 +528,9 @@ class NewsCharityMatcher:
                 )
 
                 if response.status_code == 200:
-                    result = response.json()
-                    return result["choices"][0]["message"]["content"]
+                    result = response.json()["choices"][0]["message"]["content"]
+                    self.content_store.put(research_key, result)
+                    return result
                 else:
                     return (
                         f"Error getting additional information: {response.status_code}"
@@ -254,7 +541,7 @@ class NewsCharityMatcher:
 
         try:
             while not completed:
-                response = self.client.chat.completions.create(
+                response = self.chat(
                     model="gpt-4o-mini",
                     messages=messages,
                     tools=tools,
@@ -297,7 +584,7 @@ class NewsCharityMatcher:
         """Find top 3 matching categories for an article."""
         try:
             # Combine title and description for better matching
-            article_text = f"{article['title']} {article.get('description', '')}"
+            article_text = self.article_text(article, 1000)
 
             print("\nQuerying categories collection...")
             # Query the category collection
@@ -312,7 +599,7 @@ class NewsCharityMatcher:
                 or not results["documents"][0]
             ):
                 print("No matching categories found")
-                return [], []
+                return []
 
             # Format results
             categories = []
@@ -337,22 +624,19 @@ class NewsCharityMatcher:
                     {"category": category, "similarity": normalized_similarity}
                 )
 
-                # Get subscribers for top category
-                if i == 0:  # Only for the top category
-                    subscribers = get_users_for_category(self.postgres_db, category)
-
             print(f"\nMatched categories: {json.dumps(categories, indent=2)}")
-            return categories, subscribers
+            return categories
 
         except Exception as e:
             print(f"Error in find_matching_categories: {str(e)}")
             print(f"Article text: {article_text}")
-            return [], []
+            return []
 
     def get_urgency_score(self, article):
         """Get urgency score from 1-10 for the article using GPT."""
         prompt = f"""Article Title: {article['title']}
 Description: {article['description']}
+Content: {article.get('content', '')[:2000]}
 
 On a scale of 1-10, rate the urgency of this situation in terms of immediate funding needs, where:
 1 = No immediate funding urgency
@@ -371,7 +655,7 @@ Brief Reason: [one-line explanation]"
 """
 
         try:
-            response = self.client.chat.completions.create(
+            response = self.chat(
                 model="gpt-3.5-turbo",
                 messages=[
                     {
@@ -390,229 +674,669 @@ Brief Reason: [one-line explanation]"
             print(f"Error getting urgency score: {e}")
             return "Urgency Score: N/A\nBrief Reason: Error in assessment"
 
+    def analyze_article(self, article):
+        """Run the per-article stages: enrichment, relevance, categories, charities and urgency.
+
+        Returns what the portfolio stage needs, or None when no portfolio needs a decision.
+        """
+        # Fetch the article body once; every stage below reuses it
+        self.enrich_article(article)
+
+        # Check if article is relevant using GPT
+        if not self.is_relevant_article(
+            article["title"], article.get("description", ""), article["content"]
+        ):
+            print("Skipping article based on GPT response")
+            return None
+
+        print("Article deemed relevant - continuing analysis...")
+        print(f"\nAnalyzing article: {article['title']}")
+
+        # Find matching categories
+        matching_categories = self.find_matching_categories(article)
+        if not matching_categories:
+            return None
+        print("\nMatching Categories:")
+        for i, cat in enumerate(matching_categories, 1):
+            print(f"{i}. {cat['category']}")
+            print(f"   Similarity Score: {cat['similarity']:.4f}")
+
+        category = matching_categories[0]["category"]
+        if not self.subscriber_index.subscribers(category):
+            print(f"No subscribers for {category}.")
+            return None
+
+        # Find similar charities
+        similar_charities = self.find_similar_charities(article, category)
+        if not similar_charities:
+            print("No similar charities found.")
+            return None
+
+        # Get urgency score for the article
+        urgency_result = self.get_urgency_score(article)
+        print("\nUrgency Assessment:")
+        print(urgency_result)
+        urgency_score = (
+            float(urgency_result.split("\n")[0].split(": ")[1])
+            if "Score:" in urgency_result
+            else 5.0
+        )
+
+        return {
+            "article": article,
+            "category": category,
+            "similar_charities": similar_charities,
+            "urgency_score": urgency_score,
+        }
+
     def update_user_portfolios(
-        self, subscribers: list[UserCategory], category, similar_charities, article
+        self, subscribers: Iterable[Sequence[str]], category, similar_charities, article, urgency_score, lease=None, checkpoint_link=None
     ):
-        """Update user portfolios using an AI portfolio manager"""
-        try:
-            # Get urgency score for the article
-            urgency_result = self.get_urgency_score(article)
-            print("\nUrgency Assessment:")
-            print(urgency_result)
-            urgency_score = (
-                float(urgency_result.split("\n")[0].split(": ")[1])
-                if "Score:" in urgency_result
-                else 5.0
+        """Update user portfolios using an AI portfolio manager
+
+        Returns the users that are not finished: those whose update failed and, when the
+        lease was lost, every user not reached yet. With a lease (a LeaseHeartbeat), stops
+        as soon as the lease is lost, so a worker that no longer owns the batch never acts
+        for its users. checkpoint_link replaces the article's link as the checkpoint key,
+        so a backfill keeps its decisions apart from the live matcher's.
+        """
+        link = checkpoint_link or article["link"]
+        article_context = self.portfolio_article_context(article, category, similar_charities, urgency_score)
+
+        # Read portfolios from the event index unless the indexer has fallen behind
+        use_index = self.portfolio_index_is_fresh()
+
+        unfinished = []
+        # For each subscriber, consuming one page of subscribers at a time
+        users = itertools.chain.from_iterable(subscribers)
+        for user_id in users:
+            if lease is not None and lease.lost:
+                print(f"Lease lost, leaving user {user_id} and the rest of the batch to its new owner")
+                unfinished.append(user_id)
+                unfinished.extend(users)
+                break
+            try:
+                checkpoint = self.load_portfolio_checkpoint(link, user_id)
+                if checkpoint is None:
+                    decision = self.decide_portfolio(user_id, article_context, use_index)
+                    if decision is None:
+                        continue
+                    with session_scope(self.session_factory) as db:
+                        saved = save_portfolio_decision(db, link, user_id, decision, urgency_score)
+                        if saved:
+                            # Pushed to the user's app once the decision is stored
+                            notify_user_event(
+                                db,
+                                user_id,
+                                "PortfolioDecision",
+                                link=article["link"],
+                                title=article["title"],
+                                category=category,
+                                urgency=urgency_score,
+                                charities=decision["addresses"],
+                                percentages=decision["percentages"],
+                                send_money=decision["send_money"],
+                            )
+                    if not saved:
+                        # Another worker stored its decision first; that one is the one to apply
+                        print(f"\nUsing the decision another worker stored for user {user_id}")
+                        checkpoint = self.load_portfolio_checkpoint(link, user_id)
+
+                if checkpoint is not None:
+                    if checkpoint.status != "decided":
+                        # Done, or handed to the coalescer or the payout queue
+                        print(f"\nPortfolio for user {user_id} already handled for this article")
+                        continue
+                    # Decided before a restart or by another worker: no new model calls
+                    print(f"\nResuming portfolio decision for user {user_id}")
+                    decision = json.loads(checkpoint.decision)
+
+                if lease is not None and lease.lost:
+                    # The decision is checkpointed; the new owner applies it
+                    print(f"Lease lost before applying the decision for user {user_id}")
+                    unfinished.append(user_id)
+                    unfinished.extend(users)
+                    break
+                self.apply_portfolio_decision(link, user_id, decision, urgency_score)
+                print(f"Portfolio updated for user {user_id}")
+                if "seen_at" in article:
+                    # Per user, so a large batch counts once per subscriber it served
+                    self.latency.record(urgency_score, time.time() - article["seen_at"])
+
+            except Exception as e:
+                # The checkpoint stays 'decided', so the next attempt resumes from here
+                print(f"Error updating portfolio for user {user_id}: {e}")
+                unfinished.append(user_id)
+
+        return unfinished
+
+    def portfolio_article_context(self, article, category, similar_charities, urgency_score):
+        # Shared by every subscriber of this article, so it sits before the per-user part
+        return (
+            f"Article Title: {article['title']}\n"
+            f"Description: {article.get('description', '')}\n"
+            f"Content: {article.get('content', '')[:2000]}\n"
+            f"Category: {category}\n"
+            f"Urgency Score: {urgency_score}\n"
+            f"Similar Charities:\n{format_charities(similar_charities)}"
+        )
+
+    def decide_portfolio(self, user_id, article_context, use_index):
+        """Ask the portfolio agent what to do for one user, without touching the chain.
+
+        Returns the new addresses and percentages (None when unchanged) and whether to
+        send the user's balance, or None when the user is unknown.
+        """
+        print(f"\nAnalyzing portfolio for user {user_id}")
+
+        user_object = self.get_portfolio(user_id, use_index)
+        if not user_object:
+            print(f"User {user_id} not found in database")
+            return None
+        portfolio_addresses = user_object.addresses
+        portfolio_percentages = user_object.percentages
+
+        # Get the names of the charities
+
+        portfolio_charity_names = self.charity_directory.names_for(portfolio_addresses)
+
+        # TODO: Add mission statements of the charities, not just their names
+
+        # Agentic loop
+        new_charity_names = portfolio_charity_names
+        new_charity_percents = portfolio_percentages
+        has_changed = False
+        send_money_requested = False
+        running = True
+
+        def keep_portfolio():
+            nonlocal running
+            running = False
+            return "Keeping the current portfolio without changes"
+
+        def update_portfolio(new_charities, new_percents):
+            nonlocal new_charity_names, new_charity_percents, has_changed
+            unknown = self.charity_directory.unknown_names(new_charities)
+            if unknown:
+                return f"Portfolio not updated. These charities are unknown: {', '.join(unknown)}. Use the exact names of the charities in the portfolio or the similar charities."
+            if len(new_charities) != len(new_percents):
+                return "Portfolio not updated. Provide exactly one percentage per charity."
+            new_charity_names = new_charities
+            new_charity_percents = new_percents
+            has_changed = True
+            return f"Portfolio updated with new charities and percentages:\n{convert_charity_list_to_text()}"
+
+        def send_money():
+            nonlocal running, send_money_requested
+            send_money_requested = True
+            running = False
+            return "Payout scheduled: the user's balance will be sent to the charities in the portfolio"
+
+        def convert_charity_list_to_text():
+            if not new_charity_names:
+                return "No charities in the portfolio"
+            return "\n".join(
+                [
+                    f"{name} ({percent}%)"
+                    for name, percent in zip(
+                        new_charity_names, new_charity_percents
+                    )
+                ]
             )
 
-            # For each subscriber
-            for user in subscribers:
-                user_id = user.userid
-                print(f"\nAnalyzing portfolio for user {user_id}")
+        # Agentic loop
 
-                user_object = get_user(contract, user_id)
-                if not user_object:
-                    print(f"User {user_id} not found in database")
-                    continue
-                portfolio_addresses = user_object.addresses
-                portfolio_percentages = user_object.percentages
+        messages = [
+            {"role": "system", "content": PORTFOLIO_SYSTEM_PROMPT},
+            {"role": "user", "content": article_context},
+            {
+                "role": "user",
+                "content": f"Current portfolio of user {user_id}:\n{convert_charity_list_to_text()}",
+            },
+        ]
+        prompt_length = len(messages)
+        usage_before = dict(self.token_usage)
+
+        for _ in range(MAX_PORTFOLIO_ITERATIONS):
+            if not running:
+                break
+
+            response = self.chat(
+                model="gpt-4o-mini",
+                messages=messages,
+                tools=PORTFOLIO_TOOLS,
+                tool_choice="auto",
+            )
+
+            message = response.choices[0].message
+            messages.append(message)
+
+            if not message.tool_calls:
+                messages.append(
+                    {
+                        "role": "user",
+                        "content": "Respond by calling one of the functions.",
+                    }
+                )
+                continue
 
-                # Get the names of the charities
+            for tool_call in message.tool_calls:
+                args = json.loads(tool_call.function.arguments)
 
-                portfolio_charity_names = get_names_of_charities(self.postgres_db, portfolio_addresses)
+                if tool_call.function.name == "keep_portfolio":
+                    result = keep_portfolio()
+                elif tool_call.function.name == "update_portfolio":
+                    result = update_portfolio(
+                        args.get("new_charities", []),
+                        args.get("new_percents", []),
+                    )
+                elif tool_call.function.name == "send_money":
+                    result = send_money()
+                else:
+                    result = f"Unknown function {tool_call.function.name}"
 
-                # TODO: Add mission statements of the charities, not just their names
+                messages.append(
+                    {
+                        "role": "tool",
+                        "content": result,
+                        "tool_call_id": tool_call.id,
+                    }
+                )
 
-                # Agentic loop
-                new_charity_names = portfolio_charity_names
-                new_charity_percents = portfolio_percentages
-                has_changed = False
-                running = True
+            messages = compact_history(messages, prompt_length, PORTFOLIO_HISTORY_TURNS)
 
-                def keep_portfolio():
-                    nonlocal running
-                    running = False
-                    if has_changed:
-                        # TODO: fetch new charity addresses
-                        new_charity_addresses: list[CharityAddress] = get_addresses_of_charities(self.postgres_db, new_charity_names)
+        if running:
+            # Out of iterations: keep whatever valid update the agent already made
+            print(f"Portfolio agent for user {user_id} hit the iteration cap")
 
-                        new_charity_addresses.sort(key = lambda x: new_charity_names.index(x.name))
+        print(
+            f"Tokens for user {user_id}: "
+            + ", ".join(f"{key}={self.token_usage[key] - usage_before[key]}" for key in self.token_usage)
+        )
 
-                        set_charities(
-                            contract,
-                            user_id,
-                            new_charity_addresses,
-                            new_charity_percents,
-                        )
-                        print(f"Updated portfolio for user {user_id}")
-
-                    return "Keeping the current portfolio without changes"
-
-                def update_portfolio(new_charities, new_percents):
-                    nonlocal new_charity_names, new_charity_percents, has_changed
-                    new_charity_names = new_charities
-                    new_charity_percents = new_percents
-                    has_changed = True
-                    return f"Portfolio updated with new charities and percentages:\n{convert_charity_list_to_text()}"
-
-                def send_money():
-                    nonlocal running
-                    print(f"Sending money to charities in portfolio for user {user_id}")
-                    split_among_charities(contract, user_id)
-                    running = False
-                    return "Money sent to charities in portfolio"
-
-                def convert_charity_list_to_text():
-                    if not new_charity_names:
-                        return "No charities in the portfolio"
-                    return "\n".join(
-                        [
-                            f"{name} ({percent}%)"
-                            for name, percent in zip(
-                                new_charity_names, new_charity_percents
-                            )
-                        ]
-                    )
+        return {
+            # Names were validated in update_portfolio, so this is a pure lookup
+            "addresses": self.charity_directory.addresses_for(new_charity_names) if has_changed else None,
+            "percentages": [int(percent) for percent in new_charity_percents] if has_changed else None,
+            "send_money": send_money_requested,
+        }
 
-                # Agentic loop
+    def load_portfolio_checkpoint(self, link, user_id):
+        with session_scope(self.session_factory) as db:
+            checkpoint = get_portfolio_checkpoint(db, link, user_id)
+            if checkpoint is not None:
+                db.expunge(checkpoint)
+            return checkpoint
 
-                messages = [
-                    {
-                        "role": "system",
-                        "content": f"User {user_id}, you are a portfolio manager for a charity impact fund. Your job is to manage the fund's portfolio of charities to maximize social impact. You have the following charities in your portfolio:\n{convert_charity_list_to_text()}",
-                    },
-                    {
-                        "role": "user",
-                        "content": "Analyze the portfolio and make any necessary changes based on the article and the new charities. Call the 'keep_portfolio' function if you want to keep the current portfolio without changes, the 'update_portfolio' function if you want to update the portfolio with new charities and percentages, or the 'send_money' function if you want to send money to the charities in the portfolio. Make sure the charity percentages sum to 100, and end the conversation by calling the 'keep_portfolio' function.",
-                    },
-                    {
-                        "role": "system",
-                        "content": f"Article Title: {article['title']}\nDescription: {article.get('description', '')}\nCategory: {category}\nUrgency Score: {urgency_score}\nSimilar Charities:\n{json.dumps(similar_charities, indent=2)}",
-                    },
-                ]
+    def apply_portfolio_decision(self, link, user_id, decision, urgency_score=5.0):
+        """Hand a stored portfolio decision to the coalescer or the payout queue."""
 
-                while running:
-                    response = self.client.chat.completions.create(
-                        model="gpt-4o-mini",
-                        messages=messages,
-                        tools=[
-                            {
-                                "type": "function",
-                                "function": {
-                                    "name": "keep_portfolio",
-                                    "description": "Keep the current portfolio without changes",
-                                },
-                            },
-                            {
-                                "type": "function",
-                                "function": {
-                                    "name": "update_portfolio",
-                                    "description": "Update the portfolio with new charities and percentages",
-                                    "parameters": {
-                                        "type": "object",
-                                        "properties": {
-                                            "new_charities": {
-                                                "type": "array",
-                                                "items": {"type": "string"},
-                                            },
-                                            "new_percents": {
-                                                "type": "array",
-                                                "items": {"type": "number"},
-                                            },
-                                        },
-                                    },
-                                },
-                            },
-                            {
-                                "type": "function",
-                                "function": {
-                                    "name": "send_money",
-                                    "description": "Send money to charities in the portfolio",
-                                },
-                            },
-                        ],
-                        tool_choice="auto",
-                    )
+        def record(**fields):
+            with session_scope(self.session_factory) as db:
+                update_portfolio_checkpoint(db, link, user_id, **fields)
 
-                    message = response.choices[0].message
-                    messages.append(message)
+        if decision["addresses"] is not None:
+            # Committed by whichever worker flushes this user next; a decision that also
+            # sends money moves on to the payout queue once its change is on chain
+            record(status="queued")
+            return
 
-                    for tool_call in message.tool_calls:
-                        args = json.loads(tool_call.function.arguments)
+        if decision["send_money"]:
+            # pay_out marks it done once the split is on chain
+            record(status="payout")
+            self.payouts.request(user_id, urgency_score, link)
+            return
 
-                        if tool_call.function.name == "keep_portfolio":
-                            result = keep_portfolio()
-                        elif tool_call.function.name == "update_portfolio":
-                            result = update_portfolio(
-                                args.get("new_charities", []),
-                                args.get("new_percents", []),
-                            )
-                        elif tool_call.function.name == "send_money":
-                            result = send_money()
+        record(status="done")
 
-                        messages.append(
-                            {
-                                "role": "tool",
-                                "content": result,
-                                "tool_call_id": tool_call.id,
-                            }
-                        )
+    def await_recorded_tx(self, user_id, tx_hash):
+        """Wait for a transaction recorded in a checkpoint.
 
-                print(f"Portfolio updated for user {user_id}")
+        Returns False when it was dropped and must be sent again. A reverted transaction
+        raises TransactionFailed; either way its hash is forgotten so a retry sends it anew.
+        """
+        try:
+            wait_for_receipt(tx_hash)
+            return True
+        except TransactionDropped as e:
+            print(f"{e}, sending it again")
+            self.forget_tx(user_id, tx_hash)
+            return False
+        except TransactionFailed:
+            self.forget_tx(user_id, tx_hash)
+            raise
+
+    def forget_tx(self, user_id, tx_hash):
+        with session_scope(self.session_factory) as db:
+            clear_portfolio_tx(db, user_id, tx_hash)
+
+    def payout_lookup(self, user_id):
+        user = self.get_portfolio(user_id, self.portfolio_index_is_fresh())
+        if not user:
+            return 0, 0
+        return round(user.balance * 10**18), len(user.addresses)
+
+    def pay_out(self, user_id, links):
+        """Split a user's balance among their charities for every payout waiting for them.
+
+        Payouts are shared by every worker, so this runs under the user's lease and reads
+        the waiting payouts from the database rather than trusting links. Returns the
+        receipt, or None when another worker already paid them out.
+        """
+        # The split must use the newest allocation, so commit any queued change first
+        if not self.coalescer.flush(user_id):
+            raise RuntimeError(f"User {user_id} is being updated by another worker")
+        with session_scope(self.session_factory) as db:
+            lease = acquire_user_lease(db, user_id, self.worker_id, PAYOUT_LEASE_SECONDS)
+        if lease is None:
+            raise RuntimeError(f"User {user_id} is being updated by another worker")
+        try:
+            with session_scope(self.session_factory) as db:
+                waiting = get_queued_portfolio_checkpoints(db, status="payout", userid=user_id)
+                for checkpoint in waiting:
+                    db.expunge(checkpoint)
+
+            # Sent before a restart or by a worker that died: wait for it instead of paying gas twice
+            confirmed = {
+                tx_hash: self.await_recorded_tx(user_id, tx_hash)
+                for tx_hash in {checkpoint.split_tx for checkpoint in waiting if checkpoint.split_tx}
+            }
+            self.finish_payout(user_id, [c.link for c in waiting if c.split_tx and confirmed[c.split_tx]])
+            links = [c.link for c in waiting if not (c.split_tx and confirmed[c.split_tx])]
+            if not links:
+                print(f"No payout left to send for user {user_id}")
+                return None
+            return self.send_payout(user_id, links)
+        finally:
+            with session_scope(self.session_factory) as db:
+                release_user_lease(db, user_id, self.worker_id)
+
+    def send_payout(self, user_id, links):
+        print(f"Sending money to charities in portfolio for user {user_id}")
+
+        sent = []
+
+        def record_sent(tx_hash):
+            sent.append(tx_hash)
+            with session_scope(self.session_factory) as db:
+                for link in links:
+                    update_portfolio_checkpoint(db, link, user_id, split_tx=tx_hash)
 
-        except Exception as e:
-            print(f"Error updating user portfolios: {e}")
+        try:
+            receipt = split_among_charities(get_contract(), user_id, on_sent=record_sent)
+        except (TransactionFailed, TransactionDropped):
+            # The payout stays queued and is sent again on a later tick
+            for tx_hash in sent:
+                self.forget_tx(user_id, tx_hash)
+            raise
+        self.finish_payout(user_id, links)
+        return receipt
+
+    def finish_payout(self, user_id, links):
+        if not links:
+            return
+        with session_scope(self.session_factory) as db:
+            finish_queued_portfolio_checkpoints(db, user_id, links, status="payout")
+
+    def commit_portfolio(self, user_id, addresses, percentages, checkpoints):
+        """Send the net result of one or more coalesced decisions, unless the chain already has it."""
+        contract = get_contract()
+        links = [checkpoint.link for checkpoint in checkpoints]
+
+        # Sent before a restart: wait for it instead of paying gas twice. If it carried
+        # the newest allocation, the check below finds nothing left to send.
+        for tx_hash in {checkpoint.charities_tx for checkpoint in checkpoints if checkpoint.charities_tx}:
+            self.await_recorded_tx(user_id, tx_hash)
+
+        sent = []
+
+        def record_sent(tx_hash):
+            sent.append(tx_hash)
+            with session_scope(self.session_factory) as db:
+                for link in links:
+                    update_portfolio_checkpoint(db, link, user_id, charities_tx=tx_hash)
+
+        current = get_user(contract, user_id)
+        if [address.lower() for address in current.addresses] == [address.lower() for address in addresses] and list(current.percentages) == percentages:
+            print(f"Portfolio for user {user_id} is already up to date on chain")
+        else:
+            try:
+                set_charities(contract, user_id, addresses, percentages, on_sent=record_sent)
+            except (TransactionFailed, TransactionDropped):
+                # The change stays pending in the coalescer and is sent again on the next flush
+                for tx_hash in sent:
+                    self.forget_tx(user_id, tx_hash)
+                raise
+            print(f"Updated portfolio for user {user_id} ({len(links)} decisions coalesced)")
+
+    def finish_portfolio_changes(self, user_id, checkpoints):
+        """Mark coalesced decisions done, or move those that also send money to the payout queue."""
+        payouts = [checkpoint for checkpoint in checkpoints if json.loads(checkpoint.decision)["send_money"]]
+        with session_scope(self.session_factory) as db:
+            finish_queued_portfolio_checkpoints(db, user_id, [c.link for c in checkpoints if c not in payouts])
+            finish_queued_portfolio_checkpoints(db, user_id, [c.link for c in payouts], to_status="payout")
+        for checkpoint in payouts:
+            self.payouts.request(user_id, checkpoint.urgency, checkpoint.link)
+
+    def sync_payouts(self):
+        """Queue the payouts waiting in the database, with their urgency and age.
+
+        Covers payouts left by a restart or by a worker that died. Every worker queues every
+        waiting payout; pay_out runs under the user's lease and re-reads the database, so
+        whichever worker gets there first sends it and the others find nothing left. Queued
+        portfolio changes need no syncing: the coalescer reads them from the database.
+        """
+        with session_scope(self.session_factory) as db:
+            waiting = get_payout_requests(db)
+        # Users no longer waiting were paid out (or given up on) by another worker
+        self.payouts.retain({request.userid for request in waiting})
+        for request in waiting:
+            self.payouts.request(request.userid, request.urgency, request.link, waited=float(request.waited))
+
+    def checkpointed_analysis(self, article):
+        """analyze_article, reusing the stored result when the article was analyzed before a restart."""
+        with session_scope(self.session_factory) as db:
+            checkpoint = get_article_checkpoint(db, article["link"])
+            if checkpoint is not None:
+                print("Resuming article from checkpoint")
+                return json.loads(checkpoint.analysis)
+
+        analysis = self.analyze_article(article)
+        if analysis:
+            # The portfolio stage only needs an excerpt of the body
+            analysis["article"] = {**article, "content": article.get("content", "")[:2000]}
+        with session_scope(self.session_factory) as db:
+            save_article_checkpoint(db, article["link"], analysis)
+        return analysis
+
+    def create_tables(self):
+        create_checkpoint_tables(self.session_factory)
+        # Until the indexer has run its tables are empty, so portfolios come from the contract
+        create_indexer_tables(self.session_factory)
 
     def run(self, rss_urls, interval=300):  # interval in seconds (default 5 minutes)
+        self.create_tables()
+        next_poll = 0
         while True:
             try:
-                print(f"\nChecking for new articles at {datetime.now()}")
-                articles = self.get_rss_feeds(rss_urls)
-
-                for article in articles:
-                    print("\n" + "=" * 50)
-                    print(f"Processing new article...")
-
-                    # Check if article is relevant using GPT
-                    if not self.is_relevant_article(
-                        article["title"], article.get("description", "")
-                    ):
-                        print("Skipping article based on GPT response")
+                # Feeds are polled on schedule even with a backlog, so breaking news
+                # can jump ahead of articles that are still waiting
+                if time.monotonic() >= next_poll:
+                    print(f"\nChecking for new articles at {datetime.now()}")
+                    articles = self.get_rss_feeds(rss_urls)
+                    self.subscriber_index.refresh()
+                    try:
+                        self.refresh_categories()
+                    except Exception as e:
+                        print(f"Error refreshing categories, using the previous snapshot: {e}")
+                    self.sync_payouts()
+
+                    for article in articles:
+                        self.scheduler.push(article["link"], article["urgency_estimate"], ("analyze", article))
+                    print(f"{len(self.scheduler)} tasks queued")
+                    print(self.payouts.report())
+                    print(self.latency.report())
+                    self.profiler.dump("cycle")
+                    next_poll = time.monotonic() + interval
+
+                self.coalescer.flush_due()
+                self.payouts.release_due()
+
+                task = self.scheduler.pop()
+                if task is None:
+                    # Wake up in short steps so coalesced changes are committed close to their deadline
+                    time.sleep(min(30, max(0, next_poll - time.monotonic())))
+                    continue
+
+                stage, payload = task
+                print("\n" + "=" * 50)
+                if stage == "analyze":
+                    print("Processing new article...")
+                    analysis = self.checkpointed_analysis(payload)
+                    if analysis:
+                        # The portfolio stage is queued by the real urgency score
+                        link = analysis["article"]["link"]
+                        self.scheduler.push(link, analysis["urgency_score"], ("portfolio", analysis))
+                        continue
+                    article = payload
+                else:
+                    analysis = payload
+                    article = analysis["article"]
+                    print(f"Updating portfolios for article: {article['title']}")
+                    # A retry only revisits the users that were left unfinished
+                    if "retry_users" in analysis:
+                        subscribers = [analysis["retry_users"]]
+                    else:
+                        subscribers = self.subscriber_index.batches(analysis["category"])
+                    unfinished = self.update_user_portfolios(
+                        subscribers,
+                        analysis["category"],
+                        analysis["similar_charities"],
+                        article,
+                        analysis["urgency_score"],
+                    )
+                    if unfinished:
+                        # Not marked processed, so if the retries fail too the next feed
+                        # poll queues it again and the finished users are skipped
+                        attempts = analysis.get("attempts", 1)
+                        if attempts < MAX_PORTFOLIO_ATTEMPTS:
+                            print(f"{len(unfinished)} portfolios failed, retrying them")
+                            retry = {**analysis, "retry_users": unfinished, "attempts": attempts + 1}
+                            self.scheduler.push(article["link"], analysis["urgency_score"], ("portfolio", retry))
+                        else:
+                            print(f"{len(unfinished)} portfolios still failed after {attempts} attempts")
                         continue
 
-                    print("Article deemed relevant - continuing analysis...")
-                    print(f"\nAnalyzing article: {article['title']}")
+                # Mark article as processed
+                self.processed_articles.add(article["link"])
+                self.save_processed_articles()
 
-                    # Find matching categories and subscribers
-                    matching_categories, subscribers = self.find_matching_categories(
-                        article
-                    )
-                    print("\nMatching Categories:")
-                    for i, cat in enumerate(matching_categories, 1):
-                        print(f"{i}. {cat['category']}")
-                        print(f"   Similarity Score: {cat['similarity']:.4f}")
-
-                    # Find similar charities
-                    similar_charities = self.find_similar_charities(article)
-
-                    if similar_charities and subscribers:
-                        # Update user portfolios
-                        self.update_user_portfolios(
-                            subscribers,
-                            matching_categories[0]["category"],
-                            similar_charities,
-                            article,
-                        )
+            except Exception as e:
+                print(f"Error occurred: {str(e)}")
+                time.sleep(60)  # Wait a minute before retrying
 
-                    else:
-                        print("No similar charities found.")
+    def run_worker(self, rss_urls, worker_id, interval=300, lease_seconds=120, batch_size=100):
+        """Process articles and subscriber batches claimed from the shared Postgres work tables.
 
-                    # Mark article as processed
-                    self.processed_articles.add(article["link"])
-                    self.save_processed_articles()
+        Any number of workers, on one machine or several, can run this side by side.
+        """
+        create_work_tables(self.session_factory)
+        self.create_tables()
+        last_poll = None
 
-                time.sleep(interval)
+        while True:
+            try:
+                if last_poll is None or time.monotonic() - last_poll >= interval:
+                    print(f"\nWorker {worker_id} checking for new articles at {datetime.now()}")
+                    # Every worker may poll; links that are already queued are ignored
+                    articles = self.get_rss_feeds(rss_urls)
+                    with session_scope(self.session_factory) as db:
+                        enqueue_articles(db, articles)
+                    self.subscriber_index.refresh()
+                    try:
+                        self.refresh_categories()
+                    except Exception as e:
+                        print(f"Error refreshing categories, using the previous snapshot: {e}")
+                    self.sync_payouts()
+                    with session_scope(self.session_factory) as db:
+                        failed = fail_exhausted_work(db)
+                        purged = purge_done_work(db)
+                    if failed:
+                        print(f"{failed} work items ran out of attempts and were marked failed")
+                    if purged:
+                        print(f"Purged {purged} finished articles from the work queue")
+                    last_poll = time.monotonic()
+                    print(self.payouts.report())
+                    print(self.latency.report())
+                    self.profiler.dump(f"cycle-{worker_id}")
+
+                self.coalescer.flush_due()
+                self.payouts.release_due()
+
+                # Drain subscriber batches before analyzing more articles, so started
+                # articles finish first; both tables hand out the most urgent work first
+                if self.process_subscriber_batch(worker_id, lease_seconds):
+                    continue
+                if self.process_article_work(worker_id, lease_seconds, batch_size):
+                    continue
+                time.sleep(5)
 
             except Exception as e:
                 print(f"Error occurred: {str(e)}")
                 time.sleep(60)  # Wait a minute before retrying
+
+    def process_article_work(self, worker_id, lease_seconds, batch_size):
+        with session_scope(self.session_factory) as db:
+            work = claim_article(db, worker_id, lease_seconds)
+        if work is None:
+            return False
+
+        print("\n" + "=" * 50)
+        print(f"Worker {worker_id} processing article {work.link}")
+        article = json.loads(work.article)
+        with LeaseHeartbeat(self.session_factory, ArticleWork, work.link, worker_id, lease_seconds) as heartbeat:
+            analysis = self.checkpointed_analysis(article)
+        if heartbeat.lost:
+            print(f"Lease on article {work.link} was lost, dropping this result")
+            return True
+
+        # Sliced from the index one batch at a time as complete_article writes them
+        batches = ()
+        if analysis:
+            batches = self.subscriber_index.batches(analysis["category"], batch_size)
+
+        with session_scope(self.session_factory) as db:
+            if not complete_article(db, work.link, worker_id, analysis, batches):
+                print(f"Lease on article {work.link} was lost, dropping this result")
+        return True
+
+    def process_subscriber_batch(self, worker_id, lease_seconds):
+        with session_scope(self.session_factory) as db:
+            batch = claim_subscriber_batch(db, worker_id, lease_seconds)
+        if batch is None:
+            return False
+
+        print(f"\nWorker {worker_id} processing {len(batch.userids)} subscribers of {batch.link}")
+        analysis = json.loads(batch.analysis)
+        with LeaseHeartbeat(self.session_factory, SubscriberBatchWork, batch.id, worker_id, lease_seconds) as heartbeat:
+            unfinished = self.update_user_portfolios(
+                [batch.userids],
+                analysis["category"],
+                analysis["similar_charities"],
+                analysis["article"],
+                analysis["urgency_score"],
+                lease=heartbeat,
+            )
+
+        with session_scope(self.session_factory) as db:
+            if heartbeat.lost:
+                print(f"Lease on subscriber batch {batch.id} was lost, leaving it to its new owner")
+                return True
+            if unfinished:
+                # Only the failed users are retried, by whichever worker claims the batch next
+                if release_subscriber_batch(db, batch.id, worker_id, unfinished):
+                    print(f"{len(unfinished)} users of subscriber batch {batch.id} failed, released for a retry")
+                return True
+            if not complete_subscriber_batch(db, batch.id, worker_id):
+                print(f"Lease on subscriber batch {batch.id} was lost, leaving it to its new owner")
+        return True
@@ -0,0 +1,186 @@
+import heapq
+import itertools
+import threading
+import time
+
+# Rough gas model of splitAmongCharities: a fixed cost plus one transfer per charity.
+# Only used to rank payouts against each other, not to price transactions.
+SPLIT_BASE_GAS = 45_000
+SPLIT_GAS_PER_CHARITY = 12_000
+
+
+class PayoutScheduler:
+    """Queues splitAmongCharities requests and releases them when they are worth the gas.
+
+    A queued payout is released once the user's balance reaches min_balance_wei, the
+    article behind it is urgent enough, or it has waited max_wait seconds. Each tick
+    releases at most max_per_tick payouts, the most value per unit of gas first.
+
+    Users are kept in a heap by when they next need a look, so a tick only looks up the
+    balances of users that are due for a check rather than every queued user. A user
+    whose payout is not due yet is looked at again after recheck_interval, or exactly
+    when max_wait runs out if that comes first, and balances are cached for balance_ttl.
+    Times are wall-clock seconds, so a payout restored after a restart keeps its age.
+
+    request() and retain() may be called from other threads than release_due(), as the
+    backfill does; they wait while a tick is running.
+
+    lookup(user_id) returns (balance_wei, charity_count); split(user_id, keys) sends
+    the transaction and returns its receipt, or None when there was nothing left to send
+    (another worker paid it out); on_dropped(user_id, keys) is told about payouts given
+    up on because there was never anything to split.
+    """
+
+    def __init__(
+        self,
+        split,
+        lookup,
+        min_balance_wei,
+        urgent_score=8,
+        max_wait=86400,
+        max_per_tick=20,
+        on_dropped=None,
+        recheck_interval=300,
+        balance_ttl=60,
+        max_checks_per_tick=200,
+    ):
+        self.split = split
+        self.lookup = lookup
+        self.on_dropped = on_dropped
+        self.min_balance_wei = min_balance_wei
+        self.urgent_score = urgent_score
+        self.max_wait = max_wait
+        self.max_per_tick = max_per_tick
+        self.recheck_interval = recheck_interval
+        self.balance_ttl = balance_ttl
+        self.max_checks_per_tick = max_checks_per_tick
+        self._queue: dict[str, dict] = {}
+        # (check_at, sequence, user_id); entries whose check_at no longer matches the
+        # user's are stale and skipped
+        self._heap = []
+        self._counter = itertools.count()
+        self._balances: dict[str, tuple] = {}
+        self._lock = threading.RLock()
+        self.metrics = {"payouts": 0, "gas_used": 0, "gas_cost_wei": 0, "disbursed_wei": 0, "lookups": 0}
+
+    def __len__(self):
+        return len(self._queue)
+
+    def request(self, user_id: str, urgency: float, key, waited: float = 0) -> None:
+        """Queue a payout for user_id. waited is how long ago it was first requested."""
+        with self._lock:
+            self._request(user_id, urgency, key, waited)
+
+    def _request(self, user_id, urgency, key, waited):
+        now = time.time()
+        queued = self._queue.get(user_id)
+        if queued is None:
+            self._queue[user_id] = {"requested_at": now - waited, "urgency": urgency, "keys": [key]}
+            self._schedule(user_id, now)
+            return
+        queued["requested_at"] = min(queued["requested_at"], now - waited)
+        if key not in queued["keys"]:
+            queued["keys"].append(key)
+        if urgency > queued["urgency"]:
+            # May be urgent now, so do not wait for the next regular check
+            queued["urgency"] = urgency
+            self._schedule(user_id, now)
+
+    def retain(self, user_ids) -> None:
+        """Forget queued users that are not in user_ids; their stale heap entries are skipped."""
+        with self._lock:
+            self._retain(user_ids)
+
+    def _retain(self, user_ids):
+        for user_id in [user_id for user_id in self._queue if user_id not in user_ids]:
+            del self._queue[user_id]
+            self._balances.pop(user_id, None)
+
+    def _schedule(self, user_id, check_at):
+        self._queue[user_id]["check_at"] = check_at
+        heapq.heappush(self._heap, (check_at, next(self._counter), user_id))
+
+    def _recheck(self, user_id, now):
+        queued = self._queue[user_id]
+        self._schedule(user_id, min(now + self.recheck_interval, max(now, queued["requested_at"] + self.max_wait)))
+
+    def _balance(self, user_id, now):
+        cached = self._balances.get(user_id)
+        if cached is not None and now - cached[2] < self.balance_ttl:
+            return cached[0], cached[1]
+        balance, charity_count = self.lookup(user_id)
+        self.metrics["lookups"] += 1
+        self._balances[user_id] = (balance, charity_count, now)
+        return balance, charity_count
+
+    def release_due(self) -> None:
+        with self._lock:
+            self._release_due()
+
+    def _release_due(self):
+        now = time.time()
+        due = []
+        checks = 0
+        while self._heap and self._heap[0][0] <= now and checks < self.max_checks_per_tick:
+            check_at, _, user_id = heapq.heappop(self._heap)
+            queued = self._queue.get(user_id)
+            if queued is None or queued["check_at"] != check_at:
+                continue
+            checks += 1
+            try:
+                balance, charity_count = self._balance(user_id, now)
+            except Exception as e:
+                print(f"Error looking up balance for user {user_id}: {e}")
+                self._recheck(user_id, now)
+                continue
+
+            waited = now - queued["requested_at"]
+            if balance <= 0 or charity_count == 0:
+                # Nothing to split yet; keep waiting for donations or charities
+                if waited < self.max_wait:
+                    self._recheck(user_id, now)
+                    continue
+                print(f"Dropping payout for user {user_id}: nothing to split after {self.max_wait}s")
+                del self._queue[user_id]
+                if self.on_dropped:
+                    self.on_dropped(user_id, queued["keys"])
+                continue
+
+            if balance >= self.min_balance_wei or queued["urgency"] >= self.urgent_score or waited >= self.max_wait:
+                value_per_gas = balance / (SPLIT_BASE_GAS + SPLIT_GAS_PER_CHARITY * charity_count)
+                due.append((value_per_gas, user_id, balance))
+            else:
+                self._recheck(user_id, now)
+
+        due.sort(reverse=True)
+        for _, user_id, _ in due[self.max_per_tick:]:
+            # Over this tick's budget; first in line on the next one
+            self._schedule(user_id, now)
+        for _, user_id, balance in due[: self.max_per_tick]:
+            queued = self._queue.pop(user_id)
+            # The split changes the balance, so the cached one is no longer any use
+            self._balances.pop(user_id, None)
+            try:
+                receipt = self.split(user_id, queued["keys"])
+            except Exception as e:
+                print(f"Error paying out for user {user_id}: {e}")
+                self._queue[user_id] = queued
+                self._recheck(user_id, now)
+                continue
+            if receipt is None:
+                continue
+
+            self.metrics["payouts"] += 1
+            self.metrics["gas_used"] += receipt["gasUsed"]
+            self.metrics["gas_cost_wei"] += receipt["gasUsed"] * receipt.get("effectiveGasPrice", 0)
+            self.metrics["disbursed_wei"] += balance
+
+    def report(self) -> str:
+        disbursed_eth = self.metrics["disbursed_wei"] / 10**18
+        gas_per_eth = self.metrics["gas_used"] / disbursed_eth if disbursed_eth else 0
+        cost_share = self.metrics["gas_cost_wei"] / self.metrics["disbursed_wei"] if self.metrics["disbursed_wei"] else 0
+        return (
+            f"Payouts: {self.metrics['payouts']} sent, {len(self)} queued, "
+            f"{disbursed_eth:.6f} ETH disbursed, {gas_per_eth:,.0f} gas per ETH, "
+            f"gas cost {cost_share:.2%} of value, {self.metrics['lookups']} balance lookups"
+        )
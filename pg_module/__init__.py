@@ -1,3 +1,9 @@
-from .crud import get_charities_for_category, get_users_for_category, get_names_of_charities, get_addresses_of_charities
-from .models import CharityCategory, UserCategory, CharityAddress
-from .database import get_db, SessionLocal
\ No newline at end of file
+from .crud import get_charities_for_category, get_users_for_category, get_names_of_charities, get_addresses_of_charities, get_users_for_category_page, iter_users_for_category, stream_users_for_category, get_charities_for_category_page, stream_charities_for_category, create_user_preferences, get_charity, put_user_preferences, get_user_preferences, get_user_portfolio, get_indexer_state, create_indexer_tables, get_charity_names_by_address, get_categories_for_user, get_counter
+from .models import CharityCategory, UserCategory, CharityAddress, Charity, UserPreferences, Counter, UserPortfolio, IndexerState, ArticleWork, SubscriberBatchWork, ArticleCheckpoint, PortfolioCheckpoint, UserLease
+from .database import get_db, get_read_db, session_scope, listen_connection, SessionLocal, ReadSessionLocal
+from .subscriber_index import SubscriberIndex, install_notify_trigger
+from .charity_directory import CharityDirectory
+from .work_queue import create_work_tables, enqueue_articles, claim_article, claim_subscriber_batch, complete_article, complete_subscriber_batch, release_subscriber_batch, fail_exhausted_work, purge_done_work, LeaseHeartbeat
+from .checkpoints import create_checkpoint_tables, get_article_checkpoint, save_article_checkpoint, get_portfolio_checkpoint, save_portfolio_decision, update_portfolio_checkpoint, clear_portfolio_tx, get_queued_portfolio_checkpoints, get_payout_requests, get_due_portfolio_users, finish_queued_portfolio_checkpoints, acquire_user_lease, release_user_lease
+from .migrations import migrate_charity_address, create_user_category_index
+from .user_events import USER_EVENTS_CHANNEL, notify_user_event
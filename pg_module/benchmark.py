@@ -0,0 +1,155 @@
+"""Listing and query-latency benchmark for the shared data layer.
+
+    python -m pg_module.benchmark --url postgresql://... --users 200000
+
+Seeds a throwaway category, then measures:
+  * listing the whole category with .all(), keyset pages and a server-side cursor
+    (time and peak Python memory);
+  * latency of short API-style reads while matcher-style walkers page through the
+    category at the same time, on the pooled engine and on one without a pool.
+The seeded rows are deleted afterwards.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import create_engine, delete
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+import argparse
+import random
+import statistics
+import threading
+import time
+import tracemalloc
+
+from .models import Base, UserCategory, UserPreferences
+from .database import pool_options, session_scope
+from .crud import get_users_for_category, get_users_for_category_page, iter_users_for_category, stream_users_for_category, get_user_preferences
+
+CATEGORY = "benchmark"
+
+
+def seed(session_factory, users: int) -> list[str]:
+    userids = [f"0x{i:040x}" for i in range(users)]
+    engine = session_factory.kw["bind"]
+    Base.metadata.create_all(engine, tables=[UserCategory.__table__, UserPreferences.__table__])
+    with engine.begin() as connection:
+        for start in range(0, users, 10000):
+            chunk = userids[start:start + 10000]
+            connection.execute(UserCategory.__table__.insert(), [{"category": CATEGORY, "userid": u} for u in chunk])
+        connection.execute(UserPreferences.__table__.insert(), [{"userid": u, "mission_statement": "m"} for u in userids[:1000]])
+    return userids
+
+
+def cleanup(session_factory, userids: list[str]) -> None:
+    with session_scope(session_factory) as db:
+        db.execute(delete(UserCategory).where(UserCategory.category == CATEGORY))
+        db.execute(delete(UserPreferences).where(UserPreferences.userid.in_(userids[:1000])))
+
+
+def measure_listing(label, fn):
+    started = time.perf_counter()
+    count = fn()
+    elapsed = time.perf_counter() - started
+    # Tracing slows allocation down a lot, so memory is measured on a second run
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f"  {label:<28} {count:>9,} rows  {elapsed:7.2f}s  peak {peak / 2**20:8.1f} MiB")
+
+
+def listing(session_factory, page_size: int) -> None:
+    print("Listing the whole category:")
+
+    def with_all():
+        with session_scope(session_factory) as db:
+            return len(get_users_for_category(db, CATEGORY))
+
+    def with_pages():
+        return sum(len(page) for page in iter_users_for_category(session_factory, CATEGORY, page_size))
+
+    def with_cursor():
+        with session_scope(session_factory) as db:
+            return sum(1 for _ in stream_users_for_category(db, CATEGORY, page_size))
+
+    measure_listing(".all()", with_all)
+    measure_listing(f"keyset pages of {page_size}", with_pages)
+    measure_listing(f"server-side cursor ({page_size})", with_cursor)
+
+
+def percentile(samples, q):
+    return statistics.quantiles(samples, n=100)[q - 1] if len(samples) > 1 else samples[0]
+
+
+def mixed_load(session_factory, userids, api_threads, matcher_threads, seconds, page_size) -> None:
+    stop = threading.Event()
+    latencies = []
+    pages = 0
+    lock = threading.Lock()
+
+    def api_client():
+        rng = random.Random()
+        while not stop.is_set():
+            started = time.perf_counter()
+            with session_scope(session_factory) as db:
+                if rng.random() < 0.5:
+                    get_users_for_category_page(db, CATEGORY, rng.choice(userids), 50)
+                else:
+                    get_user_preferences(db, rng.choice(userids[:1000]))
+            with lock:
+                latencies.append(time.perf_counter() - started)
+
+    def matcher():
+        nonlocal pages
+        while not stop.is_set():
+            for _ in iter_users_for_category(session_factory, CATEGORY, page_size):
+                with lock:
+                    pages += 1
+                if stop.is_set():
+                    return
+
+    with ThreadPoolExecutor(api_threads + matcher_threads) as pool:
+        futures = [pool.submit(api_client) for _ in range(api_threads)]
+        futures += [pool.submit(matcher) for _ in range(matcher_threads)]
+        time.sleep(seconds)
+        stop.set()
+        for future in futures:
+            future.result()
+
+    ms = [latency * 1000 for latency in latencies]
+    print(
+        f"  {len(ms) / seconds:8,.0f} reads/s  p50 {percentile(ms, 50):6.2f}ms  p95 {percentile(ms, 95):6.2f}ms"
+        f"  p99 {percentile(ms, 99):6.2f}ms  max {max(ms):7.2f}ms  matcher pages/s {pages / seconds:,.0f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark category listings and query latency under mixed load")
+    parser.add_argument("--url", help="Database URL (default: the PG_* settings)")
+    parser.add_argument("--users", type=int, default=200000)
+    parser.add_argument("--page-size", type=int, default=500)
+    # Together these fit the default pool (PG_POOL_SIZE + PG_MAX_OVERFLOW = 15)
+    parser.add_argument("--api-threads", type=int, default=12)
+    parser.add_argument("--matcher-threads", type=int, default=3)
+    parser.add_argument("--seconds", type=float, default=10)
+    args = parser.parse_args()
+
+    if args.url:
+        pooled = create_engine(args.url, **pool_options())
+    else:
+        from .database import engine as pooled
+    unpooled = create_engine(pooled.url, poolclass=NullPool)
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=pooled)
+
+    userids = seed(session_factory, args.users)
+    try:
+        listing(session_factory, args.page_size)
+        print(f"{args.api_threads} API clients + {args.matcher_threads} matcher walkers for {args.seconds:g}s:")
+        for label, engine in (("pooled", pooled), ("no pool", unpooled)):
+            print(f" {label}:")
+            mixed_load(sessionmaker(autocommit=False, autoflush=False, bind=engine), userids, args.api_threads, args.matcher_threads, args.seconds, args.page_size)
+    finally:
+        cleanup(session_factory, userids)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+from sqlalchemy.orm import sessionmaker
+import time
+
+from .models import CharityAddress
+from .database import session_scope
+
+
+class CharityDirectory:
+    """Bidirectional charity name <-> address map backed by the charityaddress table.
+
+    The table changes rarely, so it is loaded once and only re-read when it is older
+    than max_age, after invalidate(), or when a lookup misses (at most once every
+    miss_refresh_interval seconds, so hallucinated names cannot hammer Postgres).
+    """
+
+    def __init__(self, session_factory: sessionmaker, max_age: float = 3600, miss_refresh_interval: float = 30):
+        self.session_factory = session_factory
+        self.max_age = max_age
+        self.miss_refresh_interval = miss_refresh_interval
+        self._address_by_name: dict[str, str] = {}
+        self._name_by_address: dict[str, str] = {}
+        self._loaded_at = None
+
+    def load(self) -> None:
+        with session_scope(self.session_factory) as db:
+            rows = db.query(CharityAddress.name, CharityAddress.address).all()
+
+        self._address_by_name = {name: address for name, address in rows}
+        # Addresses come back from the chain checksummed, so compare them case-insensitively
+        self._name_by_address = {address.lower(): name for name, address in rows}
+        self._loaded_at = time.monotonic()
+
+    def invalidate(self) -> None:
+        self._loaded_at = None
+
+    def names_for(self, addresses: list[str]) -> list[str]:
+        """Resolve on-chain addresses to charity names, keeping their order."""
+        self._ensure_fresh()
+        if any(address.lower() not in self._name_by_address for address in addresses):
+            self._refresh_on_miss()
+
+        names = []
+        for address in addresses:
+            name = self._name_by_address.get(address.lower())
+            if name is None:
+                print(f"No charity name found for address {address}")
+                name = address
+            names.append(name)
+        return names
+
+    def unknown_names(self, names: list[str]) -> list[str]:
+        """Return the names that do not belong to any known charity."""
+        self._ensure_fresh()
+        if any(name not in self._address_by_name for name in names):
+            self._refresh_on_miss()
+        return [name for name in names if name not in self._address_by_name]
+
+    def addresses_for(self, names: list[str]) -> list[str]:
+        """Resolve charity names to addresses, keeping their order.
+
+        Raises KeyError for unknown names; check them with unknown_names() first.
+        """
+        unknown = self.unknown_names(names)
+        if unknown:
+            raise KeyError(f"Unknown charities: {', '.join(unknown)}")
+        return [self._address_by_name[name] for name in names]
+
+    def _ensure_fresh(self) -> None:
+        if self._loaded_at is None or time.monotonic() - self._loaded_at > self.max_age:
+            self.load()
+
+    def _refresh_on_miss(self) -> None:
+        if time.monotonic() - self._loaded_at > self.miss_refresh_interval:
+            self.load()
@@ -0,0 +1,128 @@
+from datetime import datetime, timedelta
+from sqlalchemy import or_, func, text, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session, sessionmaker
+from typing import Optional
+import json
+
+from .models import Base, ArticleCheckpoint, PortfolioCheckpoint, UserLease
+
+# Checkpoints let the matcher resume an article exactly where it stopped: the article
+# analysis and each user's decision are stored before anything is sent on chain, and
+# every transaction hash is stored as soon as it is sent.
+
+def create_checkpoint_tables(session_factory: sessionmaker) -> None:
+    engine = session_factory.kw["bind"]
+    Base.metadata.create_all(engine, tables=[ArticleCheckpoint.__table__, PortfolioCheckpoint.__table__, UserLease.__table__])
+    # Tables created before the coalescer moved into the database lack these
+    with engine.begin() as connection:
+        connection.execute(text("ALTER TABLE portfoliocheckpoint ADD COLUMN IF NOT EXISTS urgency FLOAT NOT NULL DEFAULT 0"))
+        connection.execute(text("ALTER TABLE portfoliocheckpoint ADD COLUMN IF NOT EXISTS decided_at TIMESTAMP NOT NULL DEFAULT now()"))
+        connection.execute(text("CREATE INDEX IF NOT EXISTS ix_portfoliocheckpoint_status_userid ON portfoliocheckpoint (status, userid)"))
+
+def get_article_checkpoint(db: Session, link: str) -> Optional[ArticleCheckpoint]:
+    return db.get(ArticleCheckpoint, link)
+
+def save_article_checkpoint(db: Session, link: str, analysis: Optional[dict]) -> None:
+    db.execute(
+        insert(ArticleCheckpoint)
+        .values(link=link, analysis=json.dumps(analysis))
+        .on_conflict_do_nothing(index_elements=["link"])
+    )
+
+def get_portfolio_checkpoint(db: Session, link: str, userid: str) -> Optional[PortfolioCheckpoint]:
+    return db.get(PortfolioCheckpoint, (link, userid))
+
+def save_portfolio_decision(db: Session, link: str, userid: str, decision: dict, urgency: float = 0) -> bool:
+    # The first decision wins; a resumed run reuses it instead of asking the model again.
+    # False when another worker stored its decision first, which the caller must use instead.
+    result = db.execute(
+        insert(PortfolioCheckpoint)
+        .values(link=link, userid=userid, status='decided', decision=json.dumps(decision), urgency=urgency)
+        .on_conflict_do_nothing(index_elements=["link", "userid"])
+    )
+    return result.rowcount == 1
+
+def update_portfolio_checkpoint(db: Session, link: str, userid: str, **fields) -> None:
+    db.query(PortfolioCheckpoint).filter(
+        PortfolioCheckpoint.link == link, PortfolioCheckpoint.userid == userid
+    ).update(fields)
+
+def clear_portfolio_tx(db: Session, userid: str, tx_hash: str) -> None:
+    # A transaction that reverted or was dropped did not happen; forgetting its hash lets
+    # the next attempt send it again. A coalesced hash is recorded on several links.
+    for column in (PortfolioCheckpoint.charities_tx, PortfolioCheckpoint.split_tx):
+        db.query(PortfolioCheckpoint).filter(
+            PortfolioCheckpoint.userid == userid, column == tx_hash
+        ).update({column: None}, synchronize_session=False)
+
+def get_queued_portfolio_checkpoints(db: Session, status: str = 'queued', userid: Optional[str] = None) -> list[PortfolioCheckpoint]:
+    # Decisions waiting to be coalesced or paid out, in the order they were decided
+    query = db.query(PortfolioCheckpoint).filter(PortfolioCheckpoint.status == status)
+    if userid is not None:
+        query = query.filter(PortfolioCheckpoint.userid == userid)
+    return query.order_by(PortfolioCheckpoint.decided_at, PortfolioCheckpoint.link).all()
+
+def get_payout_requests(db: Session) -> list:
+    # Payouts waiting to be sent, each with its urgency and how many seconds ago it was
+    # decided (in database time, so worker clocks do not matter)
+    waited = func.extract('epoch', func.now() - PortfolioCheckpoint.decided_at)
+    return (
+        db.query(PortfolioCheckpoint.userid, PortfolioCheckpoint.link, PortfolioCheckpoint.urgency, waited.label("waited"))
+        .filter(PortfolioCheckpoint.status == 'payout')
+        .all()
+    )
+
+def get_due_portfolio_users(db: Session, window_seconds: float, limit: Optional[int] = 100) -> list[str]:
+    # Users whose oldest queued change has waited at least window_seconds, longest waiting first
+    oldest = func.min(PortfolioCheckpoint.updated_at)
+    rows = (
+        db.query(PortfolioCheckpoint.userid)
+        .filter(PortfolioCheckpoint.status == 'queued')
+        .group_by(PortfolioCheckpoint.userid)
+        .having(oldest <= func.now() - timedelta(seconds=window_seconds))
+        .order_by(oldest)
+        .limit(limit)
+        .all()
+    )
+    return [row.userid for row in rows]
+
+def finish_queued_portfolio_checkpoints(db: Session, userid: str, links: list[str], status: str = 'queued', to_status: str = 'done') -> None:
+    if not links:
+        return
+    db.query(PortfolioCheckpoint).filter(
+        PortfolioCheckpoint.userid == userid,
+        PortfolioCheckpoint.link.in_(links),
+        PortfolioCheckpoint.status == status,
+    ).update({"status": to_status}, synchronize_session=False)
+
+def acquire_user_lease(db: Session, userid: str, worker_id: str, lease_seconds: float):
+    # Only one worker at a time may send a user's portfolio transactions. Returns the lease
+    # row (with committed_decided_at), or None while another worker holds it.
+    expires = func.now() + timedelta(seconds=lease_seconds)
+    return db.execute(
+        insert(UserLease)
+        .values(userid=userid, lease_owner=worker_id, lease_expires=expires)
+        .on_conflict_do_update(
+            index_elements=["userid"],
+            set_={"lease_owner": worker_id, "lease_expires": expires},
+            where=or_(
+                UserLease.lease_expires.is_(None),
+                UserLease.lease_expires < func.now(),
+                UserLease.lease_owner == worker_id,
+            ),
+        )
+        .returning(UserLease.userid, UserLease.committed_decided_at)
+    ).first()
+
+def release_user_lease(db: Session, userid: str, worker_id: str, committed_decided_at: Optional[datetime] = None) -> None:
+    values = {"lease_expires": None}
+    if committed_decided_at is not None:
+        # Never moves backwards, so an older decision can never be committed over a newer one
+        values["committed_decided_at"] = func.greatest(UserLease.committed_decided_at, committed_decided_at)
+    db.execute(
+        update(UserLease)
+        .where(UserLease.userid == userid)
+        .where(UserLease.lease_owner == worker_id)
+        .values(**values)
+    )
@@ -1,15 +1,53 @@
-from sqlalchemy.orm import Session
-from typing import Optional, List
-from .models import UserCategory, CharityCategory, Charity, UserPreferences, CharityAddress
+from sqlalchemy import func
+from sqlalchemy.orm import Session, sessionmaker
+from typing import Optional, List, Iterator
+from .models import Base, UserCategory, CharityCategory, Charity, UserPreferences, CharityAddress, UserPortfolio, IndexerState, Counter
+from .database import session_scope
 
 def get_users_for_category(db: Session, category: str) -> Optional[List[UserCategory]]:
     return db.query(UserCategory).filter(UserCategory.category == category).all()
 
+def get_users_for_category_page(db: Session, category: str, after: Optional[str] = None, limit: int = 500) -> List[UserCategory]:
+    # Keyset pagination on the (category, userid) primary key, so each page is an index range scan
+    query = db.query(UserCategory).filter(UserCategory.category == category)
+    if after is not None:
+        query = query.filter(UserCategory.userid > after)
+    return query.order_by(UserCategory.userid).limit(limit).all()
+
+def iter_users_for_category(session_factory: sessionmaker, category: str, batch_size: int = 500) -> Iterator[List[UserCategory]]:
+    # Yields subscribers page by page so callers never hold the whole category in memory.
+    # Each page is read in its own short session, so no connection stays checked out
+    # while the caller works through a page.
+    after = None
+    while True:
+        with session_scope(session_factory) as db:
+            page = get_users_for_category_page(db, category, after, batch_size)
+            db.expunge_all()
+        if not page:
+            return
+        yield page
+        if len(page) < batch_size:
+            return
+        after = page[-1].userid
+
+def stream_users_for_category(db: Session, category: str, batch_size: int = 1000) -> Iterator[UserCategory]:
+    # Server-side cursor: rows are fetched from Postgres batch_size at a time
+    return db.query(UserCategory).filter(UserCategory.category == category).yield_per(batch_size)
+
 def get_charities_for_category(db: Session, category: str)  -> Optional[List[Charity]]:
     # I want to return rows from Charity where there exists a row in CharityCategory with the same category and that charity name
 
     return db.query(Charity).join(CharityCategory, Charity.name == CharityCategory.charityname).filter(CharityCategory.category == category).all()
 
+def get_charities_for_category_page(db: Session, category: str, after: Optional[str] = None, limit: int = 500) -> List[Charity]:
+    query = db.query(Charity).join(CharityCategory, Charity.name == CharityCategory.charityname).filter(CharityCategory.category == category)
+    if after is not None:
+        query = query.filter(Charity.name > after)
+    return query.order_by(Charity.name).limit(limit).all()
+
+def stream_charities_for_category(db: Session, category: str, batch_size: int = 1000) -> Iterator[Charity]:
+    return db.query(Charity).join(CharityCategory, Charity.name == CharityCategory.charityname).filter(CharityCategory.category == category).yield_per(batch_size)
+
 def get_charity(db: Session, id: str) -> Optional[Charity]:
     return db.query(Charity).filter(Charity.name == id).first()
 
@@ -29,5 +67,28 @@ def create_user_preferences(db: Session, userId: str, preferences: UserPreferenc
 def get_names_of_charities(db: Session, addresses: list[str]) -> Optional[List[CharityAddress]]:
     return db.query(CharityAddress).filter(CharityAddress.address.in_(addresses)).all()
 
+def get_charity_names_by_address(db: Session, addresses: list[str]) -> dict[str, str]:
+    # Lowercased address -> name, whatever the case of the stored or given addresses
+    lowered = [address.lower() for address in addresses]
+    rows = db.query(func.lower(CharityAddress.address), CharityAddress.name).filter(func.lower(CharityAddress.address).in_(lowered))
+    return dict(rows.all())
+
 def get_addresses_of_charities(db: Session, names: list[str]) -> Optional[List[CharityAddress]]:
-    return db.query(CharityAddress).filter(CharityAddress.name.in_(names)).all()
\ No newline at end of file
+    return db.query(CharityAddress).filter(CharityAddress.name.in_(names)).all()
+
+def get_categories_for_user(db: Session, userId: str) -> List[str]:
+    return [category for (category,) in db.query(UserCategory.category).filter(UserCategory.userid == userId).order_by(UserCategory.category)]
+
+def get_counter(db: Session, userId: str) -> Optional[Counter]:
+    return db.query(Counter).filter(Counter.userid == userId).first()
+
+def get_user_portfolio(db: Session, userId: str) -> Optional[UserPortfolio]:
+    return db.query(UserPortfolio).filter(UserPortfolio.userid == userId.lower()).first()
+
+def get_indexer_state(db: Session, name: str) -> Optional[IndexerState]:
+    return db.query(IndexerState).filter(IndexerState.name == name).first()
+
+def create_indexer_tables(session_factory: sessionmaker) -> None:
+    # Written by the event indexer, but read by the matcher and the API, which create
+    # them too so they work (empty, and so never fresh) before the indexer first runs
+    Base.metadata.create_all(session_factory.kw["bind"], tables=[UserPortfolio.__table__, IndexerState.__table__])
\ No newline at end of file
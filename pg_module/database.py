@@ -1,19 +1,75 @@
 from sqlalchemy import create_engine
+from sqlalchemy.pool import NullPool
 from sqlalchemy.orm import sessionmaker, Session
-from typing import Generator
+from contextlib import contextmanager
+from typing import Generator, Iterator
 import dotenv
 
 import os
 dotenv.load_dotenv()
 
-engine = create_engine(
-    f"postgresql://{os.getenv('PG_USER')}:{os.getenv('PG_PASSWORD')}@{os.getenv('PG_HOST')}:{os.getenv('PG_PORT')}/{os.getenv('PG_DATABASE_NAME')}"
-)
+def pool_options() -> dict:
+    # Pooled engine shared by the API and the matcher. pre_ping replaces connections
+    # that Postgres dropped while they sat idle, and recycle retires them before
+    # server-side or load balancer idle timeouts kick in.
+    return dict(
+        pool_size=int(os.getenv('PG_POOL_SIZE', '5')),
+        max_overflow=int(os.getenv('PG_MAX_OVERFLOW', '10')),
+        pool_timeout=float(os.getenv('PG_POOL_TIMEOUT', '30')),
+        pool_recycle=int(os.getenv('PG_POOL_RECYCLE', '1800')),
+        pool_pre_ping=True,
+    )
+
+def make_engine(host: str):
+    return create_engine(
+        f"postgresql://{os.getenv('PG_USER')}:{os.getenv('PG_PASSWORD')}@{host}:{os.getenv('PG_PORT')}/{os.getenv('PG_DATABASE_NAME')}",
+        **pool_options(),
+    )
+
+engine = make_engine(os.getenv('PG_HOST'))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Optional read replica. Read-only paths use ReadSessionLocal, which falls back to
+# the primary when PG_REPLICA_HOST is not set.
+replica_engine = make_engine(os.getenv('PG_REPLICA_HOST')) if os.getenv('PG_REPLICA_HOST') else engine
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=replica_engine)
+
+def listen_connection(engine, channel: str):
+    # NOTIFY is only delivered to the session that ran LISTEN, so a listener keeps one
+    # connection for as long as it runs. It comes from a throwaway NullPool engine on
+    # the same URL: a connection from `engine` would hold one of its pool slots for the
+    # life of the process. Closing or invalidating the result closes the socket.
+    raw = create_engine(engine.url, poolclass=NullPool).raw_connection()
+    connection = raw.driver_connection
+    connection.autocommit = True
+    with connection.cursor() as cursor:
+        cursor.execute(f"LISTEN {channel}")
+    return raw
+
 def get_db() -> Generator[Session, None, None]:
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+def get_read_db() -> Generator[Session, None, None]:
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+@contextmanager
+def session_scope(session_factory: sessionmaker = SessionLocal) -> Iterator[Session]:
+    # One session per unit of work: commit on success, roll back on error, and
+    # always hand the connection back to the pool
+    db = session_factory()
+    try:
+        yield db
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
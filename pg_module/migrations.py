@@ -0,0 +1,50 @@
+from sqlalchemy import inspect, text
+from sqlalchemy.orm import sessionmaker
+
+from .models import CharityAddress, UserCategory
+
+# The API's copy of the models named the CharityAddress table 'charity_address',
+# while the matcher used 'charityaddress'. Both now share 'charityaddress'; a database
+# the API created still has its rows under the old name until this runs. It is
+# idempotent and runs at API startup, or by hand with `python -m pg_module.migrations`.
+LEGACY_CHARITY_ADDRESS_TABLE = 'charity_address'
+
+def migrate_charity_address(session_factory: sessionmaker) -> None:
+    engine = session_factory.kw["bind"]
+    tables = set(inspect(engine).get_table_names())
+    if LEGACY_CHARITY_ADDRESS_TABLE not in tables:
+        return
+
+    with engine.begin() as connection:
+        if CharityAddress.__tablename__ not in tables:
+            connection.execute(text(f"ALTER TABLE {LEGACY_CHARITY_ADDRESS_TABLE} RENAME TO {CharityAddress.__tablename__}"))
+            print(f"Renamed table {LEGACY_CHARITY_ADDRESS_TABLE} to {CharityAddress.__tablename__}")
+            return
+
+        # Both exist: copy over the pairs the new table lacks, keeping the old table
+        # for anything that still reads it
+        copied = connection.execute(text(
+            f"INSERT INTO {CharityAddress.__tablename__} (name, address) "
+            f"SELECT o.name, o.address FROM {LEGACY_CHARITY_ADDRESS_TABLE} o "
+            f"WHERE NOT EXISTS (SELECT 1 FROM {CharityAddress.__tablename__} n "
+            f"WHERE n.name = o.name AND lower(n.address) = lower(o.address))"
+        )).rowcount
+        if copied:
+            print(f"Copied {copied} rows from {LEGACY_CHARITY_ADDRESS_TABLE} into {CharityAddress.__tablename__}")
+
+def create_user_category_index(session_factory: sessionmaker) -> None:
+    # create_all only builds indexes along with a new table, so a usercategory table
+    # from before ix_usercategory_userid gets it here. Idempotent, runs at API startup.
+    engine = session_factory.kw["bind"]
+    if UserCategory.__tablename__ not in inspect(engine).get_table_names():
+        return
+    with engine.begin() as connection:
+        for index in UserCategory.__table__.indexes:
+            index.create(connection, checkfirst=True)
+
+
+if __name__ == "__main__":
+    from .database import SessionLocal
+
+    migrate_charity_address(SessionLocal)
+    create_user_category_index(SessionLocal)
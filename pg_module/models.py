@@ -1,6 +1,7 @@
-from sqlalchemy import Column, Text, ForeignKey, String, Boolean, Integer
+from sqlalchemy import Column, Text, String, Boolean, Integer, Float, BigInteger, Numeric, DateTime, Index, func
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.dialects.mysql import VARCHAR
+from sqlalchemy.dialects.postgresql import ARRAY
 
 
 Base = declarative_base()
@@ -17,6 +18,9 @@ class UserCategory(Base):
     category = Column(Text, nullable=False, primary_key=True)
     userid = Column(Text, nullable=False, primary_key=True)
 
+    # The primary key leads with category, so it cannot serve lookups by user
+    __table_args__ = (Index("ix_usercategory_userid", "userid"),)
+
 class Charity(Base):
     __tablename__ = 'charity'
 
@@ -39,8 +43,98 @@ class Counter(Base):
     countvalue = Column(Integer)
 
 class CharityAddress(Base):
+    # Was 'charity_address' in the API's models; see pg_module/migrations.py
     __tablename__ = 'charityaddress'
     
     id = Column(Integer, primary_key=True)
     name = Column(String(255), nullable=False)
-    address = Column(String(100), nullable=False)
\ No newline at end of file
+    address = Column(String(100), nullable=False)
+
+class UserPortfolio(Base):
+    # Local copy of each user's on-chain state, maintained by web3_utils/event_indexer.py
+    __tablename__ = 'userportfolio'
+
+    userid = Column(String(100), primary_key=True)  # lowercased address
+    topics = Column(ARRAY(Text), nullable=False, default=list)
+    charities = Column(ARRAY(Text), nullable=False, default=list)
+    percentages = Column(ARRAY(Integer), nullable=False, default=list)
+    balance = Column(Numeric(78, 0), nullable=False, default=0)  # wei
+    block_number = Column(BigInteger, nullable=False)
+
+class IndexerState(Base):
+    __tablename__ = 'indexerstate'
+
+    name = Column(String(100), primary_key=True)
+    last_block = Column(BigInteger, nullable=False)
+    updated_at = Column(DateTime, nullable=False)
+
+class ArticleWork(Base):
+    # Articles waiting for (or leased to) a matcher worker, see pg_module/work_queue.py
+    __tablename__ = 'articlework'
+
+    link = Column(Text, primary_key=True)
+    article = Column(Text, nullable=False)  # JSON of the feed entry
+    priority = Column(Float, nullable=False, default=0)  # estimated urgency
+    claim_rank = Column(Float, nullable=False)  # priority with aging folded in, see work_queue.claim_rank
+    status = Column(String(20), nullable=False, default='pending')  # pending, done, failed (out of attempts)
+    lease_owner = Column(String(100))
+    lease_expires = Column(DateTime)
+    attempts = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, nullable=False, server_default=func.now())
+
+    __table_args__ = (Index("ix_articlework_claim", claim_rank.desc(), postgresql_where=status == 'pending'),)
+
+class SubscriberBatchWork(Base):
+    # One batch of subscribers whose portfolios still need a decision for an analyzed article
+    __tablename__ = 'subscriberbatchwork'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    link = Column(Text, nullable=False, index=True)
+    analysis = Column(Text, nullable=False)  # JSON: article, category, similar charities, urgency
+    userids = Column(ARRAY(Text), nullable=False)
+    priority = Column(Float, nullable=False, default=0)  # urgency score
+    claim_rank = Column(Float, nullable=False)  # priority with aging folded in, see work_queue.claim_rank
+    status = Column(String(20), nullable=False, default='pending')  # pending, failed (out of attempts); deleted once done
+    lease_owner = Column(String(100))
+    lease_expires = Column(DateTime)
+    attempts = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, nullable=False, server_default=func.now())
+
+    __table_args__ = (Index("ix_subscriberbatchwork_claim", claim_rank.desc(), postgresql_where=status == 'pending'),)
+
+class ArticleCheckpoint(Base):
+    # Result of the per-article stages, so a restart does not repeat their LLM calls
+    __tablename__ = 'articlecheckpoint'
+
+    link = Column(Text, primary_key=True)
+    analysis = Column(Text, nullable=False)  # JSON, "null" when no portfolio needs a decision
+    updated_at = Column(DateTime, nullable=False, server_default=func.now())
+
+class PortfolioCheckpoint(Base):
+    # Progress of one user's portfolio decision for one article. The (link, userid) key is
+    # the idempotency key for the on-chain actions: a recorded transaction hash means the
+    # action was already sent and must only be awaited, never sent again.
+    __tablename__ = 'portfoliocheckpoint'
+
+    link = Column(Text, primary_key=True)
+    userid = Column(String(100), primary_key=True)
+    status = Column(String(20), nullable=False)  # decided, queued (waiting to be coalesced), payout (waiting to be paid out), done
+    decision = Column(Text, nullable=False)  # JSON: addresses, percentages, send_money
+    urgency = Column(Float, nullable=False, default=0)  # urgency score of the article
+    charities_tx = Column(String(66))
+    split_tx = Column(String(66))
+    decided_at = Column(DateTime, nullable=False, server_default=func.now())
+    updated_at = Column(DateTime, nullable=False, server_default=func.now(), onupdate=func.now())
+
+    # Queued changes and payouts are looked up by status, then by user
+    __table_args__ = (Index("ix_portfoliocheckpoint_status_userid", "status", "userid"),)
+
+class UserLease(Base):
+    # Per-user lease held by the matcher worker that is committing a user's queued portfolio
+    # changes or payout, see portfolio_coalescer.py
+    __tablename__ = 'userlease'
+
+    userid = Column(String(100), primary_key=True)
+    lease_owner = Column(String(100))
+    lease_expires = Column(DateTime)
+    committed_decided_at = Column(DateTime)  # decided_at of the newest decision committed on chain
@@ -0,0 +1,84 @@
+"""Throughput of the shared work queue as matcher workers are added.
+
+    python -m pg_module.queue_benchmark --url postgresql://... --workers 1 2 4 8 --items 400
+
+Each worker is a separate process that claims articles, holds each for --work-ms
+(standing in for the model calls that dominate a real article) and completes it,
+exactly as run_worker does. Everything happens in a scratch schema that is dropped
+afterwards, so running it against a live database does not disturb real workers.
+"""
+from multiprocessing import Process
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+import argparse
+import time
+
+from .database import session_scope
+from .work_queue import create_work_tables, enqueue_articles, claim_article, complete_article
+
+SCHEMA = "queue_benchmark"
+
+
+def scratch_sessions(url: str) -> sessionmaker:
+    engine = create_engine(url, connect_args={"options": f"-c search_path={SCHEMA}"})
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def worker(url: str, worker_id: str, work_seconds: float) -> None:
+    session_factory = scratch_sessions(url)
+    while True:
+        with session_scope(session_factory) as db:
+            work = claim_article(db, worker_id, lease_seconds=60)
+        if work is None:
+            return
+        time.sleep(work_seconds)
+        with session_scope(session_factory) as db:
+            complete_article(db, work.link, worker_id)
+
+
+def run(url: str, workers: int, items: int, work_seconds: float) -> float:
+    admin = create_engine(url)
+    with admin.begin() as connection:
+        connection.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        connection.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+    session_factory = scratch_sessions(url)
+    create_work_tables(session_factory)
+    with session_scope(session_factory) as db:
+        enqueue_articles(db, [{"link": f"https://example.com/{i}", "title": str(i)} for i in range(items)])
+
+    processes = [Process(target=worker, args=(url, f"bench-{i}", work_seconds)) for i in range(workers)]
+    started = time.perf_counter()
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    elapsed = time.perf_counter() - started
+
+    with session_scope(session_factory) as db:
+        done = db.execute(text("SELECT count(*) FROM articlework WHERE status = 'done'")).scalar()
+    with admin.begin() as connection:
+        connection.execute(text(f"DROP SCHEMA {SCHEMA} CASCADE"))
+    session_factory.kw["bind"].dispose()
+    admin.dispose()
+    if done != items:
+        raise RuntimeError(f"{done} of {items} items completed")
+    return items / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure work queue throughput by worker count")
+    parser.add_argument("--url", required=True, help="Database URL")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--items", type=int, default=400)
+    parser.add_argument("--work-ms", type=float, default=100)
+    args = parser.parse_args()
+
+    baseline = None
+    for workers in args.workers:
+        throughput = run(args.url, workers, args.items, args.work_ms / 1000)
+        baseline = baseline or throughput / workers
+        print(f"{workers:3} workers: {throughput:8.1f} items/s  ({throughput / (baseline * workers):.0%} of linear)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+from array import array
+from collections.abc import Sequence
+from itertools import groupby
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+from typing import Iterable, Iterator
+import heapq
+import json
+import time
+
+from .models import UserCategory
+from .database import session_scope, listen_connection
+
+NOTIFY_CHANNEL = "usercategory_changed"
+
+# Row-level changes are pushed as JSON payloads; TRUNCATE has no rows, so it asks
+# listeners for a full reload instead.
+NOTIFY_TRIGGER_SQL = """
+CREATE OR REPLACE FUNCTION notify_usercategory_changed() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'TRUNCATE' THEN
+        PERFORM pg_notify('usercategory_changed', json_build_object('op', 'TRUNCATE')::text);
+        RETURN NULL;
+    END IF;
+    IF TG_OP IN ('DELETE', 'UPDATE') THEN
+        PERFORM pg_notify('usercategory_changed', json_build_object('op', 'DELETE', 'category', OLD.category, 'userid', OLD.userid)::text);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM pg_notify('usercategory_changed', json_build_object('op', 'INSERT', 'category', NEW.category, 'userid', NEW.userid)::text);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS usercategory_changed ON usercategory;
+CREATE TRIGGER usercategory_changed AFTER INSERT OR UPDATE OR DELETE ON usercategory
+    FOR EACH ROW EXECUTE FUNCTION notify_usercategory_changed();
+
+DROP TRIGGER IF EXISTS usercategory_truncated ON usercategory;
+CREATE TRIGGER usercategory_truncated AFTER TRUNCATE ON usercategory
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_usercategory_changed();
+"""
+
+def install_notify_trigger(session_factory: sessionmaker) -> None:
+    with session_scope(session_factory) as db:
+        db.execute(text(NOTIFY_TRIGGER_SQL))
+
+
+class SubscriberIds(Sequence):
+    """A sorted, read-only list of user IDs packed into one bytes blob.
+
+    The IDs are stored UTF-8 encoded back to back, with an array of where each one
+    ends, so an ID costs its length plus 4 bytes instead of a str object and a tuple
+    slot (about 100 bytes for an address). Indexing and slicing decode only the IDs
+    asked for. UTF-8 keeps code point order, so the blob sorts like the strings.
+    """
+
+    __slots__ = ("_data", "_ends")
+
+    def __init__(self, ids: Iterable[str] = ()):
+        # ids must already be sorted and free of duplicates
+        data = bytearray()
+        ends = array("Q")
+        for userid in ids:
+            data += userid.encode()
+            ends.append(len(data))
+        self._data = bytes(data)
+        self._ends = array("I", ends) if len(data) < 2**32 else ends
+
+    def __len__(self) -> int:
+        return len(self._ends)
+
+    def _decode(self, i: int) -> str:
+        start = self._ends[i - 1] if i else 0
+        return self._data[start:self._ends[i]].decode()
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return tuple(self._decode(j) for j in range(*i.indices(len(self))))
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("subscriber index out of range")
+        return self._decode(i)
+
+    def __iter__(self) -> Iterator[str]:
+        start = 0
+        for end in self._ends:
+            yield self._data[start:end].decode()
+            start = end
+
+    def merged(self, added: set[str], removed: set[str]) -> "SubscriberIds":
+        """A copy with added inserted and removed taken out, built in one ordered pass."""
+        def ids():
+            previous = None
+            for userid in heapq.merge(self, sorted(added)):
+                if userid != previous and userid not in removed:
+                    yield userid
+                previous = userid
+        return SubscriberIds(ids())
+
+
+EMPTY = SubscriberIds()
+
+
+class SubscriberIndex:
+    """In-memory category -> subscriber user ID index.
+
+    The index is loaded once and then kept fresh by draining LISTEN/NOTIFY messages
+    on every refresh(), so subscriber lookups never touch Postgres. A full reload
+    still happens every max_age seconds in case notifications were missed.
+
+    Each category's subscribers are kept packed in a SubscriberIds, so the index costs
+    roughly the bytes of the IDs themselves rather than a Python string per
+    subscription. A change replaces a category's SubscriberIds instead of mutating it,
+    so a batches() iterator already running keeps a consistent snapshot.
+    """
+
+    def __init__(self, session_factory: sessionmaker, max_age: float = 900):
+        self.session_factory = session_factory
+        self.max_age = max_age
+        self._subscribers: dict[str, SubscriberIds] = {}
+        self._listener = None
+        self._loaded_at = 0.0
+
+    def load(self) -> None:
+        # Start listening before the snapshot so changes committed during the load
+        # are replayed on the next refresh rather than lost
+        self._listen()
+
+        # Ordered by category, so each one arrives in a run and is packed as it streams
+        # in, without ever holding the rows as Python strings. Byte order (COLLATE "C")
+        # rather than the database's collation, to match how Python sorts strings.
+        subscribers = {}
+        with session_scope(self.session_factory) as db:
+            rows = (
+                db.query(UserCategory.category, UserCategory.userid)
+                .order_by(UserCategory.category, UserCategory.userid.collate("C"))
+                .yield_per(5000)
+            )
+            for category, members in groupby(rows, key=lambda row: row[0]):
+                subscribers[category] = SubscriberIds(userid for _, userid in members)
+
+        self._subscribers = subscribers
+        self._loaded_at = time.monotonic()
+        print(f"Loaded subscriber index: {sum(map(len, self._subscribers.values()))} subscriptions in {len(self._subscribers)} categories")
+
+    def refresh(self) -> None:
+        """Apply subscription changes committed since the last refresh."""
+        if self._listener is None or time.monotonic() - self._loaded_at > self.max_age:
+            self.load()
+            return
+
+        connection = self._listener.driver_connection
+        try:
+            connection.poll()
+        except Exception as e:
+            print(f"Lost subscriber index listener, reloading: {e}")
+            self._close_listener()
+            self.load()
+            return
+
+        # category -> (added, removed); later changes to a user win over earlier ones
+        touched: dict[str, tuple[set[str], set[str]]] = {}
+        while connection.notifies:
+            notify = connection.notifies.pop(0)
+            try:
+                change = json.loads(notify.payload)
+            except ValueError:
+                change = {"op": "TRUNCATE"}
+
+            if change.get("op") == "TRUNCATE":
+                connection.notifies.clear()
+                self.load()
+                return
+
+            added, removed = touched.setdefault(change["category"], (set(), set()))
+            if change["op"] == "INSERT":
+                added.add(change["userid"])
+                removed.discard(change["userid"])
+            else:
+                removed.add(change["userid"])
+                added.discard(change["userid"])
+
+        for category, (added, removed) in touched.items():
+            ids = self._subscribers.get(category, SubscriberIds()).merged(added, removed)
+            if ids:
+                self._subscribers[category] = ids
+            else:
+                self._subscribers.pop(category, None)
+
+    def subscribers(self, category: str) -> SubscriberIds:
+        return self._subscribers.get(category, EMPTY)
+
+    def batches(self, category: str, batch_size: int = 500) -> Iterator[tuple[str, ...]]:
+        """Yields the category's subscribers batch_size at a time, decoding each batch only when it is reached."""
+        ids = self.subscribers(category)
+        for start in range(0, len(ids), batch_size):
+            yield ids[start:start + batch_size]
+
+    def _listen(self) -> None:
+        if self._listener is not None:
+            return
+        self._listener = listen_connection(self.session_factory.kw["bind"], NOTIFY_CHANNEL)
+
+    def _close_listener(self) -> None:
+        try:
+            self._listener.invalidate()
+        except Exception:
+            pass
+        self._listener = None
@@ -0,0 +1,18 @@
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+import json
+
+# Per-user events pushed to connected app clients (see api/event_broker.py). They are
+# sent with pg_notify inside the writer's transaction, so Postgres delivers them only
+# once that transaction commits, and never for one that rolled back.
+USER_EVENTS_CHANNEL = "user_events"
+
+# NOTIFY payloads must stay under 8000 bytes
+MAX_PAYLOAD_BYTES = 7900
+
+def notify_user_event(db: Session, userid: str, event_type: str, **data) -> None:
+    payload = json.dumps({"type": event_type, "userid": userid.lower(), **data})
+    if len(payload.encode()) > MAX_PAYLOAD_BYTES:
+        # Too big to push; the client refetches what changed
+        payload = json.dumps({"type": event_type, "userid": userid.lower(), "truncated": True})
+    db.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": USER_EVENTS_CHANNEL, "payload": payload})
@@ -0,0 +1,222 @@
+from datetime import timedelta
+from sqlalchemy import or_, func, update, delete, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session, sessionmaker
+from typing import Iterable, Optional
+import json
+import threading
+
+from .models import Base, ArticleWork, SubscriberBatchWork
+from .database import session_scope
+
+# Work table shared by matcher workers on one or several machines. Items are claimed
+# with SELECT ... FOR UPDATE SKIP LOCKED, so concurrent workers never block on or
+# double-claim a row. A claim is a lease: it is kept alive by heartbeats, and once it
+# expires (the worker died) the item becomes claimable again. All times are database
+# time, so worker clocks do not matter.
+
+# Items claimed this many times without finishing are no longer claimed, and
+# fail_exhausted_work moves them to 'failed' once their last lease has run out
+MAX_ATTEMPTS = 3
+
+# A batch with users that failed is claimable again after this long, with only those users
+RETRY_DELAY_SECONDS = 60
+
+# Claims take the highest priority first, where waiting adds this much priority per
+# minute so low-urgency items are not starved by a stream of urgent ones
+AGING_PER_MINUTE = 0.1
+
+# Subscriber batches added to the session between flushes when an article fans out
+BATCH_FLUSH_SIZE = 100
+
+# Done articles are kept this long, so a feed that still lists one does not queue it again
+DONE_RETENTION_DAYS = 7
+
+def claim_rank(priority, created_at=None):
+    # Every pending item ages at the same rate, so ordering by priority + age * aging is
+    # the same as ordering by priority - created_at * aging. That value never changes,
+    # so it is stored and indexed instead of being computed for every row on each claim.
+    if created_at is None:
+        # The same clock as the created_at default, so ranks of old and new rows compare
+        created_at = func.localtimestamp()
+    return priority - func.extract('epoch', created_at) * AGING_PER_MINUTE / 60
+
+def create_work_tables(session_factory: sessionmaker) -> None:
+    engine = session_factory.kw["bind"]
+    Base.metadata.create_all(engine, tables=[ArticleWork.__table__, SubscriberBatchWork.__table__])
+    # Tables created before claims were prioritized lack the columns and the claim index
+    with engine.begin() as connection:
+        for model in (ArticleWork, SubscriberBatchWork):
+            table = model.__tablename__
+            connection.execute(text(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS priority FLOAT NOT NULL DEFAULT 0"))
+            connection.execute(text(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS claim_rank FLOAT"))
+            connection.execute(
+                update(model)
+                .where(model.claim_rank.is_(None))
+                .values(claim_rank=claim_rank(model.priority, model.created_at))
+            )
+            connection.execute(text(f"ALTER TABLE {table} ALTER COLUMN claim_rank SET NOT NULL"))
+            for index in model.__table__.indexes:
+                index.create(connection, checkfirst=True)
+
+def enqueue_articles(db: Session, articles: list[dict]) -> None:
+    # Links already in the table (pending, in progress or done) are ignored, so every
+    # worker can poll the feeds without creating duplicates
+    if not articles:
+        return
+    db.execute(
+        insert(ArticleWork)
+        .values([
+            {
+                "link": article["link"],
+                "article": json.dumps(article),
+                "priority": article.get("urgency_estimate", 0),
+                "claim_rank": claim_rank(article.get("urgency_estimate", 0)),
+            }
+            for article in articles
+        ])
+        .on_conflict_do_nothing(index_elements=["link"])
+    )
+
+def _claim(db: Session, model, worker_id: str, lease_seconds: float):
+    item = (
+        db.query(model)
+        .filter(model.status == 'pending')
+        .filter(model.attempts < MAX_ATTEMPTS)
+        .filter(or_(model.lease_expires.is_(None), model.lease_expires < func.now()))
+        # Served by the partial index on claim_rank over pending rows
+        .order_by(model.claim_rank.desc())
+        .with_for_update(skip_locked=True)
+        .limit(1)
+        .first()
+    )
+    if item is None:
+        return None
+
+    item.lease_owner = worker_id
+    item.lease_expires = func.now() + timedelta(seconds=lease_seconds)
+    item.attempts += 1
+    db.flush()
+    db.refresh(item)
+    # Detach with everything loaded, so the claim stays readable after the commit
+    db.expunge(item)
+    return item
+
+def claim_article(db: Session, worker_id: str, lease_seconds: float) -> Optional[ArticleWork]:
+    return _claim(db, ArticleWork, worker_id, lease_seconds)
+
+def claim_subscriber_batch(db: Session, worker_id: str, lease_seconds: float) -> Optional[SubscriberBatchWork]:
+    return _claim(db, SubscriberBatchWork, worker_id, lease_seconds)
+
+def extend_lease(db: Session, model, key, worker_id: str, lease_seconds: float) -> bool:
+    # Only the current owner can extend; False means the lease was lost to another worker
+    result = db.execute(
+        update(model)
+        .where(model.__mapper__.primary_key[0] == key)
+        .where(model.lease_owner == worker_id)
+        .where(model.status == 'pending')
+        .values(lease_expires=func.now() + timedelta(seconds=lease_seconds))
+    )
+    return result.rowcount == 1
+
+def complete_article(db: Session, link: str, worker_id: str, analysis: Optional[dict] = None, batches: Iterable = ()) -> bool:
+    # Fanning out the subscriber batches and finishing the article happen in one
+    # transaction, so a crash in between cannot lose or duplicate batches
+    result = db.execute(
+        update(ArticleWork)
+        .where(ArticleWork.link == link)
+        .where(ArticleWork.lease_owner == worker_id)
+        .where(ArticleWork.status == 'pending')
+        .values(status='done', lease_expires=None)
+    )
+    if result.rowcount != 1:
+        # Our lease expired and another worker took the article over
+        return False
+    priority = analysis["urgency_score"] if analysis else 0
+    payload = json.dumps(analysis)
+    for i, userids in enumerate(batches, 1):
+        db.add(SubscriberBatchWork(
+            link=link, analysis=payload, userids=list(userids), priority=priority, claim_rank=claim_rank(priority)
+        ))
+        if i % BATCH_FLUSH_SIZE == 0:
+            # Flushed rows are only weakly held by the session, so a category with
+            # millions of subscribers is never in memory all at once
+            db.flush()
+    return True
+
+def complete_subscriber_batch(db: Session, batch_id: int, worker_id: str) -> bool:
+    # A finished batch is of no further use, so it is deleted rather than kept as 'done'
+    result = db.execute(
+        delete(SubscriberBatchWork)
+        .where(SubscriberBatchWork.id == batch_id)
+        .where(SubscriberBatchWork.lease_owner == worker_id)
+        .where(SubscriberBatchWork.status == 'pending')
+    )
+    # False when our lease expired and another worker took the batch over
+    return result.rowcount == 1
+
+def release_subscriber_batch(db: Session, batch_id: int, worker_id: str, userids: list[str]) -> bool:
+    # Hands a batch back with only the users still to do. Its attempts are kept, so a batch
+    # that keeps failing ends up 'failed' instead of being retried forever.
+    result = db.execute(
+        update(SubscriberBatchWork)
+        .where(SubscriberBatchWork.id == batch_id)
+        .where(SubscriberBatchWork.lease_owner == worker_id)
+        .where(SubscriberBatchWork.status == 'pending')
+        .values(userids=list(userids), lease_expires=func.now() + timedelta(seconds=RETRY_DELAY_SECONDS))
+    )
+    return result.rowcount == 1
+
+def fail_exhausted_work(db: Session) -> int:
+    # Items out of attempts would otherwise stay 'pending' forever without being claimed
+    failed = 0
+    for model in (ArticleWork, SubscriberBatchWork):
+        failed += db.execute(
+            update(model)
+            .where(model.status == 'pending')
+            .where(model.attempts >= MAX_ATTEMPTS)
+            .where(or_(model.lease_expires.is_(None), model.lease_expires < func.now()))
+            .values(status='failed', lease_expires=None)
+        ).rowcount
+    return failed
+
+def purge_done_work(db: Session, retention_days: float = DONE_RETENTION_DAYS) -> int:
+    # Done articles only matter while a feed may still list them
+    return db.execute(
+        delete(ArticleWork)
+        .where(ArticleWork.status == 'done')
+        .where(ArticleWork.created_at < func.now() - timedelta(days=retention_days))
+    ).rowcount
+
+
+class LeaseHeartbeat:
+    """Extends a lease from a background thread while the owner works on the item."""
+
+    def __init__(self, session_factory: sessionmaker, model, key, worker_id: str, lease_seconds: float):
+        self.session_factory = session_factory
+        self.model = model
+        self.key = key
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._beat, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def _beat(self):
+        while not self._stop.wait(self.lease_seconds / 3):
+            try:
+                with session_scope(self.session_factory) as db:
+                    if not extend_lease(db, self.model, self.key, self.worker_id, self.lease_seconds):
+                        print(f"Lost lease on {self.model.__tablename__} {self.key}")
+                        self.lost = True
+                        return
+            except Exception as e:
+                print(f"Error extending lease on {self.model.__tablename__} {self.key}: {e}")
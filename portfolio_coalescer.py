@@ -0,0 +1,96 @@
+import json
+
+from pg_module import (
+    session_scope,
+    get_queued_portfolio_checkpoints,
+    get_due_portfolio_users,
+    acquire_user_lease,
+    release_user_lease,
+)
+
+
+def merge_decisions(queued, committed_decided_at=None):
+    """Fold a user's queued decisions into the one change to send.
+
+    queued holds checkpoints (anything with link, decided_at and decision) in any order.
+    Decisions no newer than committed_decided_at, the newest one already on chain, are
+    stale: sending them would undo a newer change. Returns (latest, fresh, stale), where
+    latest is the newest fresh decision, or None when every decision is stale.
+    """
+    ordered = sorted(queued, key=lambda checkpoint: (checkpoint.decided_at, checkpoint.link))
+    stale = [c for c in ordered if committed_decided_at is not None and c.decided_at <= committed_decided_at]
+    fresh = [c for c in ordered if c not in stale]
+    return (fresh[-1] if fresh else None), fresh, stale
+
+
+class PortfolioCoalescer:
+    """Commits each user's queued portfolio changes once their window has passed.
+
+    Queued decisions are portfoliocheckpoint rows with status 'queued', so every matcher
+    worker sees the same queue and nothing has to be restored after a restart. When a
+    burst of related articles produces several decisions for the same user, only the
+    newest is sent, in a single setCharities, once the oldest has waited `window` seconds.
+
+    A user is committed under a per-user lease, so two workers never send for the same
+    user at once, and the lease row remembers the newest decision committed so far, so a
+    late commit can never put an older allocation back on chain.
+
+    commit(user_id, addresses, percentages, checkpoints) sends the change for the fresh
+    checkpoints; finish(user_id, checkpoints) is then told about every checkpoint that was
+    folded in or skipped as stale.
+    """
+
+    def __init__(self, session_factory, worker_id, commit, finish, window: float = 600, lease_seconds: float = 600):
+        self.session_factory = session_factory
+        self.worker_id = worker_id
+        self.commit = commit
+        self.finish = finish
+        self.window = window
+        # Long enough to wait out a receipt or two; the lease is released as soon as the commit ends
+        self.lease_seconds = lease_seconds
+
+    def flush(self, user_id: str) -> bool:
+        """Commit a user's queued changes now. False when another worker holds the user."""
+        with session_scope(self.session_factory) as db:
+            lease = acquire_user_lease(db, user_id, self.worker_id, self.lease_seconds)
+        if lease is None:
+            return False
+
+        committed_decided_at = None
+        try:
+            with session_scope(self.session_factory) as db:
+                queued = get_queued_portfolio_checkpoints(db, userid=user_id)
+                for checkpoint in queued:
+                    db.expunge(checkpoint)
+            if not queued:
+                return True
+
+            latest, fresh, stale = merge_decisions(queued, lease.committed_decided_at)
+            if stale:
+                print(f"Skipping {len(stale)} decisions for user {user_id} that are older than the one on chain")
+            if latest is not None:
+                decision = json.loads(latest.decision)
+                self.commit(user_id, decision["addresses"], decision["percentages"], fresh)
+                committed_decided_at = latest.decided_at
+            self.finish(user_id, queued)
+        finally:
+            with session_scope(self.session_factory) as db:
+                release_user_lease(db, user_id, self.worker_id, committed_decided_at)
+        return True
+
+    def flush_due(self) -> None:
+        """Commit every user whose oldest queued change has waited out the window."""
+        self._flush_users(self.window, limit=100)
+
+    def flush_all(self) -> None:
+        self._flush_users(0, limit=None)
+
+    def _flush_users(self, window, limit):
+        with session_scope(self.session_factory) as db:
+            due = get_due_portfolio_users(db, window, limit)
+        for user_id in due:
+            try:
+                self.flush(user_id)
+            except Exception as e:
+                # Still queued, so the next flush tries again
+                print(f"Error committing portfolio for user {user_id}: {e}")
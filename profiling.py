@@ -0,0 +1,120 @@
+import collections
+import os
+import signal
+import sys
+import threading
+import tracemalloc
+from datetime import datetime
+
+
+class SamplingProfiler:
+    """Low-overhead wall-clock profiler that can be switched on and off while running.
+
+    While enabled, a background thread samples the stack of every thread each
+    `interval` seconds, and tracemalloc records allocations. dump() writes what was
+    collected since the previous dump to `directory`:
+      - <time>-<label>.collapsed: one "frame;frame;frame count" line per stack, ready
+        for flamegraph.pl or speedscope
+      - <time>-<label>.alloc.txt: top allocation sites, and the growth since the last dump
+    When disabled nothing runs and dump() returns immediately.
+    """
+
+    def __init__(self, directory="profiles", interval=0.01, top_allocations=25):
+        self.directory = directory
+        self.interval = interval
+        self.top_allocations = top_allocations
+        self.enabled = False
+        self._stacks = collections.Counter()
+        # Guards enabling, disabling, sampling and dumping against each other
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._last_snapshot = None
+
+    def start(self) -> None:
+        with self._lock:
+            if self.enabled:
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            tracemalloc.start()
+            self._last_snapshot = None
+            self._stacks.clear()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._sample, daemon=True)
+            self._thread.start()
+            self.enabled = True
+        print(f"Profiler started, writing to {self.directory}/")
+
+    def stop(self) -> None:
+        with self._lock:
+            if not self.enabled:
+                return
+            self.dump("final")
+            self.enabled = False
+            self._stop.set()
+            tracemalloc.stop()
+        self._thread.join()
+        print("Profiler stopped")
+
+    def toggle(self) -> None:
+        if self.enabled:
+            self.stop()
+        else:
+            self.start()
+
+    def install_signal_handler(self, signum=getattr(signal, "SIGUSR1", None)) -> None:
+        """Toggle profiling with `kill -USR1 <pid>`. Must be called from the main thread."""
+        if signum is None:
+            print("No SIGUSR1 on this platform, profiler can only be toggled from code")
+            return
+        # The handler interrupts the main thread wherever it is, possibly inside dump(),
+        # so the actual work happens on a thread of its own
+        signal.signal(signum, lambda *_: threading.Thread(target=self.toggle, daemon=True).start())
+
+    def _sample(self) -> None:
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            with self._lock:
+                if self._stop.is_set():
+                    return
+                for thread_id, frame in frames.items():
+                    if thread_id == own_id:
+                        continue
+                    stack = []
+                    while frame is not None:
+                        code = frame.f_code
+                        stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                        frame = frame.f_back
+                    self._stacks[";".join(reversed(stack))] += 1
+
+    def dump(self, label="cycle") -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            if self.enabled:
+                self._write(label)
+
+    def _write(self, label) -> None:
+        prefix = os.path.join(self.directory, f"{datetime.now():%Y%m%d-%H%M%S}-{label}")
+
+        stacks, self._stacks = self._stacks, collections.Counter()
+        with open(f"{prefix}.collapsed", "w") as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+        )
+        with open(f"{prefix}.alloc.txt", "w") as f:
+            current, peak = tracemalloc.get_traced_memory()
+            f.write(f"Traced memory: {current / 2**20:.1f} MiB, peak {peak / 2**20:.1f} MiB\n\n")
+            f.write("Top allocation sites:\n")
+            for stat in snapshot.statistics("lineno")[: self.top_allocations]:
+                f.write(f"{stat}\n")
+            if self._last_snapshot is not None:
+                f.write("\nGrowth since the previous dump:\n")
+                for stat in snapshot.compare_to(self._last_snapshot, "lineno")[: self.top_allocations]:
+                    f.write(f"{stat}\n")
+        self._last_snapshot = snapshot
+        print(f"Profile written to {prefix}.collapsed ({sum(stacks.values())} samples) and {prefix}.alloc.txt")
@@ -0,0 +1,254 @@
+from news_charity_matcher import NewsCharityMatcher
+from pg_module import SessionLocal, create_indexer_tables
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+import argparse
+import itertools
+import json
+import os
+import threading
+import time
+import uuid
+
+# Rough blended OpenAI prices in USD per million tokens, for the cost summary only
+PROMPT_PRICE = float(os.getenv("BACKFILL_PROMPT_USD_PER_M", "0.15"))
+CACHED_PRICE = float(os.getenv("BACKFILL_CACHED_USD_PER_M", "0.075"))
+COMPLETION_PRICE = float(os.getenv("BACKFILL_COMPLETION_USD_PER_M", "0.60"))
+
+
+def read_rows(path, batch_size):
+    # The file is closed when the rows run out or the caller stops early
+    if path.endswith(".parquet"):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise SystemExit("Reading Parquet archives needs pyarrow (pip install pyarrow)")
+        with pq.ParquetFile(path) as parquet_file:
+            for batch in parquet_file.iter_batches(batch_size=batch_size):
+                yield from batch.to_pylist()
+    else:
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def read_archive(path, start=0, batch_size=1000):
+    """Yield (position, article) from a JSONL or Parquet archive, one row at a time.
+
+    Rows need at least title and link; description and content are used when present.
+    """
+    for position, row in enumerate(itertools.islice(read_rows(path, batch_size), start, None), start):
+        yield position, {
+            "title": row["title"],
+            "description": row.get("description") or "",
+            "link": row["link"],
+            **({"content": row["content"]} if row.get("content") else {}),
+        }
+
+
+def load_checkpoint(path, source):
+    try:
+        with open(path) as f:
+            checkpoint = json.load(f)
+    except FileNotFoundError:
+        return None
+    if checkpoint["source"] != source:
+        raise SystemExit(f"{path} belongs to a backfill of {checkpoint['source']}; pass --restart to start over")
+    return checkpoint
+
+
+def save_checkpoint(path, checkpoint):
+    with open(path + ".tmp", "w") as f:
+        json.dump(checkpoint, f)
+    os.replace(path + ".tmp", path)
+
+
+class Backfill:
+    """Streams an archive through the matcher as fast as the APIs allow.
+
+    Articles are analyzed and their portfolio decisions made concurrently, and at most
+    twice `concurrency` are held at once, so memory stays bounded however large the
+    archive is. Results are consumed in archive order on the main thread, which also
+    commits coalesced changes and releases payouts, and which makes the saved position
+    exact: everything before it is done.
+    Analysis always runs afresh (stored article checkpoints are ignored), so new
+    categories and prompts take effect.
+
+    In dry-run mode each portfolio decision is written to the output file as soon as
+    it is made, one line per decision, and nothing is sent on chain. A resumed dry run
+    may repeat the decisions of the articles that were in flight when it stopped.
+    Otherwise portfolios are updated like the live matcher does, through per-user
+    checkpoints kept under backfill/<run>/<link>, so resuming never resends a
+    transaction and a backfill never reuses (or is skipped because of) a decision the
+    live matcher made for the same article.
+    """
+
+    def __init__(self, matcher, dry_run, output, concurrency, run_id):
+        self.matcher = matcher
+        self.dry_run = dry_run
+        self.output = output
+        self.concurrency = concurrency
+        self.run_id = run_id
+        self.stats = {"articles": 0, "relevant": 0, "decisions": 0, "errors": 0}
+        self._out = None
+        self._out_lock = threading.Lock()
+
+    def write_decision(self, line):
+        with self._out_lock:
+            self._out.write(json.dumps(line) + "\n")
+            self.stats["decisions"] += 1
+
+    def process(self, article):
+        """Per-article work run on the pool: analysis, then the portfolio decisions.
+
+        Dry runs write the decisions out; real runs apply them like the live matcher, so
+        the model calls for `concurrency` articles are in flight at once either way.
+        """
+        try:
+            analysis = self.matcher.analyze_article(article)
+        except Exception as e:
+            print(f"Error analyzing {article['link']}: {e}")
+            return article, None, True
+        if analysis is None:
+            return article, None, False
+        if self.dry_run:
+            return article, analysis, self.write_decisions(article, analysis)
+
+        unfinished = self.matcher.update_user_portfolios(
+            self.matcher.subscriber_index.batches(analysis["category"]),
+            analysis["category"],
+            analysis["similar_charities"],
+            article,
+            analysis["urgency_score"],
+            checkpoint_link=f"backfill/{self.run_id}/{article['link']}",
+        )
+        if unfinished:
+            print(f"{len(unfinished)} portfolios failed for {article['link']}")
+        return article, analysis, bool(unfinished)
+
+    def write_decisions(self, article, analysis):
+        """Decide for every subscriber and write each decision out. True when any failed."""
+        context = self.matcher.portfolio_article_context(
+            article, analysis["category"], analysis["similar_charities"], analysis["urgency_score"]
+        )
+        use_index = self.matcher.portfolio_index_is_fresh()
+        about = {
+            "link": article["link"],
+            "title": article["title"],
+            "category": analysis["category"],
+            "urgency_score": analysis["urgency_score"],
+            "charities": [charity["name"] for charity in analysis["similar_charities"]],
+        }
+        failed = False
+        for user_id in self.matcher.subscriber_index.subscribers(analysis["category"]):
+            try:
+                decision = self.matcher.decide_portfolio(user_id, context, use_index)
+            except Exception as e:
+                print(f"Error deciding portfolio for user {user_id}: {e}")
+                failed = True
+                continue
+            if decision is not None:
+                self.write_decision({**about, "userid": user_id, **decision})
+        return failed
+
+    def finish(self, article, analysis, failed):
+        self.stats["articles"] += 1
+        self.stats["errors"] += failed
+        if analysis is None:
+            return
+        self.stats["relevant"] += 1
+
+        if not self.dry_run:
+            self.matcher.coalescer.flush_due()
+            self.matcher.payouts.release_due()
+
+    def run(self, articles, checkpoint, checkpoint_path, checkpoint_every):
+        window = deque()
+        with ThreadPoolExecutor(self.concurrency) as pool, open(self.output, "a") as self._out:
+            def drain_one():
+                self.finish(*window.popleft().result())
+                checkpoint["position"] += 1
+                if checkpoint["position"] % checkpoint_every == 0:
+                    with self._out_lock:
+                        self._out.flush()
+                    save_checkpoint(checkpoint_path, {**checkpoint, "stats": self.stats})
+                    print(f"Backfilled {checkpoint['position']} articles")
+
+            try:
+                for _, article in articles:
+                    window.append(pool.submit(self.process, article))
+                    if len(window) >= self.concurrency * 2:
+                        drain_one()
+                while window:
+                    drain_one()
+            finally:
+                # Also on Ctrl-C or an error, so a resume neither repeats nor skips articles
+                for future in window:
+                    future.cancel()
+                with self._out_lock:
+                    self._out.flush()
+                save_checkpoint(checkpoint_path, {**checkpoint, "stats": self.stats})
+
+    def summary(self, elapsed):
+        usage = self.matcher.token_usage
+        cost = (
+            (usage["prompt_tokens"] - usage["cached_tokens"]) * PROMPT_PRICE
+            + usage["cached_tokens"] * CACHED_PRICE
+            + usage["completion_tokens"] * COMPLETION_PRICE
+        ) / 1_000_000
+        articles = max(1, self.stats["articles"])
+        return (
+            f"Backfilled {self.stats['articles']} articles in {elapsed:.0f}s "
+            f"({self.stats['articles'] / max(elapsed, 1e-9):.2f} articles/s), "
+            f"{self.stats['relevant']} relevant, {self.stats['errors']} errors"
+            + (f", {self.stats['decisions']} portfolio decisions" if self.dry_run else "")
+            + f"\nOpenAI: {usage['calls']} calls, {usage['prompt_tokens']} prompt tokens "
+            f"({usage['cached_tokens']} cached), {usage['completion_tokens']} completion tokens, "
+            f"~${cost:.4f} (~${cost / articles:.5f} per article)"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run an archive of articles through the matcher")
+    parser.add_argument("archive", help="JSONL or .parquet file of articles (title, link, description, content)")
+    parser.add_argument("--dry-run", action="store_true", help="Record portfolio decisions without sending transactions")
+    parser.add_argument("--output", default="backfill_results.jsonl", help="Where dry-run decisions are appended")
+    parser.add_argument("--checkpoint", default="backfill_checkpoint.json", help="Resume position file")
+    parser.add_argument("--checkpoint-every", type=int, default=50, help="Save the position every N articles")
+    parser.add_argument("--restart", action="store_true", help="Ignore the saved position and start from the top")
+    parser.add_argument("--concurrency", type=int, default=8, help="Articles analyzed at the same time")
+    parser.add_argument("--limit", type=int, default=None, help="Stop after this many articles")
+    args = parser.parse_args()
+
+    checkpoint = None if args.restart else load_checkpoint(args.checkpoint, args.archive)
+    if checkpoint is None:
+        checkpoint = {"source": args.archive, "position": 0}
+    elif checkpoint["position"]:
+        print(f"Resuming backfill at article {checkpoint['position']}")
+    # Names this backfill's portfolio checkpoints; a resume keeps it, a restart gets a new one
+    checkpoint.setdefault("run", uuid.uuid4().hex[:12])
+
+    matcher = NewsCharityMatcher(SessionLocal)
+    matcher.subscriber_index.refresh()
+    if args.dry_run:
+        create_indexer_tables(SessionLocal)
+    else:
+        matcher.create_tables()
+
+    backfill = Backfill(matcher, args.dry_run, args.output, args.concurrency, checkpoint["run"])
+    articles = itertools.islice(read_archive(args.archive, checkpoint["position"]), args.limit)
+    started = time.monotonic()
+    try:
+        backfill.run(articles, checkpoint, args.checkpoint, args.checkpoint_every)
+    finally:
+        if not args.dry_run:
+            # Send coalesced changes now; payouts that are not due yet stay checkpointed
+            # and are picked up by the live matcher when it next starts
+            matcher.coalescer.flush_all()
+            matcher.payouts.release_due()
+        print(backfill.summary(time.monotonic() - started))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,10 @@
 from news_charity_matcher import NewsCharityMatcher
-from pg_module import get_db
+from pg_module import SessionLocal, install_notify_trigger
+import argparse
+import multiprocessing
+import os
+import signal
+import socket
 
 # List of RSS feeds to monitor
 RSS_FEEDS = [
@@ -11,12 +16,66 @@ RSS_FEEDS = [
     "https://rss.nytimes.com/services/xml/rss/nyt/Health.xml"
 ]
 
+def start_profiler(matcher):
+    # `kill -USR1 <pid>` toggles profiling; PROFILE_ON_START=1 profiles from the start
+    matcher.profiler.install_signal_handler()
+    if os.getenv("PROFILE_ON_START") == "1":
+        matcher.profiler.start()
+
+def forward_profiler_signal(workers):
+    # `kill -USR1 <supervisor pid>` toggles profiling in every worker. Without a handler
+    # the signal's default action would terminate the supervisor.
+    signum = getattr(signal, "SIGUSR1", None)
+    if signum is None:
+        return
+
+    def forward(*_):
+        for worker in workers:
+            if worker.pid is not None and worker.is_alive():
+                os.kill(worker.pid, signum)
+
+    signal.signal(signum, forward)
+
+def run_worker():
+    worker_id = f"{socket.gethostname()}-{os.getpid()}"
+    matcher = NewsCharityMatcher(SessionLocal, worker_id)
+    start_profiler(matcher)
+    print(f"Starting News Charity Matcher worker {worker_id}...")
+    matcher.run_worker(RSS_FEEDS, worker_id)
+
 def main():
+    parser = argparse.ArgumentParser(description="Match news articles to charities and update user portfolios")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=0,
+        help="Run this many workers coordinated through Postgres (0 runs the single-process matcher)",
+    )
+    args = parser.parse_args()
+
+    # Make sure subscription changes are pushed to the matcher's in-memory index
+    try:
+        install_notify_trigger(SessionLocal)
+    except Exception as e:
+        print(f"Could not install subscription change trigger, relying on periodic reloads: {e}")
+
+    if args.workers > 0:
+        # Spawned (not forked) so every worker builds its own connection pool. More
+        # workers can be started on other machines with the same command.
+        context = multiprocessing.get_context("spawn")
+        workers = [context.Process(target=run_worker) for _ in range(args.workers)]
+        forward_profiler_signal(workers)
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        return
+
     # Create matcher without passing API key (it will load from .env)
-    with next(get_db()) as db:
-        matcher = NewsCharityMatcher(db)
-        print("Starting News Charity Matcher...")
-        matcher.run(RSS_FEEDS)
+    matcher = NewsCharityMatcher(SessionLocal)
+    start_profiler(matcher)
+    print("Starting News Charity Matcher...")
+    matcher.run(RSS_FEEDS)
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
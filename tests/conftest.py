@@ -0,0 +1,32 @@
+import os
+import sys
+
+import pytest
+
+# pg_module builds its engines at import time from these; tests that need a database
+# bind their own sessions to a throwaway server instead
+os.environ.setdefault("PG_PORT", "5432")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="session")
+def pg_engine(tmp_path_factory):
+    # A private Postgres for the test run, from the pgserver package (pip install pgserver)
+    pgserver = pytest.importorskip("pgserver")
+    from sqlalchemy import create_engine
+
+    server = pgserver.get_server(str(tmp_path_factory.mktemp("pgdata")), cleanup_mode="stop")
+    engine = create_engine(server.get_uri())
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def sessions(pg_engine):
+    """A sessionmaker on empty tables, dropped again after the test."""
+    from sqlalchemy.orm import sessionmaker
+    from pg_module.models import Base
+
+    Base.metadata.create_all(pg_engine)
+    yield sessionmaker(autocommit=False, autoflush=False, bind=pg_engine)
+    Base.metadata.drop_all(pg_engine)
@@ -0,0 +1,55 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("fastapi")
+from fastapi.testclient import TestClient
+
+import api.main
+from api.concurrency import AdmissionController
+from api.main import app, admission_limit
+
+
+def test_limit_is_the_pool_less_reserved_slots(monkeypatch):
+    monkeypatch.setenv("PG_POOL_SIZE", "3")
+    monkeypatch.setenv("PG_MAX_OVERFLOW", "2")
+    monkeypatch.setenv("API_DB_RESERVED_SLOTS", "1")
+    assert admission_limit() == 4
+
+    monkeypatch.setenv("API_DB_RESERVED_SLOTS", "9")
+    assert admission_limit() == 1
+
+
+class Row:
+    name, mission, url = "Alpha", "Shelter", "https://alpha.example"
+
+
+def test_stream_holds_a_permit_until_it_ends(monkeypatch):
+    controller = AdmissionController(limit=2, max_queue=0, queue_timeout=1)
+    monkeypatch.setattr(api.main, "admission", controller)
+    held = []
+
+    def rows(db, category):
+        held.append(controller._in_system)
+        yield Row()
+
+    monkeypatch.setattr(api.main, "stream_charities_for_category", rows)
+    response = TestClient(app).get("/charities/disaster/stream")
+
+    assert response.status_code == 200
+    assert response.json() == {"name": "Alpha", "mission": "Shelter", "url": "https://alpha.example"}
+    assert held == [1]
+    assert controller._in_system == 0
+    assert controller.stats["admitted"] == 1
+
+
+def test_stream_is_shed_when_the_server_is_full(monkeypatch):
+    controller = AdmissionController(limit=1, max_queue=0, queue_timeout=1)
+    monkeypatch.setattr(api.main, "admission", controller)
+    asyncio.run(controller.acquire())
+
+    response = TestClient(app).get("/users/disaster/stream")
+
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
+    assert controller.stats["rejected"] == 1
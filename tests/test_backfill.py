@@ -0,0 +1,49 @@
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("web3")
+from run_backfill import Backfill
+
+
+class FakeMatcher:
+    """Analyzes every article as relevant and tracks how many portfolio updates overlap."""
+
+    def __init__(self):
+        self.active = 0
+        self.peak = 0
+        self.flushed = []
+        self._lock = threading.Lock()
+        self.subscriber_index = type("Index", (), {"batches": lambda self, category: [["0xa"]]})()
+        self.coalescer = type("Coalescer", (), {"flush_due": lambda _: self.flushed.append(threading.current_thread())})()
+        self.payouts = type("Payouts", (), {"release_due": lambda _: None})()
+        self.token_usage = {"calls": 0, "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0}
+
+    def analyze_article(self, article):
+        return {"category": "disaster", "similar_charities": [], "urgency_score": 5}
+
+    def update_user_portfolios(self, subscribers, category, similar_charities, article, urgency_score, checkpoint_link):
+        assert checkpoint_link == f"backfill/run1/{article['link']}"
+        with self._lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(0.05)
+        with self._lock:
+            self.active -= 1
+        return ["0xa"] if article["link"].endswith("3") else []
+
+
+def test_real_backfill_applies_portfolios_on_the_pool(tmp_path):
+    matcher = FakeMatcher()
+    backfill = Backfill(matcher, dry_run=False, output=str(tmp_path / "out.jsonl"), concurrency=4, run_id="run1")
+    articles = [(i, {"title": str(i), "link": f"https://example.com/{i}"}) for i in range(8)]
+    checkpoint = {"source": "archive.jsonl", "position": 0, "run": "run1"}
+
+    backfill.run(iter(articles), checkpoint, str(tmp_path / "checkpoint.json"), checkpoint_every=100)
+
+    assert matcher.peak > 1
+    assert checkpoint["position"] == 8
+    assert backfill.stats == {"articles": 8, "relevant": 8, "decisions": 0, "errors": 1}
+    # Coalesced commits still happen on the thread that advances the position
+    assert set(matcher.flushed) == {threading.main_thread()}
@@ -0,0 +1,40 @@
+import json
+
+from pg_module import (
+    PortfolioCheckpoint,
+    clear_portfolio_tx,
+    create_checkpoint_tables,
+    save_portfolio_decision,
+    session_scope,
+    update_portfolio_checkpoint,
+)
+
+DECISION = {"addresses": ["0xc1"], "percentages": [100], "send_money": False}
+
+
+def test_first_decision_wins(sessions):
+    create_checkpoint_tables(sessions)
+    with session_scope(sessions) as db:
+        assert save_portfolio_decision(db, "a", "0x1", DECISION)
+    with session_scope(sessions) as db:
+        assert not save_portfolio_decision(db, "a", "0x1", {**DECISION, "send_money": True})
+    with session_scope(sessions) as db:
+        assert json.loads(db.get(PortfolioCheckpoint, ("a", "0x1")).decision) == DECISION
+
+
+def test_clearing_a_transaction_covers_every_coalesced_link(sessions):
+    create_checkpoint_tables(sessions)
+    with session_scope(sessions) as db:
+        for link in ("a", "b", "c"):
+            save_portfolio_decision(db, link, "0x1", DECISION)
+        update_portfolio_checkpoint(db, "a", "0x1", charities_tx="0xdead")
+        update_portfolio_checkpoint(db, "b", "0x1", charities_tx="0xdead", split_tx="0xbeef")
+        update_portfolio_checkpoint(db, "c", "0x1", charities_tx="0xother")
+
+    with session_scope(sessions) as db:
+        clear_portfolio_tx(db, "0x1", "0xdead")
+    with session_scope(sessions) as db:
+        assert db.get(PortfolioCheckpoint, ("a", "0x1")).charities_tx is None
+        assert db.get(PortfolioCheckpoint, ("b", "0x1")).charities_tx is None
+        assert db.get(PortfolioCheckpoint, ("b", "0x1")).split_tx == "0xbeef"
+        assert db.get(PortfolioCheckpoint, ("c", "0x1")).charities_tx == "0xother"
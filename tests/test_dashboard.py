@@ -0,0 +1,60 @@
+import pytest
+
+pytest.importorskip("fastapi")
+from fastapi.testclient import TestClient
+
+import api.main
+from api.main import app, etag_matches
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(api.main, "dashboard_data", lambda userId: {"userId": userId, "count": 3})
+    return TestClient(app)
+
+
+def test_etag_matches_each_listed_tag_exactly():
+    etag = '"abc123"'
+    assert etag_matches('"abc123"', etag)
+    assert etag_matches('"other", W/"abc123"', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches("", etag)
+    assert not etag_matches('"abc1234"', etag)
+    assert not etag_matches('"x"abc123""', etag)
+
+
+def test_dashboard_revalidates_with_if_none_match(client):
+    first = client.get("/dashboard/0xabc")
+    assert first.status_code == 200
+    assert first.json() == {"userId": "0xabc", "count": 3}
+    etag = first.headers["etag"]
+
+    unchanged = client.get("/dashboard/0xabc", headers={"If-None-Match": f'"stale", {etag}'})
+    assert unchanged.status_code == 304
+    assert unchanged.content == b""
+    assert unchanged.headers["etag"] == etag
+
+    # Our tag inside a longer one is a different tag
+    changed = client.get("/dashboard/0xabc", headers={"If-None-Match": etag[:-1] + '0"'})
+    assert changed.status_code == 200
+
+
+def test_dashboard_is_served_before_the_indexer_has_run(sessions, monkeypatch):
+    from api.event_broker import EventBroker
+    from pg_module import IndexerState, UserCategory, UserPortfolio, session_scope
+
+    engine = sessions.kw["bind"]
+    IndexerState.__table__.drop(engine)
+    UserPortfolio.__table__.drop(engine)
+    with session_scope(sessions) as db:
+        db.add(UserCategory(category="disaster", userid="0xa"))
+
+    monkeypatch.setattr(api.main, "SessionLocal", sessions)
+    monkeypatch.setattr(api.main, "broker", EventBroker(engine))
+    # Startup creates the indexer's tables, so the portfolio part is just empty
+    with TestClient(app) as client:
+        response = client.get("/dashboard/0xa")
+
+    assert response.status_code == 200
+    assert response.json()["categories"] == ["disaster"]
+    assert response.json()["portfolio"] == {"topics": [], "charities": [], "balance": "0"}
@@ -0,0 +1,28 @@
+import asyncio
+
+from api.event_broker import EventBroker
+from pg_module import notify_user_event, session_scope
+
+
+def test_listener_stays_out_of_the_pool_and_delivers_events(sessions):
+    engine = sessions.kw["bind"]
+
+    async def receive():
+        broker = EventBroker(engine)
+        queue = broker.subscribe("0xA")
+        broker.start(asyncio.get_running_loop())
+        try:
+            # The listener may not be listening yet, so keep sending until one arrives
+            for _ in range(50):
+                with session_scope(sessions) as db:
+                    notify_user_event(db, "0xA", "Donated", amount="1")
+                try:
+                    return await asyncio.wait_for(queue.get(), timeout=0.2), engine.pool.checkedout()
+                except asyncio.TimeoutError:
+                    continue
+        finally:
+            broker.stop()
+
+    event, checked_out = asyncio.run(receive())
+    assert event == {"type": "Donated", "userid": "0xa", "amount": "1"}
+    assert checked_out == 0
@@ -0,0 +1,34 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip("web3")
+
+from pg_module import IndexerState, session_scope
+from web3_utils import event_indexer
+
+
+def test_freshness_is_measured_in_blocks_behind_head():
+    state = IndexerState(name="donater", last_block=100, updated_at=datetime.utcnow())
+
+    assert event_indexer.is_fresh(state, head=108, max_lag_blocks=8)
+    assert not event_indexer.is_fresh(state, head=109, max_lag_blocks=8)
+    assert not event_indexer.is_fresh(None, head=0, max_lag_blocks=8)
+
+
+def test_backfill_chunks_do_not_refresh_the_heartbeat(sessions, monkeypatch):
+    monkeypatch.setattr(event_indexer, "SessionLocal", sessions)
+    monkeypatch.setattr(event_indexer, "fetch_events", lambda *args: [])
+    long_ago = datetime.utcnow() - timedelta(days=1)
+    with session_scope(sessions) as db:
+        db.add(IndexerState(name=event_indexer.INDEXER_NAME, last_block=0, updated_at=long_ago))
+
+    event_indexer.index_range(1, 2000, {}, caught_up=False)
+    with session_scope(sessions) as db:
+        state = db.get(IndexerState, event_indexer.INDEXER_NAME)
+        assert (state.last_block, state.updated_at) == (2000, long_ago)
+
+    event_indexer.index_range(2001, 2500, {}, caught_up=True)
+    with session_scope(sessions) as db:
+        state = db.get(IndexerState, event_indexer.INDEXER_NAME)
+        assert state.last_block == 2500 and state.updated_at > long_ago
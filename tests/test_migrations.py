@@ -0,0 +1,57 @@
+from sqlalchemy import inspect, text
+
+from pg_module import CharityAddress, migrate_charity_address, session_scope
+
+
+def create_legacy_table(sessions, rows):
+    with sessions.kw["bind"].begin() as connection:
+        connection.execute(text("CREATE TABLE charity_address (id SERIAL PRIMARY KEY, name VARCHAR(255) NOT NULL, address VARCHAR(100) NOT NULL)"))
+        for name, address in rows:
+            connection.execute(text("INSERT INTO charity_address (name, address) VALUES (:n, :a)"), {"n": name, "a": address})
+
+
+def addresses(sessions):
+    with session_scope(sessions) as db:
+        return sorted(db.query(CharityAddress.name, CharityAddress.address).all())
+
+
+def test_renames_legacy_table_when_new_one_is_missing(sessions):
+    CharityAddress.__table__.drop(sessions.kw["bind"])
+    create_legacy_table(sessions, [("Alpha", "0xA"), ("Beta", "0xB")])
+
+    migrate_charity_address(sessions)
+
+    assert "charity_address" not in inspect(sessions.kw["bind"]).get_table_names()
+    assert addresses(sessions) == [("Alpha", "0xA"), ("Beta", "0xB")]
+
+
+def test_merges_into_existing_table_once(sessions):
+    with session_scope(sessions) as db:
+        db.add(CharityAddress(name="Alpha", address="0xa"))
+    create_legacy_table(sessions, [("Alpha", "0xA"), ("Beta", "0xB")])
+
+    migrate_charity_address(sessions)
+    migrate_charity_address(sessions)
+
+    assert addresses(sessions) == [("Alpha", "0xa"), ("Beta", "0xB")]
+    with sessions.kw["bind"].begin() as connection:
+        connection.execute(text("DROP TABLE charity_address"))
+
+
+def test_no_legacy_table_is_a_no_op(sessions):
+    migrate_charity_address(sessions)
+
+    assert addresses(sessions) == []
+
+
+def test_adds_user_category_index_to_existing_table(sessions):
+    from pg_module import create_user_category_index
+
+    engine = sessions.kw["bind"]
+    with engine.begin() as connection:
+        connection.execute(text("DROP INDEX ix_usercategory_userid"))
+
+    create_user_category_index(sessions)
+    create_user_category_index(sessions)
+
+    assert "ix_usercategory_userid" in {index["name"] for index in inspect(engine).get_indexes("usercategory")}
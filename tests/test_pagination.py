@@ -0,0 +1,69 @@
+from pg_module import (
+    Charity,
+    CharityCategory,
+    UserCategory,
+    get_charities_for_category_page,
+    get_users_for_category_page,
+    iter_users_for_category,
+    session_scope,
+)
+
+
+def add_users(sessions, category, userids):
+    with session_scope(sessions) as db:
+        db.add_all(UserCategory(category=category, userid=userid) for userid in userids)
+
+
+def test_user_pages_cover_category_once_in_order(sessions):
+    userids = [f"0x{i:040x}" for i in range(23)]
+    add_users(sessions, "disaster", userids[::-1])
+    add_users(sessions, "health", ["0x" + "f" * 40])
+
+    seen, after = [], None
+    with session_scope(sessions) as db:
+        while True:
+            page = get_users_for_category_page(db, "disaster", after, limit=5)
+            if not page:
+                break
+            seen += [user.userid for user in page]
+            after = page[-1].userid
+
+    assert seen == sorted(userids)
+
+
+def test_user_page_cursor_is_exclusive(sessions):
+    add_users(sessions, "disaster", ["0xa", "0xb", "0xc"])
+    with session_scope(sessions) as db:
+        assert [u.userid for u in get_users_for_category_page(db, "disaster", "0xa", limit=10)] == ["0xb", "0xc"]
+        assert get_users_for_category_page(db, "disaster", "0xc", limit=10) == []
+
+
+def test_iter_users_stops_on_short_page(sessions):
+    userids = [f"0x{i:02x}" for i in range(10)]
+    add_users(sessions, "disaster", userids)
+
+    pages = [[user.userid for user in page] for page in iter_users_for_category(sessions, "disaster", batch_size=4)]
+
+    assert pages == [userids[0:4], userids[4:8], userids[8:10]]
+
+
+def test_iter_users_exact_multiple_ends_with_empty_lookup(sessions):
+    add_users(sessions, "disaster", ["0x1", "0x2", "0x3", "0x4"])
+
+    pages = list(iter_users_for_category(sessions, "disaster", batch_size=2))
+
+    assert [len(page) for page in pages] == [2, 2]
+
+
+def test_charity_pages_only_list_the_category(sessions):
+    with session_scope(sessions) as db:
+        db.add_all(Charity(name=name, mission="m", url="u") for name in ["Alpha", "Beta", "Gamma", "Delta"])
+        db.add_all(CharityCategory(category="disaster", charityname=name) for name in ["Alpha", "Gamma", "Delta"])
+        db.add(CharityCategory(category="health", charityname="Beta"))
+
+    with session_scope(sessions) as db:
+        first = get_charities_for_category_page(db, "disaster", None, limit=2)
+        second = get_charities_for_category_page(db, "disaster", first[-1].name, limit=2)
+
+        assert [c.name for c in first] == ["Alpha", "Delta"]
+        assert [c.name for c in second] == ["Gamma"]
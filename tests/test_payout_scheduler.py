@@ -0,0 +1,86 @@
+import payout_scheduler
+from payout_scheduler import PayoutScheduler
+
+MIN_BALANCE = 10**17
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_scheduler(monkeypatch, balances, splits, lookups, **kwargs):
+    clock = Clock()
+    monkeypatch.setattr(payout_scheduler.time, "time", clock)
+
+    def lookup(user_id):
+        lookups.append(user_id)
+        return balances[user_id], 2
+
+    def split(user_id, keys):
+        splits.append((user_id, keys))
+        return {"gasUsed": 69_000}
+
+    scheduler = PayoutScheduler(split, lookup, MIN_BALANCE, max_wait=3600, recheck_interval=300, balance_ttl=60, **kwargs)
+    return scheduler, clock
+
+
+def test_restored_payout_keeps_its_age(monkeypatch):
+    splits, lookups = [], []
+    scheduler, clock = make_scheduler(monkeypatch, {"0x1": 10**15}, splits, lookups)
+
+    # Requested 50 minutes before a restart: due after ten more minutes, not a full hour
+    scheduler.request("0x1", 2, "a", waited=3000)
+    scheduler.release_due()
+    assert splits == []
+    clock.now += 600
+    scheduler.release_due()
+    assert splits == [("0x1", ["a"])]
+
+
+def test_only_users_due_for_a_check_are_looked_up(monkeypatch):
+    splits, lookups = [], []
+    balances = {f"0x{i}": 10**15 for i in range(50)}
+    scheduler, clock = make_scheduler(monkeypatch, balances, splits, lookups)
+    for user_id in balances:
+        scheduler.request(user_id, 2, "a")
+
+    scheduler.release_due()
+    assert len(lookups) == 50
+    # Nobody is due for another look until the recheck interval has passed
+    for _ in range(10):
+        clock.now += 20
+        scheduler.release_due()
+    assert len(lookups) == 50
+
+    clock.now += 100
+    balances["0x7"] = MIN_BALANCE
+    scheduler.release_due()
+    assert len(lookups) == 100
+    assert splits == [("0x7", ["a"])]
+
+
+def test_urgent_request_is_checked_at_once_with_a_cached_balance(monkeypatch):
+    splits, lookups = [], []
+    scheduler, clock = make_scheduler(monkeypatch, {"0x1": 10**15}, splits, lookups)
+    scheduler.request("0x1", 2, "a")
+    scheduler.release_due()
+
+    clock.now += 10
+    scheduler.request("0x1", 9, "b")
+    scheduler.release_due()
+    assert lookups == ["0x1"]
+    assert splits == [("0x1", ["a", "b"])]
+
+
+def test_payouts_sent_elsewhere_are_forgotten(monkeypatch):
+    splits, lookups = [], []
+    scheduler, clock = make_scheduler(monkeypatch, {"0x1": MIN_BALANCE, "0x2": MIN_BALANCE}, splits, lookups)
+    scheduler.request("0x1", 2, "a")
+    scheduler.request("0x2", 2, "b")
+    scheduler.retain({"0x2"})
+    scheduler.release_due()
+    assert splits == [("0x2", ["b"])]
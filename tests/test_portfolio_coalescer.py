@@ -0,0 +1,105 @@
+import json
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from sqlalchemy import text
+
+from pg_module import (
+    PortfolioCheckpoint,
+    acquire_user_lease,
+    create_checkpoint_tables,
+    session_scope,
+)
+from portfolio_coalescer import PortfolioCoalescer, merge_decisions
+
+T0 = datetime(2026, 1, 1)
+
+
+def decision(address, send_money=False):
+    return json.dumps({"addresses": [address], "percentages": [100], "send_money": send_money})
+
+
+def test_newest_decision_wins_whatever_the_order():
+    queued = [
+        SimpleNamespace(link="b", decided_at=T0 + timedelta(minutes=2), decision=decision("0xb")),
+        SimpleNamespace(link="c", decided_at=T0 + timedelta(minutes=1), decision=decision("0xc")),
+        SimpleNamespace(link="a", decided_at=T0, decision=decision("0xa")),
+    ]
+    latest, fresh, stale = merge_decisions(queued)
+    assert latest.link == "b"
+    assert [c.link for c in fresh] == ["a", "c", "b"]
+    assert stale == []
+
+
+def test_decisions_older_than_the_committed_one_are_stale():
+    queued = [
+        SimpleNamespace(link="a", decided_at=T0, decision=decision("0xa")),
+        SimpleNamespace(link="b", decided_at=T0 + timedelta(minutes=2), decision=decision("0xb")),
+    ]
+    latest, fresh, stale = merge_decisions(queued, committed_decided_at=T0 + timedelta(minutes=1))
+    assert latest.link == "b"
+    assert [c.link for c in stale] == ["a"]
+
+    latest, fresh, stale = merge_decisions(queued, committed_decided_at=T0 + timedelta(minutes=2))
+    assert latest is None
+    assert fresh == []
+
+
+def queue(sessions, link, userid, decided_at, address, send_money=False):
+    with session_scope(sessions) as db:
+        db.add(PortfolioCheckpoint(
+            link=link, userid=userid, status="queued", decision=decision(address, send_money), decided_at=decided_at
+        ))
+
+
+def make_coalescer(sessions, worker_id, commits, finished, window=0):
+    return PortfolioCoalescer(
+        sessions,
+        worker_id,
+        commit=lambda user_id, addresses, percentages, checkpoints: commits.append((user_id, addresses, [c.link for c in checkpoints])),
+        finish=lambda user_id, checkpoints: finished.extend(c.link for c in checkpoints),
+        window=window,
+    )
+
+
+def test_queued_changes_are_committed_once_across_workers(sessions):
+    create_checkpoint_tables(sessions)
+    queue(sessions, "a", "0x1", T0, "0xa")
+    queue(sessions, "b", "0x1", T0 + timedelta(minutes=1), "0xb")
+    commits, finished = [], []
+    first, second = make_coalescer(sessions, "w1", commits, finished), make_coalescer(sessions, "w2", commits, finished)
+
+    with session_scope(sessions) as db:
+        acquire_user_lease(db, "0x1", "w1", 60)
+    # The user is leased to w1, so w2 leaves it alone
+    assert not second.flush("0x1")
+    assert commits == []
+
+    first.flush_due()
+    assert commits == [("0x1", ["0xb"], ["a", "b"])]
+    assert finished == ["a", "b"]
+
+
+def test_older_decision_is_not_committed_after_a_newer_one(sessions):
+    create_checkpoint_tables(sessions)
+    queue(sessions, "new", "0x1", T0 + timedelta(minutes=5), "0xnew")
+    commits, finished = [], []
+    coalescer = make_coalescer(sessions, "w1", commits, finished)
+    coalescer.flush("0x1")
+
+    # A slower worker queues a decision it made before the committed one
+    with session_scope(sessions) as db:
+        db.execute(text("UPDATE portfoliocheckpoint SET status = 'done'"))
+    queue(sessions, "old", "0x1", T0, "0xold")
+    coalescer.flush("0x1")
+
+    assert commits == [("0x1", ["0xnew"], ["new"])]
+    assert finished == ["new", "old"]
+
+
+def test_window_holds_back_recent_changes(sessions):
+    create_checkpoint_tables(sessions)
+    queue(sessions, "a", "0x1", T0, "0xa")
+    commits, finished = [], []
+    make_coalescer(sessions, "w1", commits, finished, window=600).flush_due()
+    assert commits == []
@@ -0,0 +1,38 @@
+import pytest
+
+pytest.importorskip("web3")
+from sqlalchemy import inspect
+
+import news_charity_matcher
+from news_charity_matcher import NewsCharityMatcher
+from pg_module import IndexerState, UserPortfolio
+
+
+def bare_matcher(sessions):
+    # Only what the portfolio stage reads; no OpenAI, Chroma or categories
+    matcher = NewsCharityMatcher.__new__(NewsCharityMatcher)
+    matcher.session_factory = sessions
+    matcher._chain_head = None
+    return matcher
+
+
+def test_matcher_without_indexer_tables_reads_portfolios_from_the_contract(sessions, monkeypatch):
+    engine = sessions.kw["bind"]
+    # The indexer process has never run
+    IndexerState.__table__.drop(engine)
+    UserPortfolio.__table__.drop(engine)
+
+    reads = []
+    monkeypatch.setattr(news_charity_matcher, "get_contract", lambda: "contract")
+    monkeypatch.setattr(news_charity_matcher, "get_user", lambda contract, user_id: reads.append(user_id))
+
+    matcher = bare_matcher(sessions)
+    matcher.create_tables()
+    assert {"indexerstate", "userportfolio"} <= set(inspect(engine).get_table_names())
+
+    article = {"link": "https://example.com/flood", "title": "Flood"}
+    unfinished = matcher.update_user_portfolios([["0xa", "0xb"]], "disaster", [], article, 5)
+
+    # Unknown on chain, so nothing to decide, but nobody failed
+    assert unfinished == []
+    assert reads == ["0xa", "0xb"]
@@ -0,0 +1,28 @@
+import signal
+
+import pytest
+
+import run_matcher
+
+pytestmark = pytest.mark.skipif(not hasattr(signal, "SIGUSR1"), reason="needs SIGUSR1")
+
+
+class FakeWorker:
+    def __init__(self, pid, alive=True):
+        self.pid = pid
+        self.alive = alive
+
+    def is_alive(self):
+        return self.alive
+
+
+def test_supervisor_forwards_sigusr1_to_live_workers(monkeypatch):
+    killed = []
+    monkeypatch.setattr(run_matcher.os, "kill", lambda pid, signum: killed.append((pid, signum)))
+    previous = signal.getsignal(signal.SIGUSR1)
+    try:
+        run_matcher.forward_profiler_signal([FakeWorker(101), FakeWorker(102, alive=False), FakeWorker(None)])
+        signal.getsignal(signal.SIGUSR1)(signal.SIGUSR1, None)
+    finally:
+        signal.signal(signal.SIGUSR1, previous)
+    assert killed == [(101, signal.SIGUSR1)]
@@ -0,0 +1,39 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("web3")
+
+from contract_wrapper_api.main import SenderLocks
+
+
+def test_same_sender_is_serialized_and_lock_is_dropped():
+    locks = SenderLocks()
+    order = []
+
+    async def send(sender, name):
+        async with locks.hold(sender):
+            order.append(f"{name} start")
+            await asyncio.sleep(0.01)
+            order.append(f"{name} end")
+
+    async def main():
+        await asyncio.gather(send("0xa", "first"), send("0xa", "second"), send("0xb", "other"))
+
+    asyncio.run(main())
+
+    assert order.index("first end") < order.index("second start")
+    assert order.index("other start") < order.index("first end")
+    assert len(locks) == 0
+
+
+def test_lock_is_released_when_the_request_fails():
+    locks = SenderLocks()
+
+    async def fail():
+        async with locks.hold("0xa"):
+            raise RuntimeError("nonce too low")
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(fail())
+    assert len(locks) == 0
@@ -0,0 +1,11 @@
+import json
+
+import bench_startup
+
+
+def test_matcher_starts_offline_without_heavy_clients(tmp_path):
+    (tmp_path / "categories_snapshot.json").write_text(json.dumps({"ids": ["1"], "documents": ["Natural disasters"]}))
+
+    result = bench_startup.run_once(str(tmp_path))
+
+    assert result["heavy"] == []
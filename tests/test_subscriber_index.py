@@ -0,0 +1,67 @@
+from pg_module import SubscriberIndex, UserCategory, install_notify_trigger, session_scope
+from pg_module.subscriber_index import SubscriberIds
+import time
+
+
+def refreshed(index, category, expected, deadline=5):
+    # A NOTIFY can reach the listener's socket a moment after the writer's commit returns
+    stop = time.monotonic() + deadline
+    while True:
+        index.refresh()
+        ids = list(index.subscribers(category))
+        if ids == expected or time.monotonic() > stop:
+            return ids
+        time.sleep(0.05)
+
+
+def test_listener_stays_out_of_the_pool_and_applies_changes(sessions):
+    install_notify_trigger(sessions)
+    with session_scope(sessions) as db:
+        db.add(UserCategory(category="disaster", userid="0xa"))
+
+    index = SubscriberIndex(sessions)
+    index.load()
+    assert tuple(index.subscribers("disaster")) == ("0xa",)
+    assert sessions.kw["bind"].pool.checkedout() == 0
+
+    with session_scope(sessions) as db:
+        db.add(UserCategory(category="disaster", userid="0xb"))
+        db.query(UserCategory).filter(UserCategory.userid == "0xa").delete()
+    assert refreshed(index, "disaster", ["0xb"]) == ["0xb"]
+    index._close_listener()
+
+
+def test_subscriber_ids_pack_sorted_ids_and_slice_lazily():
+    ids = SubscriberIds(["0xA", "0xb", "0xc\u00e9", "0xd"])
+    assert len(ids) == 4
+    assert ids[0] == "0xA" and ids[-1] == "0xd"
+    assert ids[1:3] == ("0xb", "0xc\u00e9")
+    assert list(ids) == ["0xA", "0xb", "0xc\u00e9", "0xd"]
+
+    merged = ids.merged(added={"0xB", "0xb", "0xe"}, removed={"0xd"})
+    assert list(merged) == ["0xA", "0xB", "0xb", "0xc\u00e9", "0xe"]
+    # The original is left alone for iterators still reading it
+    assert list(ids) == ["0xA", "0xb", "0xc\u00e9", "0xd"]
+    assert not SubscriberIds()
+
+
+def test_load_packs_each_category_in_python_order(sessions):
+    install_notify_trigger(sessions)
+    userids = ["0xb", "0xA", "0xa", "0xB", "0x10"]
+    with session_scope(sessions) as db:
+        db.add_all([UserCategory(category="disaster", userid=userid) for userid in userids])
+        db.add(UserCategory(category="health", userid="0xa"))
+
+    index = SubscriberIndex(sessions)
+    index.load()
+    assert list(index.subscribers("disaster")) == sorted(userids)
+    assert list(index.batches("disaster", batch_size=2)) == [("0x10", "0xA"), ("0xB", "0xa"), ("0xb",)]
+    assert tuple(index.subscribers("health")) == ("0xa",)
+    assert not index.subscribers("missing")
+
+    with session_scope(sessions) as db:
+        db.add(UserCategory(category="disaster", userid="0xC"))
+        db.query(UserCategory).filter(UserCategory.userid.in_(["0xA", "0xa"])).delete()
+    assert refreshed(index, "disaster", ["0x10", "0xB", "0xC", "0xb"]) == ["0x10", "0xB", "0xC", "0xb"]
+    assert not index.subscribers("health")
+    index._close_listener()
@@ -0,0 +1,53 @@
+import pytest
+
+pytest.importorskip("web3")
+from web3.exceptions import TimeExhausted, TransactionNotFound
+
+from web3_utils import interact_with_contract
+from web3_utils.interact_with_contract import TransactionDropped, TransactionFailed, wait_for_receipt
+
+TX = "0x" + "ab" * 32
+
+
+class FakeEth:
+    def __init__(self, receipt=None, known=True):
+        self.receipt = receipt
+        self.known = known
+
+    def wait_for_transaction_receipt(self, tx_hash, timeout):
+        if self.receipt is None:
+            raise TimeExhausted(tx_hash)
+        return self.receipt
+
+    def get_transaction(self, tx_hash):
+        if not self.known:
+            raise TransactionNotFound(tx_hash)
+        return {"hash": tx_hash}
+
+
+def use_node(monkeypatch, **kwargs):
+    fake = type("FakeWeb3", (), {"eth": FakeEth(**kwargs)})()
+    monkeypatch.setattr(interact_with_contract, "get_w3", lambda: fake)
+
+
+def test_successful_receipt_is_returned(monkeypatch):
+    use_node(monkeypatch, receipt={"status": 1, "gasUsed": 21000})
+    assert wait_for_receipt(TX)["gasUsed"] == 21000
+
+
+def test_reverted_transaction_raises(monkeypatch):
+    use_node(monkeypatch, receipt={"status": 0})
+    with pytest.raises(TransactionFailed):
+        wait_for_receipt(TX)
+
+
+def test_unknown_transaction_was_dropped(monkeypatch):
+    use_node(monkeypatch, known=False)
+    with pytest.raises(TransactionDropped):
+        wait_for_receipt(TX)
+
+
+def test_pending_transaction_times_out(monkeypatch):
+    use_node(monkeypatch, known=True)
+    with pytest.raises(TimeExhausted):
+        wait_for_receipt(TX)
@@ -0,0 +1,151 @@
+from sqlalchemy import text
+
+from pg_module import (
+    SubscriberBatchWork,
+    claim_article,
+    claim_subscriber_batch,
+    complete_article,
+    complete_subscriber_batch,
+    create_work_tables,
+    enqueue_articles,
+    fail_exhausted_work,
+    purge_done_work,
+    release_subscriber_batch,
+    session_scope,
+)
+from pg_module.models import ArticleWork
+from pg_module.work_queue import AGING_PER_MINUTE, MAX_ATTEMPTS, claim_rank
+
+
+def claim(sessions, worker_id, claim_fn=claim_article, lease_seconds=60):
+    with session_scope(sessions) as db:
+        return claim_fn(db, worker_id, lease_seconds)
+
+
+def expire_leases(sessions):
+    with session_scope(sessions) as db:
+        db.execute(text("UPDATE articlework SET lease_expires = now() - interval '1 second'"))
+        db.execute(text("UPDATE subscriberbatchwork SET lease_expires = now() - interval '1 second'"))
+
+
+def test_completing_a_batch_fails_once_the_lease_moved_on(sessions):
+    create_work_tables(sessions)
+    with session_scope(sessions) as db:
+        db.add(SubscriberBatchWork(link="a", analysis="{}", userids=["0x1"], claim_rank=claim_rank(0)))
+
+    first = claim(sessions, "w1", claim_subscriber_batch)
+    expire_leases(sessions)
+    second = claim(sessions, "w2", claim_subscriber_batch)
+
+    with session_scope(sessions) as db:
+        assert not complete_subscriber_batch(db, first.id, "w1")
+    with session_scope(sessions) as db:
+        assert complete_subscriber_batch(db, second.id, "w2")
+    with session_scope(sessions) as db:
+        assert not complete_subscriber_batch(db, second.id, "w2")
+
+
+def test_articles_out_of_attempts_are_marked_failed(sessions):
+    create_work_tables(sessions)
+    with session_scope(sessions) as db:
+        enqueue_articles(db, [{"link": "a"}])
+
+    for attempt in range(MAX_ATTEMPTS):
+        assert claim(sessions, "w1").link == "a"
+        expire_leases(sessions)
+        if attempt < MAX_ATTEMPTS - 1:
+            with session_scope(sessions) as db:
+                assert fail_exhausted_work(db) == 0
+    assert claim(sessions, "w1") is None
+
+    with session_scope(sessions) as db:
+        enqueue_articles(db, [{"link": "b"}])
+    with session_scope(sessions) as db:
+        assert fail_exhausted_work(db) == 1
+        assert db.get(ArticleWork, "a").status == "failed"
+        assert db.get(ArticleWork, "b").status == "pending"
+
+
+def test_held_lease_is_not_failed_early(sessions):
+    create_work_tables(sessions)
+    with session_scope(sessions) as db:
+        enqueue_articles(db, [{"link": "a"}])
+        db.execute(text(f"UPDATE articlework SET attempts = {MAX_ATTEMPTS - 1}"))
+
+    work = claim(sessions, "w1")
+    with session_scope(sessions) as db:
+        assert fail_exhausted_work(db) == 0
+    with session_scope(sessions) as db:
+        assert complete_article(db, work.link, "w1")
+        assert db.get(ArticleWork, "a").status == "done"
+
+
+def test_released_batch_keeps_only_unfinished_users(sessions):
+    create_work_tables(sessions)
+    with session_scope(sessions) as db:
+        db.add(SubscriberBatchWork(link="a", analysis="{}", userids=["0x1", "0x2", "0x3"], claim_rank=claim_rank(0)))
+
+    batch = claim(sessions, "w1", claim_subscriber_batch)
+    with session_scope(sessions) as db:
+        assert not release_subscriber_batch(db, batch.id, "w2", ["0x2"])
+    with session_scope(sessions) as db:
+        assert release_subscriber_batch(db, batch.id, "w1", ["0x2"])
+    # Not claimable again until the retry delay has passed
+    assert claim(sessions, "w2", claim_subscriber_batch) is None
+
+    expire_leases(sessions)
+    retry = claim(sessions, "w2", claim_subscriber_batch)
+    assert retry.userids == ["0x2"]
+    assert retry.attempts == 2
+
+
+def test_claims_follow_priority_with_aging(sessions):
+    create_work_tables(sessions)
+    with session_scope(sessions) as db:
+        enqueue_articles(db, [
+            {"link": "old", "urgency_estimate": 3},
+            {"link": "urgent", "urgency_estimate": 9},
+            {"link": "calm", "urgency_estimate": 3},
+        ])
+        # Waiting two hours is worth 12 points of priority at the default aging rate
+        assert AGING_PER_MINUTE == 0.1
+        db.execute(text("UPDATE articlework SET created_at = created_at - interval '2 hours' WHERE link = 'old'"))
+        db.execute(text("ALTER TABLE articlework ALTER COLUMN claim_rank DROP NOT NULL"))
+        db.execute(text("UPDATE articlework SET claim_rank = NULL WHERE link = 'old'"))
+    # Ranks missing from older tables are backfilled from priority and created_at
+    create_work_tables(sessions)
+
+    assert [claim(sessions, "w1").link for _ in range(3)] == ["old", "urgent", "calm"]
+
+
+def test_claim_order_uses_the_partial_index(sessions):
+    create_work_tables(sessions)
+    with session_scope(sessions) as db:
+        db.execute(text("SET LOCAL enable_seqscan = off"))
+        plan = "\n".join(row[0] for row in db.execute(text(
+            "EXPLAIN SELECT * FROM articlework WHERE status = 'pending' ORDER BY claim_rank DESC LIMIT 1"
+        )))
+    assert "ix_articlework_claim" in plan
+
+
+def test_finished_work_is_purged(sessions):
+    create_work_tables(sessions)
+    with session_scope(sessions) as db:
+        enqueue_articles(db, [{"link": "a"}, {"link": "b"}])
+        db.add(SubscriberBatchWork(link="a", analysis="{}", userids=["0x1"], claim_rank=claim_rank(0)))
+
+    batch = claim(sessions, "w1", claim_subscriber_batch)
+    with session_scope(sessions) as db:
+        assert complete_subscriber_batch(db, batch.id, "w1")
+        assert db.query(SubscriberBatchWork).count() == 0
+
+    for _ in range(2):
+        work = claim(sessions, "w1")
+        with session_scope(sessions) as db:
+            complete_article(db, work.link, "w1")
+    with session_scope(sessions) as db:
+        db.execute(text("UPDATE articlework SET created_at = created_at - interval '8 days' WHERE link = 'a'"))
+    with session_scope(sessions) as db:
+        assert purge_done_work(db) == 1
+        assert db.get(ArticleWork, "a") is None
+        assert db.get(ArticleWork, "b").status == "done"
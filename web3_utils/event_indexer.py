@@ -0,0 +1,150 @@
+from datetime import datetime
+from sqlalchemy.orm import Session
+import os
+import time
+
+from pg_module import SessionLocal, session_scope, UserPortfolio, IndexerState, notify_user_event, create_indexer_tables
+from web3_utils.interact_with_contract import get_w3, get_contract
+
+# Follows the Donater contract's event log and keeps the userportfolio table in sync,
+# so readers get each user's state from Postgres instead of one getUserTopics RPC per user.
+#
+#   python -m web3_utils.event_indexer
+#
+# Staleness is bounded by CONFIRMATIONS blocks plus one POLL_INTERVAL. Readers judge it
+# by comparing indexerstate.last_block with the chain head (see is_fresh).
+
+INDEXER_NAME = "donater"
+EVENTS = ["Enrolled", "CharitiesUpdated", "Donated", "SplitAmongCharities", "Withdrawn"]
+# Events pushed to the user's connected app clients
+PUSHED_EVENTS = ["CharitiesUpdated", "Donated", "SplitAmongCharities"]
+
+START_BLOCK = int(os.getenv("DONATER_DEPLOY_BLOCK", "0"))
+BATCH_SIZE = int(os.getenv("INDEXER_BATCH_SIZE", "2000"))
+CONFIRMATIONS = int(os.getenv("INDEXER_CONFIRMATIONS", "3"))
+POLL_INTERVAL = float(os.getenv("INDEXER_POLL_INTERVAL", "12"))
+
+
+def event_topics() -> dict[bytes, str]:
+    # topic0 -> event name, built from the ABI so a single eth_getLogs call covers every event
+    from web3 import Web3
+
+    topics = {}
+    for entry in get_contract().abi:
+        if entry.get("type") == "event" and entry["name"] in EVENTS:
+            signature = f"{entry['name']}({','.join(arg['type'] for arg in entry['inputs'])})"
+            topics[bytes(Web3.keccak(text=signature))] = entry["name"]
+    return topics
+
+
+def fetch_events(from_block: int, to_block: int, topics: dict[bytes, str]) -> list:
+    contract = get_contract()
+    logs = get_w3().eth.get_logs({
+        "address": contract.address,
+        "fromBlock": from_block,
+        "toBlock": to_block,
+        "topics": [["0x" + topic.hex() for topic in topics]],
+    })
+    events = [getattr(contract.events, topics[bytes(log["topics"][0])])().process_log(log) for log in logs]
+    events.sort(key=lambda event: (event["blockNumber"], event["logIndex"]))
+    return events
+
+
+def apply_event(db: Session, event) -> None:
+    args = event["args"]
+    userid = args["_user"].lower()
+    portfolio = db.get(UserPortfolio, userid)
+    if portfolio is None:
+        portfolio = UserPortfolio(userid=userid, topics=[], charities=[], percentages=[], balance=0, block_number=event["blockNumber"])
+        db.add(portfolio)
+        # The session does not autoflush, and get() only sees flushed rows
+        db.flush()
+
+    name = event["event"]
+    if name == "Enrolled":
+        # enroll() overwrites the whole struct, including the balance
+        portfolio.topics = list(args["_topics"])
+        portfolio.charities = list(args["_charities"])
+        portfolio.percentages = list(args["_charityPercents"])
+        portfolio.balance = 0
+    elif name == "CharitiesUpdated":
+        portfolio.charities = list(args["_charities"])
+        portfolio.percentages = list(args["_charityPercents"])
+    elif name == "Donated":
+        portfolio.balance = int(portfolio.balance) + args["_amount"]
+    elif name in ("SplitAmongCharities", "Withdrawn"):
+        portfolio.balance = 0
+    portfolio.block_number = event["blockNumber"]
+
+    if name in PUSHED_EVENTS:
+        # Delivered when the batch commits, with the balance as of this event
+        notify_user_event(
+            db,
+            userid,
+            name,
+            charities=portfolio.charities,
+            percentages=portfolio.percentages,
+            amount=str(args["_amount"]) if "_amount" in args else None,
+            balance=str(portfolio.balance),
+            block=event["blockNumber"],
+            tx=get_w3().to_hex(event["transactionHash"]),
+        )
+
+
+def index_range(from_block: int, to_block: int, topics: dict[bytes, str], caught_up: bool) -> int:
+    events = fetch_events(from_block, to_block, topics)
+
+    # Events and the checkpoint are committed together, so a crash never double-counts a donation
+    with session_scope(SessionLocal) as db:
+        for event in events:
+            apply_event(db, event)
+        state = db.get(IndexerState, INDEXER_NAME)
+        if state is None:
+            state = IndexerState(name=INDEXER_NAME, updated_at=datetime.utcnow())
+            db.add(state)
+        state.last_block = to_block
+        # updated_at is when the indexer last reached the head, so chunks of a
+        # backfill do not refresh it
+        if caught_up:
+            state.updated_at = datetime.utcnow()
+
+    return len(events)
+
+
+def is_fresh(state: IndexerState, head: int, max_lag_blocks: int) -> bool:
+    """Whether the indexed state is at most max_lag_blocks behind the chain head."""
+    return state is not None and head - state.last_block <= max_lag_blocks
+
+
+def run():
+    create_indexer_tables(SessionLocal)
+    topics = event_topics()
+
+    with session_scope(SessionLocal) as db:
+        state = db.get(IndexerState, INDEXER_NAME)
+        next_block = state.last_block + 1 if state else START_BLOCK
+
+    while True:
+        try:
+            head = get_w3().eth.block_number - CONFIRMATIONS
+            if next_block > head:
+                # Caught up: refresh the heartbeat so readers know the table is current
+                with session_scope(SessionLocal) as db:
+                    state = db.get(IndexerState, INDEXER_NAME)
+                    if state:
+                        state.updated_at = datetime.utcnow()
+                time.sleep(POLL_INTERVAL)
+                continue
+
+            to_block = min(next_block + BATCH_SIZE - 1, head)
+            count = index_range(next_block, to_block, topics, caught_up=to_block == head)
+            print(f"Indexed blocks {next_block}-{to_block}: {count} events")
+            next_block = to_block + 1
+
+        except Exception as e:
+            print(f"Error indexing events: {e}")
+            time.sleep(POLL_INTERVAL)
+
+
+if __name__ == "__main__":
+    run()
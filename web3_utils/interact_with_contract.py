@@ -1,12 +1,14 @@
 from dataclasses import dataclass
-from web3 import Web3
+from functools import lru_cache
+from typing import TYPE_CHECKING
 import json
 import os
-from eth_account import Account
 import dotenv
 import requests
 dotenv.load_dotenv()
-from web3.middleware import SignAndSendRawMiddlewareBuilder
+
+if TYPE_CHECKING:
+    from web3 import Web3
 
 @dataclass
 class User:
@@ -15,39 +17,73 @@ class User:
     percentages: list[int]
     balance: float
 
-if os.getenv('PRIVATE_KEY') is None:
-    print("Please set the PRIVATE_KEY environment variable")
-    exit(1)
+class TransactionFailed(Exception):
+    """The transaction was mined but reverted."""
+
+class TransactionDropped(Exception):
+    """The node no longer knows the transaction, so it will never be mined and must be sent again."""
 
-w3 = Web3(Web3.HTTPProvider(os.getenv('INFURA_URL')))
+# Nothing here touches the network or the environment at import time. The provider,
+# signing account and contract are created on first use by the getters below, which
+# also import web3 and eth_account (most of a matcher's import time otherwise).
 
 CONTRACT_ADDRESS = "0x01786AA502BEeF1862691399C5A526E4Ce16F43d"
 
-ETHERSCAN_API_KEY = os.getenv('ETHERSCAN_API_KEY')
+ABI_PATH = os.getenv('DONATER_ABI_PATH', os.path.join(os.path.dirname(__file__), 'abi.json'))
 
 def fetch_abi_from_etherscan(contract_address, api_key):
     url = f"https://api-sepolia.etherscan.io/api?module=contract&action=getabi&address={contract_address}&apikey={api_key}"
     response = requests.get(url)
     return response.json()['result']
 
+def load_abi() -> list:
+    # The ABI is shipped with the repo; Etherscan is only asked when the local copy is missing
+    try:
+        with open(ABI_PATH, "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        abi_text = fetch_abi_from_etherscan(CONTRACT_ADDRESS, os.getenv('ETHERSCAN_API_KEY'))
+        with open(ABI_PATH, "w") as f:
+            f.write(abi_text)
+        return json.loads(abi_text)
+
+@lru_cache(maxsize=None)
+def get_w3() -> "Web3":
+    from web3 import Web3
+
+    return Web3(Web3.HTTPProvider(os.getenv('INFURA_URL')))
+
+@lru_cache(maxsize=None)
+def get_account():
+    from eth_account import Account
+    from web3.middleware import SignAndSendRawMiddlewareBuilder
+
+    if os.getenv('PRIVATE_KEY') is None:
+        raise ValueError("PRIVATE_KEY not found in environment variables")
+
+    account = Account.from_key(os.getenv('PRIVATE_KEY'))
+
+    # Add middleware to sign transactions with the account's private key
+    get_w3().middleware_onion.inject(SignAndSendRawMiddlewareBuilder.build(account), layer=0)
+    return account
+
+@lru_cache(maxsize=None)
+def get_contract():
+    return get_w3().eth.contract(address=CONTRACT_ADDRESS, abi=load_abi())
+
 def get_balance_of_user(contract, user_address):
     # call the getBalance(address) method in the contract
     balance = contract.functions.getBalance(user_address).call()
     return balance / 10**18
 
-account = Account.from_key(os.getenv('PRIVATE_KEY'))
-
-# Add middleware to sign transactions with the account's private key
-w3.middleware_onion.inject(SignAndSendRawMiddlewareBuilder.build(account), layer=0)
-
 def enroll_user(contract, topics: list[str], charities: list[str], charityPercents: list[int]):
     assert len(topics) == 3, "topics should have 3 elements"
     assert len(charities) == len(charityPercents), "charities and charityPercents should have the same length"
     assert sum(charityPercents) == 100, "charityPercents should sum to 100"
 
     # call .enroll(topics, charities, charityPercents) method in the contract
-    tx_hash = contract.functions.enroll(topics, charities, charityPercents).transact({'from': account.address})
-    receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
+    tx_hash = contract.functions.enroll(topics, charities, charityPercents).transact({'from': get_account().address})
+    receipt = get_w3().eth.wait_for_transaction_receipt(tx_hash)
     return receipt
 
 def get_topics(contract, address) -> list[str]:
@@ -70,39 +106,61 @@ def get_owner(contract) -> str:
 
 def set_topics(contract, address: str, topics: list[str]):
     # Changes the topics of a user
-    tx_hash = contract.functions.setTopics(address, topics).transact({'from': account.address})
-    receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
+    tx_hash = contract.functions.setTopics(address, topics).transact({'from': get_account().address})
+    receipt = get_w3().eth.wait_for_transaction_receipt(tx_hash)
     return receipt
 
-def set_charities(contract, address: str, addresses: list[str], percentages: list[int]):
+def set_charities(contract, address: str, addresses: list[str], percentages: list[int], on_sent=None):
     # Changes the charities of a user
-    tx_hash = contract.functions.setCharities(address, addresses, percentages).transact({'from': account.address})
-    receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
-    return receipt
+    # on_sent(tx_hash) is called before waiting, so callers can checkpoint the hash
+    tx_hash = contract.functions.setCharities(address, addresses, percentages).transact({'from': get_account().address})
+    if on_sent:
+        on_sent(tx_hash.to_0x_hex())
+    return wait_for_receipt(tx_hash)
 
 def donate(contract, amount: int):
     # Donates to the contract
     assert amount > 0, "Amount should be greater than 0"
-    assert amount < w3.eth.get_balance(account.address), "Insufficient balance"
-    tx_hash = contract.functions.donate().transact({'from': account.address, 'value': amount})
+    assert amount < get_w3().eth.get_balance(get_account().address), "Insufficient balance"
+    tx_hash = contract.functions.donate().transact({'from': get_account().address, 'value': amount})
     # Value is in wei
 
-    receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
+    receipt = get_w3().eth.wait_for_transaction_receipt(tx_hash)
     return receipt
 
-def split_among_charities(contract, address: str):
+def split_among_charities(contract, address: str, on_sent=None):
     # Splits the balance among the charities
     # We EXPECT a crash if this is not called by the contract owner
-    contract.functions.splitAmongCharities(address).transact({'from': account.address})
+    tx_hash = contract.functions.splitAmongCharities(address).transact({'from': get_account().address})
+    if on_sent:
+        on_sent(tx_hash.to_0x_hex())
+    return wait_for_receipt(tx_hash)
+
+def wait_for_receipt(tx_hash, timeout: float = 120):
+    # Waits for a transaction, e.g. one recorded before a restart, and checks it succeeded.
+    # Raises TimeExhausted when it is still pending, so the caller can wait again later.
+    from web3.exceptions import TimeExhausted, TransactionNotFound
+
+    w3 = get_w3()
+    if not isinstance(tx_hash, str):
+        tx_hash = tx_hash.to_0x_hex()
+    try:
+        receipt = w3.eth.wait_for_transaction_receipt(tx_hash, timeout=timeout)
+    except TimeExhausted:
+        try:
+            w3.eth.get_transaction(tx_hash)
+        except TransactionNotFound:
+            raise TransactionDropped(f"Transaction {tx_hash} was dropped")
+        raise
+    if receipt["status"] != 1:
+        raise TransactionFailed(f"Transaction {tx_hash} reverted")
+    return receipt
 
 
 
 def withdraw(contract):
     # Withdraws the balance of the contract
-    tx_hash = contract.functions.withdraw().transact({'from': account.address})
-    receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
+    tx_hash = contract.functions.withdraw().transact({'from': get_account().address})
+    receipt = get_w3().eth.wait_for_transaction_receipt(tx_hash)
 
     return receipt
-    
-
-contract = w3.eth.contract(address=CONTRACT_ADDRESS, abi=json.loads(fetch_abi_from_etherscan(CONTRACT_ADDRESS, ETHERSCAN_API_KEY)))
\ No newline at end of file